@@ -1,9 +1,36 @@
-# Starts up ocp_vscode in standalone mode
-import ocp_vscode.__main__
+import os
+
+# Profile the CAD operations of the whole process, see util.profile.
+if os.environ.get("HELLO_WORLD_PROFILE"):
+    from hello_world.util.profile import profile_from_env
+
+    profile_from_env()
 
+
+# Starts up ocp_vscode in standalone mode
 def start_ocp_vscode():
+    # Imported here so that importing the package doesn't load the viewer.
+    import ocp_vscode.__main__
+
     ocp_vscode.__main__.main()
 
 
+# Builds and exports every part in a catalog manifest, without a viewer.
+def export_catalog():
+    from hello_world.catalog import main
+
+    raise SystemExit(main())
+
+
+# Rebuilds parts as their source changes and shows them in ocp_vscode.
+def watch():
+    from hello_world.watch import main
+
+    try:
+        raise SystemExit(main())
+    except KeyboardInterrupt:
+        pass
+
+
 if __name__ == "__main__":
     start_ocp_vscode()
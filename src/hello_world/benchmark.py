@@ -0,0 +1,269 @@
+# Benchmarks for the part generators.
+#
+# Every generator is built at a small, medium and large size, each case in a fresh
+# process so that its peak memory is its own and nothing is shared with earlier cases
+# through in-memory caches such as the hook prototypes. The on-disk BREP cache is
+# turned off for the run. Results are written as JSON and can be compared against a
+# stored baseline, failing when a case got slower or its topology changed.
+#
+# Example:
+#     python -m hello_world.benchmark -o bench.json
+#     python -m hello_world.benchmark -o bench.json --baseline baseline.json
+#     python -m hello_world.benchmark -o baseline.json --only parts_bin --only cable_grid
+import argparse
+import json
+import os
+import platform
+import resource
+import sys
+import time
+import traceback
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timezone
+from importlib import metadata
+from pathlib import Path
+from typing import Any
+
+# Generator name -> size -> keyword arguments. Generators without parameters have a
+# single "default" size.
+CASES: dict[str, dict[str, dict[str, Any]]] = {
+    "skadis_bin": {
+        "small": dict(bin_width=40, bin_height_back=40, bin_height_front=30, bin_depth=40, bin_wall_thickness=2),
+        "medium": dict(bin_width=80, bin_height_back=60, bin_height_front=40, bin_depth=60, bin_wall_thickness=2),
+        "large": dict(bin_width=160, bin_height_back=100, bin_height_front=60, bin_depth=100, bin_wall_thickness=2),
+    },
+    "rounded_bin": {
+        "small": dict(bin_width=60, bin_height=40, end_circle_radius=20),
+        "medium": dict(bin_width=120, bin_height=60, end_circle_radius=30),
+        "large": dict(bin_width=300, bin_height=100, end_circle_radius=40),
+    },
+    "parts_bin": {
+        "small": dict(hook_count=1, base_depth=40),
+        "medium": dict(hook_count=3, base_depth=60),
+        "large": dict(hook_count=6, base_depth=80),
+    },
+    "make_shelf": {
+        "small": dict(width_in_slots=1, depth=40),
+        "medium": dict(width_in_slots=2, depth=60),
+        "large": dict(width_in_slots=4, depth=100),
+    },
+    "shelf_with_holes": {
+        "small": dict(width_in_slots=1, depth=40),
+        "medium": dict(width_in_slots=2, depth=60),
+        "large": dict(width_in_slots=4, depth=100),
+    },
+    "skadis_shelf": {
+        "small": dict(width=80, depth=60, thickness=3),
+        "medium": dict(width=160, depth=100, thickness=3),
+        "large": dict(width=320, depth=150, thickness=3),
+    },
+    "cable_grid": {
+        "small": dict(rows=5, columns=5),
+        "medium": dict(rows=15, columns=15),
+        "large": dict(rows=30, columns=30),
+    },
+    "hexify_disc": {
+        "small": dict(radius=30),
+        "medium": dict(radius=80),
+        "large": dict(radius=200),
+    },
+    "mosquito_coil_holder": {"default": {}},
+    "low_voltage_xformer": {"default": {}},
+}
+
+# A case is reported as slower when its time grows by more than this fraction of the baseline.
+DEFAULT_THRESHOLD = 0.15
+
+
+@dataclass
+class BenchmarkResult:
+    """
+    The measurements for one generator at one size.
+
+    generator (str): The generator name, see generators.GENERATORS.
+    size (str): The size of the case, e.g. "small".
+    params (dict): The keyword arguments the generator was called with.
+    seconds (float): Wall time of the build, the fastest of the repeats.
+    peak_rss_mb (float): Peak resident memory of the process that built the part.
+    faces (int): The number of faces in the result.
+    edges (int): The number of edges in the result.
+    solids (int): The number of solids in the result.
+    error (str | None): The traceback when the build failed.
+    """
+
+    generator: str
+    size: str
+    params: dict[str, Any] = field(default_factory=dict)
+    seconds: float = 0.0
+    peak_rss_mb: float = 0.0
+    faces: int = 0
+    edges: int = 0
+    solids: int = 0
+    error: str | None = None
+
+    @property
+    def name(self) -> str:
+        return f"{self.generator}/{self.size}"
+
+
+def _peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes.
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def run_case(generator: str, size: str, params: dict[str, Any]) -> BenchmarkResult:
+    """
+    Build one case and measure it. This runs in a fresh worker process.
+    """
+    from hello_world.generators import get_generator
+    from hello_world.util.export import as_shape
+
+    result = BenchmarkResult(generator, size, params)
+    try:
+        # Import outside of the timed region, module imports aren't part of a build.
+        function = get_generator(generator)
+        start = time.perf_counter()
+        part = function(**params)
+        result.seconds = time.perf_counter() - start
+        shape = as_shape(part)
+        result.faces = len(shape.faces())
+        result.edges = len(shape.edges())
+        result.solids = len(shape.solids())
+    except Exception:
+        result.error = traceback.format_exc()
+    result.peak_rss_mb = _peak_rss_mb()
+    return result
+
+
+def run_benchmarks(
+    cases: dict[str, dict[str, dict[str, Any]]] = CASES, repeat: int = 1
+) -> list[BenchmarkResult]:
+    """
+    Run each case in its own process, one at a time so that cases don't compete for CPUs.
+
+    :param cases: Generator name -> size -> keyword arguments.
+    :param repeat: The number of times to build each case. The fastest build is kept.
+    :return: One result per case, in the order of cases.
+    """
+    from hello_world.sweep import run_in_pool
+
+    # Workers inherit the environment, so this turns the BREP cache off for every case.
+    previous = os.environ.get("HELLO_WORLD_CACHE")
+    os.environ["HELLO_WORLD_CACHE"] = "0"
+    try:
+        results = []
+        for generator, sizes in cases.items():
+            for size, params in sizes.items():
+                runs = [run_in_pool(run_case, [(generator, size, params)], 1)[0] for _ in range(repeat)]
+                crashed = BenchmarkResult(generator, size, params, error="Worker process crashed")
+                runs = [r if r is not None else crashed for r in runs]
+                ok = [r for r in runs if r.error is None]
+                results.append(min(ok, key=lambda r: r.seconds) if ok else runs[0])
+        return results
+    finally:
+        if previous is None:
+            del os.environ["HELLO_WORLD_CACHE"]
+        else:
+            os.environ["HELLO_WORLD_CACHE"] = previous
+
+
+def _environment() -> dict[str, Any]:
+    versions = {}
+    for dist in ("build123d", "cadquery-ocp", "numpy"):
+        try:
+            versions[dist] = metadata.version(dist)
+        except metadata.PackageNotFoundError:
+            pass
+    return {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "cpus": os.cpu_count(),
+        "libraries": versions,
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+    }
+
+
+def write_results(results: list[BenchmarkResult], path: str | Path):
+    """Write results as JSON, keyed by generator/size."""
+    data = {"environment": _environment(), "results": {r.name: asdict(r) for r in results}}
+    Path(path).write_text(json.dumps(data, indent=2) + "\n")
+
+
+def load_results(path: str | Path) -> dict[str, BenchmarkResult]:
+    """Read results written by write_results."""
+    data = json.loads(Path(path).read_text())
+    return {name: BenchmarkResult(**fields) for name, fields in data["results"].items()}
+
+
+def compare(
+    results: list[BenchmarkResult], baseline: dict[str, BenchmarkResult], threshold: float = DEFAULT_THRESHOLD
+) -> list[str]:
+    """
+    Compare results against a baseline.
+
+    :param results: The new results.
+    :param baseline: The baseline, from load_results.
+    :param threshold: The fraction a case may slow down by before it is reported.
+    :return: A description of each regression. Cases missing from the baseline are ignored.
+    """
+    regressions = []
+    for result in results:
+        before = baseline.get(result.name)
+        if before is None or before.error is not None:
+            continue
+        if result.error is not None:
+            regressions.append(f"{result.name}: failed, it built in the baseline")
+            continue
+        if result.seconds > before.seconds * (1 + threshold):
+            regressions.append(f"{result.name}: {before.seconds:.2f}s -> {result.seconds:.2f}s")
+        if result.params == before.params:
+            counts = [(k, getattr(before, k), getattr(result, k)) for k in ("faces", "edges", "solids")]
+            changed = [f"{k} {a} -> {b}" for k, a, b in counts if a != b]
+            if changed:
+                regressions.append(f"{result.name}: topology changed, {', '.join(changed)}")
+    return regressions
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m hello_world.benchmark", description="Time every part generator at several sizes."
+    )
+    parser.add_argument("-o", "--output", default="benchmark.json", help="where to write the results")
+    parser.add_argument("--baseline", help="results to compare against, fails on regressions")
+    parser.add_argument(
+        "--threshold", type=float, default=DEFAULT_THRESHOLD, help="allowed slowdown as a fraction of the baseline"
+    )
+    parser.add_argument("--only", action="append", choices=sorted(CASES), help="benchmark only these generators")
+    parser.add_argument("--size", action="append", help="benchmark only these sizes, e.g. small")
+    parser.add_argument("-r", "--repeat", type=int, default=1, help="builds per case, the fastest is kept")
+    args = parser.parse_args(argv)
+
+    cases = {
+        generator: {s: p for s, p in sizes.items() if not args.size or s in args.size or s == "default"}
+        for generator, sizes in CASES.items()
+        if not args.only or generator in args.only
+    }
+    results = run_benchmarks(cases, args.repeat)
+    for result in results:
+        if result.error:
+            print(f"FAILED  {result.name}\n{result.error}")
+        else:
+            print(
+                f"{result.name:32} {result.seconds:8.2f}s {result.peak_rss_mb:8.1f}MB "
+                f"{result.solids:5} solids {result.faces:7} faces {result.edges:7} edges"
+            )
+    write_results(results, args.output)
+
+    failed = sum(r.error is not None for r in results)
+    if args.baseline:
+        regressions = compare(results, load_results(args.baseline), args.threshold)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        return 1 if failed or regressions else 0
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,220 @@
+# Headless export of a catalog of parts described by a manifest.
+#
+# The manifest is TOML or JSON. Top level settings apply to every part and can be
+# overridden per part:
+#
+#     output_dir = "out"
+#     formats = ["step", "stl", "3mf"]
+#     linear_deflection = 0.01
+#     angular_deflection = 0.1
+#
+#     [[parts]]
+#     name = "parts_bin_2"
+#     generator = "parts_bin"
+#     params = { hook_count = 2, base_depth = 40 }
+#
+#     [[parts]]
+#     name = "rounded_bin_print"
+#     generator = "rounded_bin"
+#     params = { bin_width = 300, bin_height = 100, end_circle_radius = 40 }
+#     formats = ["stl"]
+#     mesh_holes = true
+#
+# Parts with mesh_holes set cut their perforations into the STL mesh rather than the
+# BREP, which is much faster for print only parts, see util.mesh_perforate.
+#
+# Parts are built and tessellated across a pool of processes. The inputs of every
+# file written are recorded next to the outputs, so a later run only rebuilds files
+# whose generator source, parameters, library versions or export settings changed.
+import argparse
+import hashlib
+import json
+import time
+import tomllib
+import traceback
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any
+
+STATE_FILE = ".catalog-state.json"
+
+
+@dataclass
+class CatalogEntry:
+    """
+    One part of the catalog.
+
+    name (str): The base name of the output files.
+    generator (str): The generator name, see generators.GENERATORS.
+    params (dict): The keyword arguments for the generator.
+    formats (list[str]): The file types to write.
+    linear_deflection (float): Mesh tolerance for STL and 3MF.
+    angular_deflection (float): Mesh angular tolerance for STL and 3MF, in radians.
+    mesh_holes (bool): Cut perforations into the STL mesh instead of the BREP. Other formats are unaffected.
+    """
+
+    name: str
+    generator: str
+    params: dict[str, Any] = field(default_factory=dict)
+    formats: list[str] = field(default_factory=lambda: ["step"])
+    linear_deflection: float = 0.001
+    angular_deflection: float = 0.1
+    mesh_holes: bool = False
+
+
+@dataclass
+class CatalogResult:
+    """
+    What happened to one part of the catalog.
+
+    entry (CatalogEntry): The part.
+    written (list[Path]): The files written.
+    skipped (list[Path]): The files which were already up to date.
+    error (str | None): The traceback when the part failed.
+    seconds (float): Time spent building and exporting the part.
+    """
+
+    entry: CatalogEntry
+    written: list[Path] = field(default_factory=list)
+    skipped: list[Path] = field(default_factory=list)
+    error: str | None = None
+    seconds: float = 0.0
+
+
+def load_manifest(path: str | Path) -> tuple[Path, list[CatalogEntry]]:
+    """
+    Read a catalog manifest.
+
+    :param path: A .toml or .json manifest.
+    :return: The output directory, relative to the manifest, and the parts.
+    """
+    path = Path(path)
+    if path.suffix == ".json":
+        manifest = json.loads(path.read_text())
+    else:
+        manifest = tomllib.loads(path.read_text())
+    defaults = {k: manifest[k] for k in ("formats", "linear_deflection", "angular_deflection", "mesh_holes") if k in manifest}
+    entries = [CatalogEntry(**{**defaults, **part}) for part in manifest.get("parts", [])]
+    names = [e.name for e in entries]
+    duplicates = sorted({n for n in names if names.count(n) > 1})
+    if duplicates:
+        raise ValueError(f"Duplicate part names in {path}: {', '.join(duplicates)}")
+    return path.parent / manifest.get("output_dir", "out"), entries
+
+
+def input_hash(entry: CatalogEntry, file_type: str) -> str:
+    """Hash everything that goes into one output file."""
+    from hello_world.generators import get_generator
+    from hello_world.util.cache import cache_key
+
+    digest = hashlib.sha256(cache_key(get_generator(entry.generator), (), entry.params).encode())
+    if file_type in ("stl", "3mf"):
+        digest.update(f"{entry.linear_deflection}/{entry.angular_deflection}".encode())
+    if file_type == "stl" and entry.mesh_holes:
+        digest.update(b"mesh_holes")
+    return digest.hexdigest()
+
+
+def export_entry(entry: CatalogEntry, paths: list[Path]) -> CatalogResult:
+    """
+    Build a part and write it to each of paths. This runs in the worker process.
+    """
+    from hello_world.generators import get_generator
+    from hello_world.util.export import export
+    from hello_world.util.mesh_perforate import export_stl
+
+    start = time.perf_counter()
+    result = CatalogResult(entry)
+    try:
+        generator = get_generator(entry.generator)
+        part = None
+        for path in paths:
+            if entry.mesh_holes and path.suffix == ".stl":
+                written = export_stl(generator, entry.params, path, entry.linear_deflection, entry.angular_deflection)
+            else:
+                part = generator(**entry.params) if part is None else part
+                written = export(part, path, entry.linear_deflection, entry.angular_deflection)
+            result.written.append(written)
+    except Exception:
+        result.error = traceback.format_exc()
+    result.seconds = time.perf_counter() - start
+    return result
+
+
+def export_catalog(
+    manifest: str | Path, max_workers: int | None = None, force: bool = False
+) -> list[CatalogResult]:
+    """
+    Build and export every part in a manifest.
+
+    :param manifest: The manifest path.
+    :param max_workers: The number of worker processes. Defaults to the number of CPUs.
+    :param force: Rewrite every file, even those which are up to date.
+    :return: One result per part, in manifest order.
+    """
+    from hello_world.sweep import run_in_pool
+
+    output_dir, entries = load_manifest(manifest)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    state_path = output_dir / STATE_FILE
+    state = json.loads(state_path.read_text()) if state_path.exists() else {}
+
+    results = []
+    calls = []
+    hashes = {}
+    for entry in entries:
+        stale = []
+        result = CatalogResult(entry)
+        for file_type in entry.formats:
+            path = output_dir / f"{entry.name}.{file_type}"
+            hashes[path.name] = input_hash(entry, file_type)
+            if not force and path.exists() and state.get(path.name) == hashes[path.name]:
+                result.skipped.append(path)
+            else:
+                stale.append(path)
+        results.append(result)
+        if stale:
+            calls.append((len(results) - 1, (entry, stale)))
+
+    built = run_in_pool(export_entry, [args for _, args in calls], max_workers)
+    for (index, (entry, stale)), outcome in zip(calls, built):
+        if outcome is None:
+            outcome = CatalogResult(entry, error="Worker process crashed")
+        outcome.skipped = results[index].skipped
+        results[index] = outcome
+        for path in outcome.written:
+            state[path.name] = hashes[path.name]
+        # Forget failed outputs, so they are rebuilt next time even if the file exists.
+        for path in stale:
+            if path not in outcome.written:
+                state.pop(path.name, None)
+
+    state_path.write_text(json.dumps(state, indent=2, sort_keys=True))
+    return results
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="hello-world-export", description="Build and export every part in a catalog manifest."
+    )
+    parser.add_argument("manifest", help="a .toml or .json catalog manifest")
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="worker processes, defaults to the CPU count")
+    parser.add_argument("--force", action="store_true", help="rewrite files even when their inputs haven't changed")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    results = export_catalog(args.manifest, args.jobs, args.force)
+    for result in results:
+        if result.error:
+            print(f"FAILED  {result.entry.name}\n{result.error}")
+        elif result.written:
+            print(f"built   {result.entry.name} in {result.seconds:.2f}s: {', '.join(p.name for p in result.written)}")
+        else:
+            print(f"skipped {result.entry.name}")
+    failed = sum(r.error is not None for r in results)
+    print(f"{len(results) - failed}/{len(results)} parts exported in {time.perf_counter() - start:.2f}s")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,4 +1,11 @@
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Iterator
+import numpy as np
 import build123d as bd
+from hello_world.util.cache import brep_cache
+from hello_world.util.quality import is_draft
+
 def vertical_edges(edge_list: bd.List[bd.Edge]) -> bd.List[bd.Edge]:
     filtered = []
     for edge in edge_list:
@@ -22,6 +29,138 @@ def hexagon(side_len: float) -> bd.Polygon:
     # create the hexagon
     return bd.Polygon(points, align=bd.Align.CENTER)
 
+def hex_lattice_face(centers: np.ndarray, side_len: float, inner_side_len: float) -> bd.Face:
+    """
+    Build the union of hexagons with a hole in the middle, laid out on a hexagonal lattice.
+
+    Neighbouring hexagons are expected to share a wall, so that their centers are
+    side_len + inner_side_len apart across their flat sides. This is the layout
+    produced by CableOrganizer.grid_positions.
+
+    Rather than fusing every hexagon, the boundary is worked out from the lattice. Each
+    cell's lattice tile (the hexagon halfway to its neighbours) shares its edges exactly
+    with the neighbouring tiles, so the edges which appear once form the outline of the
+    union of tiles. The hexagons are their tiles grown by half a wall, so pushing every
+    outline edge out by half a wall gives the outline of the grid. The holes are just
+    the inner hexagons, which are left out in draft quality (see util.quality).
+
+    :param centers: An (N, 3) array of hexagon centers.
+    :param side_len: The side length of the hexagons.
+    :param inner_side_len: The side length of the holes.
+    :return: A single face with an inner wire for each hole.
+    """
+    centers = np.asarray(centers, dtype=float)[:, :2]
+    apothem = side_len * bd.sqrt(3) / 2
+    inner_apothem = inner_side_len * bd.sqrt(3) / 2
+    tile_apothem = (apothem + inner_apothem) / 2
+    half_wall = (apothem - inner_apothem) / 2
+
+    # Tile corners, counter clockwise, matching the orientation of hexagon().
+    angles = np.radians(np.arange(6) * 60)
+    corners = np.stack([np.cos(angles), np.sin(angles)], axis=1)
+    tile_corners = centers[:, None, :] + corners * (tile_apothem * 2 / bd.sqrt(3))
+    starts = tile_corners.reshape(-1, 2)
+    ends = np.roll(tile_corners, -1, axis=1).reshape(-1, 2)
+
+    # Edges shared by two tiles run in opposite directions, so count them without direction.
+    start_keys = [tuple(p) for p in np.round(starts, 6).tolist()]
+    end_keys = [tuple(p) for p in np.round(ends, 6).tolist()]
+    counts: dict[tuple, int] = {}
+    for start, end in zip(start_keys, end_keys):
+        key = (min(start, end), max(start, end))
+        counts[key] = counts.get(key, 0) + 1
+    next_edge = {}
+    for i, (start, end) in enumerate(zip(start_keys, end_keys)):
+        if counts[(min(start, end), max(start, end))] == 1:
+            next_edge[start] = i
+
+    # Chain the boundary edges into closed loops.
+    loops = []
+    while next_edge:
+        first, i = next_edge.popitem()
+        loop = [i]
+        while end_keys[i] != first:
+            i = next_edge.pop(end_keys[i])
+            loop.append(i)
+        loops.append(loop)
+
+    outer_wires = []
+    inner_wires = []
+    for loop in loops:
+        edge_starts = starts[loop]
+        directions = ends[loop] - edge_starts
+        # The tiles are on the left of each edge, so push the edges to the right.
+        normals = np.stack([directions[:, 1], -directions[:, 0]], axis=1)
+        normals /= np.linalg.norm(normals, axis=1)[:, None]
+        offset_starts = edge_starts + normals * half_wall
+        # Each corner is where an edge's offset line meets the previous edge's offset line.
+        prev_starts = np.roll(offset_starts, 1, axis=0)
+        prev_directions = np.roll(directions, 1, axis=0)
+        cross = prev_directions[:, 0] * directions[:, 1] - prev_directions[:, 1] * directions[:, 0]
+        delta = offset_starts - prev_starts
+        t = (delta[:, 0] * directions[:, 1] - delta[:, 1] * directions[:, 0]) / cross
+        points = prev_starts + prev_directions * t[:, None]
+        wire = bd.Wire.make_polygon([tuple(p) for p in points.tolist()], close=True)
+        # Shoelace formula, counter clockwise loops are outlines, clockwise loops are gaps in the grid.
+        area = np.sum(points[:, 0] * np.roll(points[:, 1], -1) - np.roll(points[:, 0], -1) * points[:, 1])
+        (outer_wires if area > 0 else inner_wires).append(wire)
+    if len(outer_wires) != 1:
+        raise ValueError("Hexagons must form a single connected grid")
+
+    if is_draft():
+        return bd.Face(outer_wires[0], inner_wires)
+    hole_corners = centers[:, None, :] + corners * inner_side_len
+    for hole in hole_corners.tolist():
+        inner_wires.append(bd.Wire.make_polygon([tuple(p) for p in hole], close=True))
+    return bd.Face(outer_wires[0], inner_wires)
+
+
+def split_evenly(count: int, size: int) -> list[tuple[int, int]]:
+    """
+    Split count hexagons into as few runs of at most size as possible, as evenly as possible.
+
+    A connector bracket spans three hexagons, one before the seam and two after it, so
+    no run may be a single hexagon unless it's the only one.
+
+    :return: The first hexagon and the length of each run.
+    """
+    tiles = -(-count // size)
+    length, longer = divmod(count, tiles)
+    if tiles > 1 and length < 2:
+        raise ValueError(f"Can't split {count} hexagons into tiles of at most {size} without a single hexagon tile")
+    lengths = [length + 1] * longer + [length] * (tiles - longer)
+    firsts = np.cumsum([0] + lengths[:-1]).tolist()
+    return list(zip(firsts, lengths))
+
+
+@dataclass
+class GridTile:
+    """
+    One printable piece of a CableOrganizer grid.
+
+    row (int), column (int): The index of the tile among all tiles.
+    first_row (int), first_column (int): The first hexagon of the full grid in this tile.
+    rows (int), columns (int): The number of hexagons in this tile.
+    location (bd.Location): Where the tile sits in the full grid. The part is built
+        around the origin, so location * part puts it in place.
+    part (bd.Part): The tile itself.
+    brackets (list[bd.Location]): Where to place a connector bracket to join this tile
+        to the next tile along the X and Y axes, local to the tile. Each bracket is
+        shared with the neighbouring tile, so only the seams on the max X and max Y
+        sides are listed.
+    """
+
+    row: int
+    column: int
+    first_row: int
+    first_column: int
+    rows: int
+    columns: int
+    location: bd.Location
+    part: bd.Part
+    brackets: list[bd.Location] = field(default_factory=list)
+
+
 class CableOrganizer: 
     # Instantiate a new CableOrganizer which can produce parts used for under-desk cable managment.
     def __init__(self, side_len: int, grid_thickness: int, grid_surface_gap: int, clearance: float = 0.1):
@@ -41,35 +180,141 @@ class CableOrganizer:
         return outer - inner
     
     def create_row_points(self, row_num: int, count: int) -> bd.List[bd.Vector]:
-        points = []
+        return [tuple(point) for point in self.grid_positions(row_num, 1, count).tolist()]
+
+    def create_grid_points(self, rows, columns) -> bd.List[bd.Vector]:
+        return [tuple(point) for point in self.grid_positions(0, rows, columns).tolist()]
+
+    # Computes the center of every hexagon in the grid in one pass, row by row.
+    # Returns an (rows * columns, 3) array starting at row first_row.
+    def grid_positions(self, first_row: int, rows: int, columns: int) -> np.ndarray:
         # The height of a hexagon is effectively the size
         hex_height = self.side_len * bd.sqrt(3)
-        y = 0
-        if row_num % 2 == 1:
-            y = ((hex_height - self.hex_side_width) / 2)
-        rem = count
+        # Neighbouring hexagons share a wall, so they are closer than the full hexagon height.
+        y_pitch = hex_height - self.hex_side_width
         # Project wall thickness onto the horizontal axis by the cosine of 30 degrees
-        x = row_num * (1.5 * self.side_len - (self.hex_side_width * (bd.sqrt(3)/2)))
-        while rem > 0:
-            rem -= 1
-            points.append((x, y, 0))
-            y += hex_height - self.hex_side_width
-        return points
-
-    def create_grid_points(self, rows, columns) -> bd.List[bd.Vector]:
-        points = []
-        for row in range(rows):
-            points.extend(self.create_row_points(row, columns))
+        x_pitch = 1.5 * self.side_len - (self.hex_side_width * (bd.sqrt(3) / 2))
+        row, column = np.meshgrid(np.arange(first_row, first_row + rows), np.arange(columns), indexing="ij")
+        row = row.ravel()
+        points = np.zeros((len(row), 3))
+        points[:, 0] = row * x_pitch
+        # Odd rows are shifted up by half a hexagon so the rows interlock.
+        points[:, 1] = column.ravel() * y_pitch + (row % 2) * (y_pitch / 2)
         return points
 
+    @brep_cache
     def create_grid(self, rows: int, columns: int)-> bd.Part:
-        hexagons = []
-        hexmount = self.hex_mount()
-        for point in self.create_grid_points(rows, columns):
-            hexagons.append(hexmount.translate(point))
-        face = bd.Face(None) + hexagons 
+        # The grid is regular, so build the merged face directly rather than fusing every hex_mount.
+        face = hex_lattice_face(self.grid_positions(0, rows, columns), self.side_len, self.inner_side_len)
         return bd.extrude(face, amount=self.grid_thickness, dir=(0, 0, 1))
 
+    # Finds the most rows and columns of hexagons which fit on a print bed of bed_size (x, y).
+    def tile_size(self, bed_size: tuple[float, float]) -> tuple[int, int]:
+        hex_height = self.side_len * bd.sqrt(3)
+        y_pitch = hex_height - self.hex_side_width
+        x_pitch = 1.5 * self.side_len - (self.hex_side_width * (bd.sqrt(3) / 2))
+        rows = int((bed_size[0] - 2 * self.side_len) // x_pitch) + 1
+        # With more than one row the odd rows stick out by half a hexagon.
+        stagger = y_pitch / 2 if rows > 1 else 0
+        columns = int((bed_size[1] - hex_height - stagger) // y_pitch) + 1
+        if rows < 1 or columns < 1:
+            raise ValueError("Print bed is too small to fit a single hexagon")
+        return rows, columns
+
+    # Splits a rows x columns grid into tiles which fit on the print bed, see split_evenly,
+    # and builds them one at a time. Only one tile is held at a time, so memory use doesn't grow with the
+    # size of the full grid as long as the caller drops each tile before asking for the next.
+    def create_tiles(
+        self, rows: int, columns: int, bed_size: tuple[float, float], bracket_spacing: int = 4
+    ) -> Iterator[GridTile]:
+        tile_rows, tile_columns = self.tile_size(bed_size)
+        # Even out the tiles rather than leaving a sliver at the end, there must be room
+        # for a connector bracket on the far side of every seam.
+        row_runs = split_evenly(rows, tile_rows)
+        column_runs = split_evenly(columns, tile_columns)
+        for tile_row, (first_row, tile_rows_here) in enumerate(row_runs):
+            for tile_column, (first_column, tile_columns_here) in enumerate(column_runs):
+                positions = self.grid_positions(first_row, tile_rows_here, columns)
+                positions = positions.reshape(tile_rows_here, columns, 3)
+                positions = positions[:, first_column : first_column + tile_columns_here].reshape(-1, 3)
+                origin = positions[0].copy()
+                face = hex_lattice_face(positions - origin, self.side_len, self.inner_side_len)
+                part = bd.extrude(face, amount=self.grid_thickness, dir=(0, 0, 1))
+                brackets = self.seam_brackets(
+                    rows, columns, first_row, first_column, tile_rows_here, tile_columns_here, bracket_spacing
+                )
+                tile = GridTile(
+                    row=tile_row,
+                    column=tile_column,
+                    first_row=first_row,
+                    first_column=first_column,
+                    rows=tile_rows_here,
+                    columns=tile_columns_here,
+                    location=bd.Location(tuple(origin.tolist())),
+                    part=part,
+                    brackets=[bd.Pos(*(-origin).tolist()) * loc for loc in brackets],
+                )
+                del face, part
+                yield tile
+                # Let go of the tile before building the next one.
+                del tile
+
+    # Finds where connector brackets join a tile to its neighbours on the max X and max Y
+    # sides, in full grid coordinates. A bracket's first mount sits in this tile and the
+    # other two in the neighbour. Across rows the bracket is turned to follow the diagonal
+    # of the lattice, which has the same spacing as the hexagons in a row.
+    def seam_brackets(
+        self,
+        rows: int,
+        columns: int,
+        first_row: int,
+        first_column: int,
+        tile_rows: int,
+        tile_columns: int,
+        bracket_spacing: int = 4,
+    ) -> list[bd.Location]:
+        positions = self.grid_positions(0, rows, columns).reshape(rows, columns, 3)
+        brackets = []
+        last_row = first_row + tile_rows - 1
+        last_column = first_column + tile_columns - 1
+        # Seam with the next tile along Y, the bracket runs along the row.
+        if last_column + 2 < columns:
+            for row in range(first_row, last_row + 1, bracket_spacing):
+                brackets.append(bd.Location(tuple(positions[row, last_column].tolist())))
+        # Seam with the next tile along X, the bracket steps diagonally into the next rows.
+        if last_row + 2 < rows:
+            for column in range(first_column, last_column + 1, bracket_spacing):
+                # Each step to the next row adds a column on either even or odd rows, so two
+                # steps always end up one column over.
+                if column + 1 >= columns:
+                    continue
+                brackets.append(bd.Location(tuple(positions[last_row, column].tolist()), (0, 0, -60)))
+        return brackets
+
+    # Builds every tile of a rows x columns grid and writes each one to directory as it's
+    # built, as STL or STEP. Returns the paths written.
+    def export_tiles(
+        self,
+        rows: int,
+        columns: int,
+        bed_size: tuple[float, float],
+        directory: str | Path,
+        file_type: str = "stl",
+        bracket_spacing: int = 4,
+    ) -> list[Path]:
+        exporters = {"stl": bd.export_stl, "step": bd.export_step}
+        if file_type not in exporters:
+            raise ValueError(f"Unsupported file type {file_type}, expected one of {sorted(exporters)}")
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        paths = []
+        for tile in self.create_tiles(rows, columns, bed_size, bracket_spacing):
+            path = directory / f"grid_tile_{tile.row}_{tile.column}.{file_type}"
+            exporters[file_type](tile.part, str(path))
+            paths.append(path)
+            del tile
+        return paths
+
     # Grid mounts are used to secure the hexagon grid to a surface. Each mount takes up 
     # a single hexagon and has a hole in the center for a screw. The mount goes through
     # the hexagon and extends outwards by half of the side length of the hexagon to allow
@@ -90,6 +335,7 @@ class CableOrganizer:
         mount -= bd.Hole(screw_radius * 2.5, depth=2)
         return mount
 
+    @brep_cache
     def create_connector_bracket(self, screw_radius: int) -> bd.Part:
         # Connector bracket consists of 3 mouns.
         left = self.create_grid_mount(screw_radius)
@@ -1,4 +1,5 @@
 import build123d as bd
+from hello_world.util.text import emboss
 
 # Create a dog bowl with a bunch of random walls in the middle
 # to act as a limiter for how fast Ham can chow down
@@ -17,22 +18,28 @@ def bowl_profile() -> bd.Curve:
     centerline = bd.Line(base_od @ 1, base_id @ 1)
     return bd.Plane.XY * bd.Curve([base_od, wall_od, base_id, wall_id, top_lip, centerline])
 
-lines = bowl_profile()
-face = bd.make_face(lines)
-fillet_vtx = face.vertices().sort_by(bd.Axis.X)[0: -2]
-face = bd.fillet(fillet_vtx, 4)
+def dog_bowl(text: str = "Chow Down") -> bd.Part:
+    """
+    The bowl, with text standing up from its floor to slow down eating.
 
+    :param text: The lettering around the floor, such as the dog's name.
+    """
+    lines = bowl_profile()
+    face = bd.make_face(lines)
+    fillet_vtx = face.vertices().sort_by(bd.Axis.X)[0: -2]
+    face = bd.fillet(fillet_vtx, 4)
 
-# Shift the whole face over so that the centerline is at the origin
-face = bd.Pos(X=-bowl_radius) * face
-# revolve around the x axis
-bowl = bd.Pos(Z=0) * bd.Rot(X = 90) * bd.revolve(face, axis=bd.Axis.Y, revolution_arc=360)
 
-# Place a circle in the middle to act as a guide for the Text
-text_circle: bd.Circle = bd.Plane.XY * bd.Pos(Z=bowl_thickness) * bd.Circle(radius=bowl_radius * 0.6)
-text_sk = bd.Text("Chow Down", font_size=65, path=text_circle.wire())
-text_ext = bd.extrude(text_sk, amount=bowl_height * 0.25)
+    # Shift the whole face over so that the centerline is at the origin
+    face = bd.Pos(X=-bowl_radius) * face
+    # revolve around the x axis
+    bowl = bd.Pos(Z=0) * bd.Rot(X = 90) * bd.revolve(face, axis=bd.Axis.Y, revolution_arc=360)
 
-# Round off the top of each letter
-bowl += text_ext 
+    # Place a circle in the middle to act as a guide for the Text
+    text_circle: bd.Circle = bd.Plane.XY * bd.Pos(Z=bowl_thickness) * bd.Circle(radius=bowl_radius * 0.6)
+    # Letters come from the glyph cache, so a batch of bowls outlines each letter once
+    text_ext = emboss(text, 65, text_circle.wire(), bowl_height * 0.25)
 
+    # Round off the top of each letter
+    bowl += text_ext 
+    return bowl
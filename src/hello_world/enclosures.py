@@ -1,5 +1,8 @@
 import build123d as bd
+from hello_world.util.cache import brep_cache
+from hello_world.util.fillet import fillet
 
+@brep_cache
 def low_voltage_xformer():
     """
     Enclosure for my outdoor low voltage transformer.
@@ -13,7 +16,7 @@ def low_voltage_xformer():
     box = bd.Box(width, height, depth)
     box_topf = box.faces().sort_by(bd.Axis.Z)[-1]
     box = bd.offset(box, amount=-wall_thickness, openings=box_topf)
-    box = box.fillet(wall_thickness, box.edges().filter_by(bd.Axis.Z))
+    box = fillet(box, wall_thickness, box.edges().filter_by(bd.Axis.Z))
 
     lid_plane = bd.Plane(box_topf).offset(wall_thickness)
     lid_sk = bd.Sketch(lid_plane * bd.Rectangle(width, height))
@@ -22,7 +25,7 @@ def low_voltage_xformer():
     lid_lip_sk = bd.Sketch(lid_plane.offset(-wall_thickness) * bd.Rectangle(width - tolerance - 2 * wall_thickness, height - tolerance - 2 * wall_thickness))
     lid_lip = bd.extrude(lid_lip_sk, wall_thickness, dir=(0, 0, -1))
     lid += lid_lip
-    lid = lid.fillet(wall_thickness, lid.edges().filter_by(bd.Axis.Z))
+    lid = fillet(lid, wall_thickness, lid.edges().filter_by(bd.Axis.Z))
     # Add a notch to the lid for easy opening on the side faces.
     notch_face = lid.faces().sort_by(bd.Axis.X).first
     notch_plane = bd.Plane(notch_face)
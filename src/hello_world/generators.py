@@ -0,0 +1,75 @@
+# Registry of the part generators in this package, by name.
+#
+# Generators are referenced as "module:attribute" and only imported when asked for,
+# so tools such as the sweep engine can list and look up parts without loading every
+# module. Parts built by a class are wrapped in a function taking the constructor and
+# method arguments together.
+import importlib
+from typing import Callable
+
+GENERATORS: dict[str, str] = {
+    "skadis_bin": "hello_world.pegboard:skadis_bin",
+    "rounded_bin": "hello_world.pegboard:rounded_bin",
+    "parts_bin": "hello_world.pegboard:parts_bin",
+    "make_shelf": "hello_world.pegboard:make_shelf",
+    "shelf_with_holes": "hello_world.pegboard:shelf_with_holes",
+    "skadis_shelf": "hello_world.generators:skadis_shelf",
+    "cable_grid": "hello_world.generators:cable_grid",
+    "cable_grid_mount": "hello_world.generators:cable_grid_mount",
+    "cable_connector_bracket": "hello_world.generators:cable_connector_bracket",
+    "low_voltage_xformer": "hello_world.enclosures:low_voltage_xformer",
+    "hexify_disc": "hello_world.generators:hexify_disc",
+    "mosquito_coil_holder": "hello_world.snippets:mosquito_coil_holder",
+    "dog_bowl": "hello_world.dogbowl:dog_bowl",
+}
+
+
+def get_generator(name: str) -> Callable:
+    """
+    Look up a generator by name, importing its module.
+
+    :param name: A key of GENERATORS, or a "module:attribute" reference.
+    :return: The generator.
+    """
+    reference = GENERATORS.get(name, name)
+    if ":" not in reference:
+        raise KeyError(f"Unknown generator {name}, expected one of {sorted(GENERATORS)}")
+    module, attribute = reference.split(":", 1)
+    return getattr(importlib.import_module(module), attribute)
+
+
+def skadis_shelf(width: int, depth: float, thickness: float):
+    from hello_world.skadis_shelf import SkadisShelf
+
+    return SkadisShelf(width, depth, thickness).build()
+
+
+def cable_grid(
+    rows: int, columns: int, side_len: int = 10, grid_thickness: int = 3, grid_surface_gap: int = 5, clearance: float = 0.1
+):
+    from hello_world.desk_cable import CableOrganizer
+
+    return CableOrganizer(side_len, grid_thickness, grid_surface_gap, clearance).create_grid(rows, columns)
+
+
+def cable_grid_mount(
+    screw_radius: float, side_len: int = 10, grid_thickness: int = 3, grid_surface_gap: int = 5, clearance: float = 0.1
+):
+    from hello_world.desk_cable import CableOrganizer
+
+    return CableOrganizer(side_len, grid_thickness, grid_surface_gap, clearance).create_grid_mount(screw_radius)
+
+
+def cable_connector_bracket(
+    screw_radius: float, side_len: int = 10, grid_thickness: int = 3, grid_surface_gap: int = 5, clearance: float = 0.1
+):
+    from hello_world.desk_cable import CableOrganizer
+
+    return CableOrganizer(side_len, grid_thickness, grid_surface_gap, clearance).create_connector_bracket(screw_radius)
+
+
+def hexify_disc(radius: float, cell_size: float = 10.0, cell_width: float = 1.0, gap: float = 2.0):
+    import build123d as bd
+    from hello_world.snippets import hexify
+
+    return hexify(bd.Circle(radius).face(), cell_size, cell_width, gap)
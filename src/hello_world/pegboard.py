@@ -1,9 +1,20 @@
 from math import floor
 from typing import cast
+import numpy as np
 import build123d as bd
 import hello_world.util.skadis_hook as skadis
+from hello_world.util.boolean import BatchedCut, batched_cut
+from hello_world.util.cache import brep_cache
+from hello_world.util.clip import clip_cells, clip_locations
+from hello_world.util.fillet import FilletPlan, fillet
+from hello_world.util.instance import located
+from hello_world.util.mesh_perforate import Perforation, defer
+from hello_world.util.pattern import LocationArray
+from hello_world.util.quality import is_draft
+from hello_world.util.topology import topology
 
 
+@brep_cache
 def skadis_bin(
     bin_width: int, bin_height_back: int, bin_height_front: int, bin_depth: int, bin_wall_thickness: int
 ) -> bd.Shape:
@@ -36,9 +47,8 @@ def skadis_bin(
     # Make some hooks
     hook_face = bin.faces().sort_by(bd.Axis.Y).last
     hook_plane = bd.Plane(hook_face)
-    hook = skadis.Hook()
-    hook_locs = cast(skadis.HookLocations, hook_plane * skadis.HookLocations(2, 2, spacing=40))
-    hooks = bd.Compound([loc * hook for loc in hook_locs])
+    hook_locs = skadis.HookLocations.array(2, 2, spacing=40).moved(hook_plane)
+    hooks = skadis.hook_instances(hook_locs)
     bin = bd.Compound.make_compound((bin, hooks))
     return bin
 
@@ -55,53 +65,130 @@ def grid_for_face(face: bd.Face, shape: bd.Sketch, gap: float) -> bd.Sketch:
     Returns:
         bd.Sketch: A sketch containing the grid of shapes covering the face.
     """
-    if not face.is_planar:
-        raise ValueError("Face must be planar")
-
     # Get the face's local plane
     face_plane = bd.Plane(face)
 
-    # Measure the face's dimensions in its local coordinate system
-    face_bb = face.bounding_box()
-    face_local_min: bd.Vector = cast(bd.Vector, face_plane.to_local_coords(face_bb.min))
-    face_local_max: bd.Vector = cast(bd.Vector, face_plane.to_local_coords(face_bb.max))
-    face_width = face_local_max.X - face_local_min.X
-    face_height = face_local_max.Y - face_local_min.Y
+    # Drop the cells which miss the face entirely before doing any geometry work.
+    inside, straddling = clip_locations(face, face_plane, shape, grid_locations_for_face(face, shape, gap))
 
-    # Measure the shape's dimensions in its local coordinate system
-    shape_bb = shape.bounding_box()
-    shape_width = shape_bb.max.X - shape_bb.min.X
-    shape_height = shape_bb.max.Y - shape_bb.min.Y
-    shape_width += 2 * gap
-    shape_height += 2 * gap
+    # Apply the grid to the shape in local coordinates
+    shapes = [loc * shape for loc in inside]
 
+    # Combine the shapes into a single sketch
+    result = bd.Sketch(shapes)
+
+    # Transform the result back to the global coordinate system, and add the
+    # cells crossing the edge of the face clipped to it.
+    return bd.Sketch([face_plane * result] + clip_cells(face, face_plane, shape, straddling))
+
+
+def _cell_size(shape: bd.Sketch, gap: float) -> tuple[float, float]:
+    """The width and height of each grid cell, the shape's bounding box plus the gap on each side."""
+    shape_bb = shape.bounding_box()
+    shape_width = shape_bb.max.X - shape_bb.min.X + 2 * gap
+    shape_height = shape_bb.max.Y - shape_bb.min.Y + 2 * gap
     # Ensure the shape has non-zero dimensions
     if shape_width <= 0 or shape_height <= 0:
         raise ValueError("Shape must have non-zero width and height")
+    return shape_width, shape_height
+
+
+def grid_locations_for_face(face: bd.Face, shape: bd.Sketch, gap: float) -> LocationArray:
+    """
+    Create the grid locations used by grid_for_face, in the face's local coordinate system.
+
+    The grid matches a centered bd.GridLocations, but is kept as an array of positions
+    so that cells can be clipped to the face before any bd.Location is created.
+
+    Args:
+        face (bd.Face): The face to cover.
+        shape (bd.Sketch): The shape to use in the grid.
+        gap (float): The min gap between shapes in the grid.
+
+    Returns:
+        LocationArray: The location of each shape in the grid, local to bd.Plane(face).
+    """
+    if not face.is_planar:
+        raise ValueError("Face must be planar")
+
+    # Get the face's local plane
+    face_plane = bd.Plane(face)
+
+    # Measure the face's dimensions in its local coordinate system. Transform the face
+    # rather than its global bounding box, which is too small on rotated faces.
+    face_bb = cast(bd.Face, face_plane.to_local_coords(face)).bounding_box()
+    face_width = face_bb.max.X - face_bb.min.X
+    face_height = face_bb.max.Y - face_bb.min.Y
+
+    shape_width, shape_height = _cell_size(shape, gap)
     # Calculate the number of rows and columns needed
     cols = abs(int(floor(face_width // shape_width)) + 1)
     rows = abs(int(floor(face_height // shape_height)) + 1)
 
-    # Create the grid in the face's local coordinate system
-    grid = bd.GridLocations(
-        x_spacing=shape_width,
-        y_spacing=shape_height,
-        x_count=cols,
-        y_count=rows,
-        align=(bd.Align.CENTER, bd.Align.CENTER),
-    )
+    # Create the grid in the face's local coordinate system, centered on its origin
+    col, row = np.meshgrid(np.arange(cols), np.arange(rows), indexing="ij")
+    positions = np.zeros((cols * rows, 3))
+    positions[:, 0] = (col.ravel() - (cols - 1) / 2) * shape_width
+    positions[:, 1] = (row.ravel() - (rows - 1) / 2) * shape_height
+    return LocationArray(positions)
 
-    # Apply the grid to the shape in local coordinates
-    shapes = [loc * shape for loc in grid]
 
-    # Combine the shapes into a single sketch
-    result = bd.Sketch(shapes)
+def perforate(
+    part: bd.Shape,
+    face: bd.Face,
+    shape: bd.Sketch,
+    gap: float,
+    amount: float,
+    dir: bd.VectorLike,
+    fuzzy_value: float = 0.0,
+) -> BatchedCut:
+    """
+    Cut the grid from grid_for_face through a part.
+
+    The shape is extruded once and placed at every grid cell inside the face as a
+    located instance. Cells crossing the edge of the face are clipped to it, and cells
+    outside of it are skipped. All of the holes are then removed with a single batched cut.
 
-    # Transform the result back to the global coordinate system
-    return cast(bd.Sketch, face_plane * result)
+    Within util.mesh_perforate.deferred_perforations the holes aren't cut, the part is
+    returned whole and the holes are cut in its mesh when it is exported. In draft
+    quality (see util.quality) the part is returned whole and no holes are made.
 
+    Args:
+        part (bd.Shape): The part to perforate.
+        face (bd.Face): The face to cover with holes.
+        shape (bd.Sketch): The hole shape.
+        gap (float): The min gap between holes.
+        amount (float): How far to extrude each hole from the face.
+        dir (bd.VectorLike): The direction to extrude each hole in.
+        fuzzy_value (float): Optional fuzzy tolerance for the boolean. Defaults to 0, disabled.
 
-def rounded_bin(bin_width: float, bin_height: float, end_circle_radius: float, bin_thickness: float = 2, face_pattern: bd.Sketch = bd.RegularPolygon(radius=6, side_count=6)) -> bd.Solid:
+    Returns:
+        BatchedCut: The perforated part along with the hole count and time spent cutting.
+    """
+    if is_draft():
+        return BatchedCut(part, 0, 0.0)
+    face_plane = bd.Plane(face)
+    grid = grid_locations_for_face(face, shape, gap)
+    inside, straddling = clip_locations(face, face_plane, shape, grid)
+    perforation = Perforation(
+        plane=face_plane,
+        shape=shape,
+        pitch=_cell_size(shape, gap),
+        centers=inside.positions[:, :2],
+        hole=bd.extrude(face_plane * shape, amount, dir=dir),
+        clipped=[bd.extrude(cell, amount, dir=dir) for cell in clip_cells(face, face_plane, shape, straddling)],
+        depth=amount,
+        direction=bd.Vector(dir),
+    )
+    if defer(perforation):
+        return BatchedCut(part, len(perforation.centers) + len(perforation.clipped), 0.0)
+    return batched_cut(part, perforation.holes(), fuzzy_value)
+
+
+@brep_cache
+def rounded_bin(bin_width: float, bin_height: float, end_circle_radius: float, bin_thickness: float = 2, face_pattern: bd.Sketch | None = None) -> bd.Solid:
+    if face_pattern is None:
+        face_pattern = bd.RegularPolygon(radius=6, side_count=6)
     circle_radius = end_circle_radius 
     gap = 2  # gap between patterns
 
@@ -118,22 +205,19 @@ def rounded_bin(bin_width: float, bin_height: float, end_circle_radius: float, b
     bin_f: bd.Face = bin.faces().sort_by(bd.Axis.Y).first
     # Shrink the face by 2mm to ensure the pattern does not overlap the edges
     shrunk_f = bd.offset(bin_f, -8).face()
-    # Generate a face for cutting
-    cut_face = grid_for_face(shrunk_f, face_pattern, gap)
-    cut_ex = bd.extrude(cut_face, bin_thickness + 0.01, dir=(0, 1, 0), mode=bd.Mode.ADD)
-    cut_ex = cut_ex.translate((0, -0.01, 0))
-    bin -= cut_ex
+    shrunk_f = bd.Pos(Y=-0.01) * shrunk_f
+    bin = perforate(bin, shrunk_f, face_pattern, gap, bin_thickness + 0.01, dir=(0, 1, 0)).shape
 
     # Next we will put some hooks on the back.
-    hook = skadis.Hook()
-    hook = hook.rotate(bd.Axis.Z, 270)
+    hook = located(skadis.hook_prototype(), bd.Rot(Z=270))
     hook_plane = bd.Plane(bin.faces().sort_by(bd.Axis.Y).last)
-    hook_locs = cast(skadis.HookLocations, hook_plane * skadis.HookLocations(3, 1))
-    hooks = bd.Compound([loc * hook for loc in hook_locs])
+    hook_locs = skadis.HookLocations.array(3, 1).moved(hook_plane)
+    hooks = skadis.hook_instances(hook_locs, hook)
     bin += hooks
     return bin
 
 
+@brep_cache
 def parts_bin(hook_count: int, base_depth: float, base_height: float = 20, thickness=2, vtx_shift: float = 0):
     """
     Create a small parts bin which can be placed side-by-side with other bins.
@@ -164,15 +248,12 @@ def parts_bin(hook_count: int, base_depth: float, base_height: float = 20, thick
     base_ex = bd.extrude(base_sketch, bin_width)
     inner_base = bd.offset(base_ex, thickness * -1)
     inner_base += bd.extrude(inner_base.faces().sort_by(bd.Axis.X).last, 2 * thickness)
-    inner_base = bd.fillet(inner_base.edges(), thickness)
+    inner_base = fillet(inner_base, thickness, inner_base.edges())
     base = base_ex - inner_base
 
-    hooks = bd.Part(None)
-    hook_pattern = skadis.HookLocations(hook_count, 1)
-    hook = skadis.Hook()
-    hook = bd.Rot(Z=270) * hook
-    for loc in hook_pattern:
-        hooks += loc * hook
+    hook_pattern = skadis.HookLocations.array(hook_count, 1)
+    hook = located(skadis.hook_prototype(), bd.Rot(Z=270))
+    hooks = skadis.hook_instances(hook_pattern, hook)
 
     back_face = base.faces().sort_by(bd.Axis.Y).last
     back_face_len = back_face.edges().sort_by(bd.SortBy.LENGTH).first.length
@@ -180,11 +261,12 @@ def parts_bin(hook_count: int, base_depth: float, base_height: float = 20, thick
     # and hook width is 3, we know the hooks start at 5, so we need to shift up
     # by 2. The formula is thus (back_face_len / 2) - (hook width / 2)
     hook_shift = (back_face_len / 2) - (skadis.Hook.width() / 2)
-    hooks = bd.Plane(back_face) * bd.Rot(Z=90) * bd.Pos(Y=-hook_shift) * hooks
+    hooks = located(hooks, bd.Plane(back_face) * bd.Rot(Z=90) * bd.Pos(Y=-hook_shift))
     bin = bd.Compound([base, hooks])
     return bin
 
 
+@brep_cache
 def make_shelf(width_in_slots: int, depth: float, thickness: float = 2) -> bd.Part:
     bracket_x = 20  # height
     bracket_y = depth
@@ -198,13 +280,17 @@ def make_shelf(width_in_slots: int, depth: float, thickness: float = 2) -> bd.Pa
     bracket_profile_inner = bd.offset(bracket_profile, amount=-thickness)
     bracket_profile -= bracket_profile_inner
     start_bracket = bd.extrude(bracket_profile, amount=bracket_z)
-    start_bracket = bd.fillet(start_bracket.edges().filter_by(lambda e: e.is_interior), 1)
-    start_bracket = bd.fillet(start_bracket.edges().sort_by(bd.Axis.Y).last, 1)
+    bracket_fillets = FilletPlan().add(1, start_bracket.edges().filter_by(lambda e: e.is_interior))
+    # The edge centers measured for this sort are reused when the plan finds its edges in start_bracket.
+    bracket_fillets.add(1, topology(start_bracket).sort_by("edge", bd.Axis.Y).last)
+    start_bracket = bracket_fillets.apply(start_bracket)
     bracket_hook_face = start_bracket.faces().sort_by(bd.Axis.Y).first
     # calculate the shift for the hook so that it's flush with the top of the shelf.
     # The hook is centered, so we need to shift it by half the width of the hook
     hook_shift = bracket_x / 2 - (skadis.Hook.width() / 2)
-    start_bracket += bd.Plane(bracket_hook_face) * bd.Pos(X=-hook_shift) * bd.Rot(Z=180) * skadis.Hook()
+    start_bracket += located(
+        skadis.hook_prototype(), bd.Plane(bracket_hook_face) * bd.Pos(X=-hook_shift) * bd.Rot(Z=180)
+    )
     end_bracket = start_bracket.moved(bd.Location((0, 0, width_between_brackets)))
 
     shelf_start = start_bracket.faces().sort_by(bd.Axis.Z).last
@@ -212,17 +298,19 @@ def make_shelf(width_in_slots: int, depth: float, thickness: float = 2) -> bd.Pa
     split_plane = bd.Plane(shelf.faces().filter_by(lambda f: f.is_planar_face).sort_by(bd.Axis.X)[1])
     shelf = shelf.split(split_plane, keep=bd.Keep.BOTTOM)
     shelf = bd.Compound([start_bracket, end_bracket, shelf])
-    bottom_edges = shelf.edges().sort_by(lambda e: e.length).sort_by(bd.Axis.X)[-4:]
-    shelf = shelf.fillet(2, bottom_edges)
+    # Sorting by length and then by X orders by X with ties broken by length. As with
+    # the bracket, the plan reuses the edge centers measured here.
+    bottom_edges = topology(shelf).sort_by("edge", bd.Axis.X, bd.SortBy.LENGTH)[-4:]
+    # Only the solids these edges belong to are rebuilt.
+    shelf = FilletPlan().add(2, bottom_edges).apply(shelf)
     return shelf
 
 
+@brep_cache
 def shelf_with_holes(width_in_slots: int, depth: float, thickness: float = 2) -> bd.Part:
     shelf = make_shelf(width_in_slots, depth, thickness)
     shelf_face = shelf.faces().sort_by(lambda f: f.area).last
     shelf_face = bd.offset(shelf_face, -2).face()
-    shelf_hole_grid = grid_for_face(shelf_face, bd.Rectangle(4, 4), 0.2)
-    shelf_hole_grid = bd.extrude(shelf_hole_grid, 4, dir=(1, 0, 0))
-    shelf -= shelf_hole_grid
+    shelf = perforate(shelf, shelf_face, bd.Rectangle(4, 4), 0.2, 4, dir=(1, 0, 0)).shape
     return shelf
 
@@ -1,7 +1,11 @@
 
+from dataclasses import dataclass
 from math import floor
+import numpy as np
 import build123d as bd 
 import hello_world.util.skadis_hook as skadis
+from hello_world.util.cache import brep_cache
+from hello_world.util.quality import is_draft
 
 
 # Distance between mounting circles.
@@ -10,6 +14,39 @@ tolerance = 0.1 * bd.MM
 
 items = []
 
+
+@dataclass
+class ShelfLayout:
+    """
+    Where the parts of a shelf go, worked out from its dimensions alone.
+
+    Points are in the coordinates of the left bracket as it is built, before the
+    brackets are mirrored and centered.
+
+    hook_origins (np.ndarray): (N, 2) positions of the hooks on the hook plate, before it is stood up.
+    plate_size (tuple[float, float]): The width and height of the hook plate.
+    top (bd.Vector): The top corner of the bracket, on the front face of the hook plate.
+    bottom (bd.Vector): The bottom corner of the bracket, on the front face of the hook plate.
+    point (bd.Vector): The front corner of the bracket.
+    pegs (list[bd.Vector]): The centers of the pegs on top of the bracket, back to front.
+    bracket_offset (float): How far the right bracket is moved along X from the mirrored left one.
+    """
+
+    hook_origins: np.ndarray
+    plate_size: tuple[float, float]
+    top: bd.Vector
+    bottom: bd.Vector
+    point: bd.Vector
+    pegs: list[bd.Vector]
+    bracket_offset: float
+
+    @property
+    def peg_distance(self) -> float:
+        """The X distance between the pegs of the left and right brackets."""
+        # The right bracket is the left one mirrored across X, then moved along X.
+        return self.pegs[0].X - (self.bracket_offset - self.pegs[0].X)
+
+
 class SkadisShelf():
 
     def __init__(self, width: int, depth: float, thickness: float):
@@ -30,41 +67,45 @@ class SkadisShelf():
         self.peg_diameter = 2 * bd.MM
 
 
+    @brep_cache
     def build(self):
-        brackets = self.__make_brackets()
-        peg_dist = self.bracket_peg_distance(brackets)
-        shelf = self.__make_shelf(peg_dist)
+        layout = self.layout()
+        brackets, center = self.__make_brackets(layout)
+        shelf = self.__make_shelf(layout.peg_distance)
         # Bring up the shelf to the top of the brackets.
-        shelf = shelf.move(bd.Location((0, 0, 0))) 
-        bracket_top_f = brackets.faces().sort_by(bd.Axis.Z, reverse=True).filter_by(lambda f: f.edges().__len__() > 3)[0: 2]
-        shelf = shelf.move(bd.Location((0, -42, bracket_top_f[0].center().Z)))
+        shelf = shelf.move(bd.Location((0, -42, layout.top.Z - center.Z)))
 
         return [shelf, brackets]
 
-    def bracket_peg_distance(self, brackets):
-        top_4_faces = brackets.faces().sort_by(bd.Axis.Z, reverse=True)[0:4]
-        pegs = top_4_faces.sort_by(bd.Axis.Y)[0:2]
-        left_peg = pegs[0]
-        right_peg = pegs[1]
-        return left_peg.center().X - right_peg.center().X
-
-    def __make_hook_plate(self):
-        locs = skadis.HookLocations(2, 2)
-        locs = list(locs)[0:3]
-        part = bd.Part(None)
-        for log in locs:
-            part += skadis.Hook().move(log)
+    def layout(self) -> ShelfLayout:
+        """
+        Work out where the hooks, bracket corners and pegs go without building anything.
+        """
+        # The plate carries the first three hooks of a 2x2 grid, turned a quarter turn.
+        hooks = skadis.hook_positions(2, 2, (bd.Align.CENTER, bd.Align.CENTER))[0:3, :2]
+        hook_origins = np.stack([-hooks[:, 1], hooks[:, 0]], axis=1)
+        # The plate fits the hook footprints, with a 2mm border all round.
+        extent = np.ptp(hook_origins, axis=0) + skadis.Hook.width()
+        plate_size = (float(extent[0]) + 4, float(extent[1]) + 4)
+        # The plate is stood up with its front face at Y = -thickness, facing away from the hooks.
+        top = bd.Vector(-plate_size[0] / 2, -self.thickness, plate_size[1] / 2)
+        bottom = bd.Vector(-plate_size[0] / 2, -self.thickness, -plate_size[1] / 2)
+        # Make the bracket len half the depth of the bin
+        len = max(self.depth * 0.8, 50)
+        point = top + bd.Vector(0, -len, 0)
+        # The pegs sit along the middle of the bracket's top, 20mm apart starting 20mm from the plate.
+        peg1 = bd.Vector(top.X + self.thickness / 2, top.Y - 20, top.Z)
+        peg2 = peg1 + bd.Vector(0, -20, 0)
+        return ShelfLayout(hook_origins, plate_size, top, bottom, point, [peg1, peg2], self.width - 40)
+
+    def __make_hook_plate(self, layout: ShelfLayout):
+        locs = skadis.HookLocations.array(2, 2)[0:3]
+        part = skadis.hook_instances(locs)
         part = bd.Rot(Z=90) * part
         part = part.clean()
-        vtx = part.vertices().filter_by(lambda v: v.Z <= 0.001)
 
-        x_min = vtx.sort_by(bd.Axis.X).first
-        x_max = vtx.sort_by(bd.Axis.X).last
-        y_min = vtx.sort_by(bd.Axis.Y).first
-        y_max = vtx.sort_by(bd.Axis.Y).last
-
-        ## Make a rectangle to fit the vertices.
-        rect = bd.Plane.XY * bd.Rectangle(x_max.X - x_min.X, y_max.Y - y_min.Y)
+        ## Make a rectangle to fit the hooks.
+        rect = bd.Plane.XY * bd.Rectangle(layout.plate_size[0] - 4, layout.plate_size[1] - 4)
         inner_rect = bd.offset(rect, -6)
         inner_rect = bd.fillet(inner_rect.vertices(), self.fillet_radius)
         part = bd.Plane.XY * bd.Pos(Y=10) * part
@@ -75,15 +116,11 @@ class SkadisShelf():
         part = bd.Rot(X=90, Y=180) * part
         return part
 
-    def __make_bracket(self):
-        # Make the bracket len half the depth of the bin
-        len = max(self.depth * 0.8, 50)
-        plate = self.__make_hook_plate()
-        plate_f = plate.faces().sort_by(bd.Axis.Y).first
-        vtxs = plate_f.vertices().sort_by(bd.Axis.X)[0:2]
-        top_vtx = vtxs.sort_by(bd.Axis.Z).last
-        bottom_vtx = vtxs.sort_by(bd.Axis.Z).first
-        point_vtx = top_vtx + bd.Vector(0, -len, 0)
+    def __make_bracket(self, layout: ShelfLayout):
+        plate = self.__make_hook_plate(layout)
+        top_vtx = layout.top
+        bottom_vtx = layout.bottom
+        point_vtx = layout.point
         # create a sketch plane normal to the face plane, between the two top and 
         # bottom vertices of the hook plate.
         e1 = bd.Edge.make_line(top_vtx, bottom_vtx)
@@ -102,9 +139,7 @@ class SkadisShelf():
         if bracket_top_f.edges().sort_by(lambda e: e.length).last.length < 50 * bd.MM:
             raise Exception("Bracket is too short to place pegs. Must be at least 50mm")
 
-        bracket_top_back_edge = bracket_top_f.edges().sort_by(bd.Axis.Y).last.center()
-        peg1_loc = bracket_top_back_edge + bd.Vector(0, -20, 0)
-        peg2_loc = peg1_loc + bd.Vector(0, -20, 0)
+        peg1_loc, peg2_loc = layout.pegs
         peg1 = bd.Pos(peg1_loc) * bd.Circle(self.peg_diameter / 2)
         peg2 = bd.Pos(peg2_loc) * bd.Circle(self.peg_diameter / 2)
         peg1 = bd.extrude(peg1, self.thickness, dir=(0, 0, 1))
@@ -112,18 +147,21 @@ class SkadisShelf():
         bracket += peg1 + peg2 + plate
         return bracket
 
-    # Makes left and right brackets, mirrored.
-    def __make_brackets(self): 
-        left_bracket = self.__make_bracket()
+    # Makes left and right brackets, mirrored. Returns them centered on the origin, along with the offset removed.
+    def __make_brackets(self, layout: ShelfLayout): 
+        left_bracket = self.__make_bracket(layout)
         left_bracket.label = "left_bracket"
         right_bracket = bd.mirror(left_bracket)
         right_bracket.label = "right_bracket"
         right_bracket = right_bracket.rotate(bd.Axis.Z, 180)
-        right_bracket = right_bracket.move(bd.Location((self.width - 40, 0, 0)))
-        center = (left_bracket + right_bracket).center()
+        right_bracket = right_bracket.move(bd.Location((layout.bracket_offset, 0, 0)))
+        # The right bracket mirrors the left across X, so together they're centered halfway
+        # between them along X, and level with the left bracket along Y and Z.
+        left_center = left_bracket.center()
+        center = bd.Vector(layout.bracket_offset / 2, left_center.Y, left_center.Z)
         brackets = bd.Compound([left_bracket, right_bracket])
         brackets = brackets.move(bd.Location(-center))
-        return brackets
+        return brackets, center
 
     def __make_shelf(self, peg_dist: int):
         border = 6 
@@ -140,7 +178,9 @@ class SkadisShelf():
         grid = bd.GridLocations(10, 10, x_count, y_count)
         for loc in grid.local_locations:
             coll.append(rect.moved(loc))
-        shelf_inner_prof -= coll
+        # Drafts leave the holes out.
+        if not is_draft():
+            shelf_inner_prof -= coll
         shelf_prof += shelf_inner_prof
 
         # Add peg holes in the proper locations.
@@ -1,14 +1,12 @@
-import random
-from build123d.build_common import GridLocations
-from build123d.operations_generic import offset
-from ocp_vscode import set_port, show, show_all
 import build123d as bd
-import bd_warehouse.thread as threads
 from math import ceil, cos, pi, sin
 import numpy as np
-import scipy.spatial as sp
+from hello_world.util.clip import clip_cells, clip_locations
+from hello_world.util.fillet import FilletPlan, fillet
+from hello_world.util.instance import located
+from hello_world.util.quality import is_draft
+from hello_world.util.surface import face_frames, frame_locations
 
-set_port(3939)
 tolerance = 0.1 * bd.MM
 
 
@@ -47,10 +45,12 @@ def hexify(
             face = context.sketch_local.face()
         else:
             raise ValueError("No face provided")
+    if is_draft():
+        # The result is the holes to cut, a draft leaves them all out.
+        return bd.Sketch()
     face_bb: bd.BoundBox = face.bounding_box()
     face_size = face_bb.diagonal / 2
-    hex_plate = bd.Plane(face) * bd.Rectangle(face_size * 2, face_size * 2)
-    print("face_size", face_size)
+    face_plane = bd.Plane(face)
     # Translate to the face coordinate system
     hex_locations = bd.HexLocations(
         cell_size + gap,
@@ -58,20 +58,20 @@ def hexify(
         ceil(face_size / cell_size),
         major_radius=True,
     )
-    hex_locations = bd.Plane(hex_plate.face()) * hex_locations
     poly = bd.RegularPolygon(cell_size, 6)
-    hex_wires = hex_locations * poly
-    hex_outline = hex_plate - hex_wires
-    # Invert the hex plate to get the holes
-    hex_plate = hex_plate - hex_outline
-    hex_plate = hex_plate.intersect(face)
-    return hex_plate
+    # Skip the hexes outside of the face, and only intersect the ones crossing its edge.
+    inside, straddling = clip_locations(face, face_plane, poly, hex_locations)
+    hexes = [face_plane * loc * poly for loc in inside]
+    hexes += clip_cells(face, face_plane, poly, straddling)
+    return bd.Sketch(hexes)
 
 
 def rod():
+    from hello_world.util.thread import iso_minor_radius, iso_thread
+
     ## Testing out threads.
-    thread = threads.IsoThread(major_diameter=5, pitch=2, length=15, align=bd.Align.CENTER)
-    bolt_body = bd.Cylinder(thread.min_radius, 20)
+    thread = located(iso_thread(major_diameter=5, pitch=2, length=15), bd.Pos(Z=-15 / 2))
+    bolt_body = bd.Cylinder(iso_minor_radius(5, 2), 20)
     # Create a nut
     # nut_hole = bd.Cylinder(5 * 2, 5)
 
@@ -90,7 +90,7 @@ def rod():
     sketch -= bd.Circle(thread[0] / 2)
     sketch = bd.Plane(topf) * sketch
     nut_blank += bd.extrude(sketch, amount=stepheight)
-    id_thread = threads.IsoThread(
+    id_thread = iso_thread(
         major_diameter=thread[0] * 1.05,
         pitch=thread[1],
         length=thickness + stepheight,
@@ -100,12 +100,13 @@ def rod():
     nut = bd.Compound([nut_blank, id_thread])
 
     # Rod time
-    rod_thread = threads.IsoThread(
-        major_diameter=thread[0], pitch=thread[1], length=size * 0.6, end_finishes=("square", "square"), external=True
+    rod_length = size * 0.6
+    rod_thread = iso_thread(
+        major_diameter=thread[0], pitch=thread[1], length=rod_length, end_finishes=("square", "square"), external=True
     )
     sketch = bd.Sketch()
-    sketch += bd.Circle(rod_thread.min_radius)
-    rod_blank = bd.extrude(sketch, amount=rod_thread.length)
+    sketch += bd.Circle(iso_minor_radius(thread[0], thread[1]))
+    rod_blank = bd.extrude(sketch, amount=rod_length)
     topf = rod_blank.faces().sort_by(bd.Axis.Z)[-1]
     sketch = bd.Sketch()
     sketch += bd.Circle(size / 2)
@@ -115,6 +116,8 @@ def rod():
 
 
 def ex():
+    from ocp_vscode import show_all
+
     ball_diameter = 25
     ball_radius = ball_diameter / 2
     truncation_amount = 5
@@ -193,10 +196,10 @@ def mosquito_coil_holder():
     inner_f = body.faces().filter_by(lambda f: f.is_planar_face).sort_by(bd.Axis.Z)[1]
     center_guide = bd.Plane(inner_f) * bd.Circle(center_guide / 2)
     body += bd.extrude(center_guide, amount=center_guide_height, dir=(0, 0, 1))
-    top_edges = body.edges().sort_by(bd.Axis.Z, reverse=True)[1:6]
-    body = body.fillet(2, top_edges)
-    bottom_edges = body.edges().sort_by(bd.Axis.Z)[0:1]
-    body = body.fillet(2, bottom_edges)
+    # The body is filleted once, after the feet are added.
+    body_fillets = FilletPlan()
+    body_fillets.add(2, body.edges().sort_by(bd.Axis.Z, reverse=True)[1:6])
+    body_fillets.add(2, body.edges().sort_by(bd.Axis.Z)[0:1])
 
     # Lets make the lid.
     lid =  bd.Cylinder(outer_diameter / 2, wall_thickness)
@@ -217,7 +220,7 @@ def mosquito_coil_holder():
     fillet_edges = []
     fillet_edges.append(lid.edges().sort_by(bd.Axis.Z).last)
     fillet_edges.append(lid.edges().sort_by(bd.Axis.Z).first)
-    lid = lid.fillet(2, fillet_edges)
+    lid = fillet(lid, 2, fillet_edges)
 
     # Add some feet to the bottom of the body.
 
@@ -234,30 +237,31 @@ def mosquito_coil_holder():
     sk = bottom_plane * sk
     feet = bd.extrude(sk, amount=wall_thickness / 2, dir=(0, 0, -1)) 
     body += feet
-    feet_edges = body.edges().sort_by(bd.Axis.Z)[0:3]
-    body = body.fillet(1.5, feet_edges)
+    body_fillets.add(1.5, body.edges().sort_by(bd.Axis.Z)[0:3])
+    body = body_fillets.apply(body)
 
     outer_face = body.faces().filter_by(lambda f: not f.is_planar_face).sort_by(lambda f: f.area).last
 
 
     cnt = 40 
     z = 10 
-    circles = []
-    for zz in range(z):
-        if zz == 0:
-            continue
-        for i in range(cnt):
-            position = outer_face.position_at(i / cnt, zz / z)
-            normal = outer_face.normal_at(i / cnt, zz/z)
-            loc = bd.Location(bd.Plane(position, z_dir=normal))
-            circles.append(loc * bd.Sphere(2))
+    # Evaluate every bump position on the face at once, row by row, and place the same sphere at each.
+    u, v = np.meshgrid(np.arange(cnt) / cnt, np.arange(1, z) / z)
+    positions, normals = face_frames(outer_face, u, v)
+    sphere = bd.Solid.make_sphere(2)
+    circles = [located(sphere, loc) for loc in frame_locations(positions, normals)]
     lid.label = "lid"
     body.label = "body"
 
     return [lid, body, circles]
 
-res = mosquito_coil_holder()
 
-#bd.export_step(lid, "mosquito_coil_holder_lid.step")
-#bd.export_step(body, "mosquito_coil_holder_body.step")
-show(res)
+if __name__ == "__main__":
+    from ocp_vscode import set_port, show
+
+    set_port(3939)
+    res = mosquito_coil_holder()
+
+    #bd.export_step(lid, "mosquito_coil_holder_lid.step")
+    #bd.export_step(body, "mosquito_coil_holder_body.step")
+    show(res)
@@ -0,0 +1,274 @@
+# Builds every combination of a generator's parameters across a pool of processes.
+#
+# Each worker is its own process, so each runs its own OCCT kernel and builds never
+# contend on the GIL. A variant which raises is reported as failed, and a variant
+# which takes its worker down with it can't take the rest of the sweep with it.
+#
+# Variants can also come back meshed rather than as BREP: each worker tessellates its
+# result and leaves the mesh in shared memory for the parent to map without copying,
+# see util.shared_mesh.
+#
+# Example:
+#     python -m hello_world.sweep parts_bin -p hook_count=1,2,3,4,5,6 -p base_depth=40,60,80 \
+#         -p vtx_shift=0,5 -o out --format stl
+import argparse
+import ast
+import itertools
+import multiprocessing
+import os
+import re
+import time
+import traceback
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Iterable
+
+
+@dataclass
+class SweepResult:
+    """
+    The outcome of building one variant.
+
+    generator (str): The generator name.
+    params (dict): The keyword arguments the generator was called with.
+    ok (bool): Whether the build succeeded.
+    error (str | None): The traceback, or a description of the crash, when it didn't.
+    data (Any): The result encoded with util.cache.encode, when neither files nor a mesh were requested.
+    mesh (MeshHandle | None): The result's mesh in shared memory, when a mesh level was requested.
+    paths (list[Path]): The files exported by the worker.
+    seconds (float): Time spent building and exporting in the worker.
+    """
+
+    generator: str
+    params: dict
+    ok: bool
+    error: str | None = None
+    data: Any = None
+    mesh: Any = None
+    paths: list[Path] = field(default_factory=list)
+    seconds: float = 0.0
+
+    def result(self) -> Any:
+        """Decode the shapes returned by the worker."""
+        from hello_world.util.cache import decode
+
+        if not self.ok:
+            raise RuntimeError(f"{self.generator}({self.params}) failed:\n{self.error}")
+        return decode(self.data)
+
+    def shared_mesh(self) -> "SharedMesh":
+        """Map the mesh sent back by the worker. This can only be done once per result."""
+        from hello_world.util.shared_mesh import SharedMesh
+
+        if not self.ok:
+            raise RuntimeError(f"{self.generator}({self.params}) failed:\n{self.error}")
+        return SharedMesh(self.mesh)
+
+
+def parameter_grid(params: dict[str, Iterable[Any]]) -> list[dict[str, Any]]:
+    """
+    Expand a parameter grid into every combination of its values.
+
+    :param params: The values to try for each parameter.
+    :return: One dict of keyword arguments per combination.
+    """
+    names = list(params)
+    return [dict(zip(names, values)) for values in itertools.product(*(list(params[n]) for n in names))]
+
+
+def variant_name(generator: str, params: dict[str, Any]) -> str:
+    """A file name for a variant, e.g. parts_bin-hook_count=2-base_depth=40."""
+    parts = [generator] + [f"{k}={v}" for k, v in params.items()]
+    return re.sub(r"[^\w=.,+-]", "_", "-".join(parts))
+
+
+def build_variant(
+    generator: str,
+    params: dict[str, Any],
+    output_dir: str | None = None,
+    file_types: tuple[str, ...] = (),
+    mesh_level: str | None = None,
+) -> SweepResult:
+    """
+    Build one variant. This runs in the worker process.
+
+    :param generator: The generator name, see generators.GENERATORS.
+    :param params: The keyword arguments for the generator.
+    :param output_dir: When given along with file_types, export the result here.
+    :param file_types: The formats to export, e.g. ("step", "stl").
+    :param mesh_level: When given instead, tessellate the result at this level, see util.tessellate.LEVELS,
+                       and send the mesh back in shared memory.
+    :return: The outcome of the build.
+    """
+    from hello_world.generators import get_generator
+    from hello_world.util.cache import encode
+    from hello_world.util.export import as_shape, export
+    from hello_world.util.shared_mesh import share
+    from hello_world.util.tessellate import tessellate
+
+    start = time.perf_counter()
+    try:
+        result = get_generator(generator)(**params)
+        paths = []
+        data = None
+        mesh = None
+        if output_dir is not None and file_types:
+            for file_type in file_types:
+                path = Path(output_dir) / f"{variant_name(generator, params)}.{file_type}"
+                paths.append(export(result, path))
+        elif mesh_level is not None:
+            mesh = share(tessellate(as_shape(result), mesh_level), variant_name(generator, params))
+        else:
+            data = encode(result)
+        seconds = time.perf_counter() - start
+        return SweepResult(generator, params, True, data=data, mesh=mesh, paths=paths, seconds=seconds)
+    except Exception:
+        return SweepResult(generator, params, False, error=traceback.format_exc(), seconds=time.perf_counter() - start)
+
+
+def run_in_pool(fn: Callable, calls: list[tuple], max_workers: int | None = None) -> list[Any]:
+    """
+    Call fn with each tuple of arguments in calls, across a pool of processes.
+
+    A worker dying breaks the whole pool, failing every call submitted to it. Only as
+    many calls as there are workers are submitted at a time, so just the calls that were
+    running when it broke fail. Each of those is retried in a pool of its own, so only a
+    call that crashes again is lost, and the calls not yet started go on in a new shared
+    pool. Every call is made at the caller's build quality, see util.quality.
+
+    :param fn: A module level function, so that it can be sent to the workers.
+    :param calls: The arguments for each call.
+    :param max_workers: The number of worker processes. Defaults to the number of CPUs.
+    :return: The result of each call in order, or None where the worker crashed.
+    """
+    from hello_world.util.quality import quality
+
+    level = quality().value
+    results = {}
+    pending = list(enumerate(calls))
+    while pending:
+        done, crashed, pending = _run(fn, pending, max_workers, level)
+        results.update(done)
+        for call in crashed:
+            retried, _, _ = _run(fn, [call], 1, level)
+            results.update(retried)
+    return [results.get(index) for index in range(len(calls))]
+
+
+def _call_at_quality(level: str, fn: Callable, *args) -> Any:
+    # The quality set by util.quality.draft is per thread, the worker wouldn't see it otherwise.
+    from hello_world.util.quality import build_quality
+
+    with build_quality(level):
+        return fn(*args)
+
+
+def _run(
+    fn: Callable, calls: list[tuple[int, tuple]], max_workers: int | None, level: str
+) -> tuple[dict[int, Any], list, list]:
+    # Run calls until they are done or the pool breaks. Returns the results, the calls
+    # that were running when it broke and the calls that weren't started.
+    # Spawn rather than fork, OCCT's thread pools don't survive a fork.
+    context = multiprocessing.get_context("spawn")
+    workers = max_workers or os.cpu_count() or 1
+    queued = iter(calls)
+    results = {}
+    crashed = []
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+        running = {}
+        for index, args in itertools.islice(queued, workers):
+            running[pool.submit(_call_at_quality, level, fn, *args)] = (index, args)
+        while running:
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                call = running.pop(future)
+                try:
+                    results[call[0]] = future.result()
+                except BrokenProcessPool:
+                    crashed.append(call)
+            if crashed:
+                # Everything still running fails with the pool.
+                crashed += running.values()
+                break
+            for index, args in itertools.islice(queued, len(finished)):
+                running[pool.submit(_call_at_quality, level, fn, *args)] = (index, args)
+    return results, crashed, list(queued)
+
+
+def sweep(
+    generator: str,
+    params: dict[str, Iterable[Any]] | list[dict[str, Any]],
+    max_workers: int | None = None,
+    output_dir: str | Path | None = None,
+    file_types: Iterable[str] = (),
+    mesh_level: str | None = None,
+) -> list[SweepResult]:
+    """
+    Build every variant of a generator in parallel.
+
+    :param generator: The generator name, see generators.GENERATORS.
+    :param params: A parameter grid, or an explicit list of keyword arguments.
+    :param max_workers: The number of worker processes. Defaults to the number of CPUs.
+    :param output_dir: Export each variant here from its worker instead of sending the shapes back.
+    :param file_types: The formats to export when output_dir is given. Defaults to STEP.
+    :param mesh_level: Send each variant back as a mesh at this level of detail instead of as BREP,
+                       see SweepResult.shared_mesh.
+    :return: One result per variant, in the order of the variants.
+    """
+    variants = parameter_grid(params) if isinstance(params, dict) else list(params)
+    file_types = tuple(file_types) or (("step",) if output_dir is not None else ())
+    if output_dir is not None:
+        Path(output_dir).mkdir(parents=True, exist_ok=True)
+        output_dir = str(output_dir)
+
+    calls = [(generator, v, output_dir, file_types, mesh_level) for v in variants]
+    results = run_in_pool(build_variant, calls, max_workers)
+    return [
+        result if result is not None else SweepResult(generator, variant, False, error="Worker process crashed")
+        for variant, result in zip(variants, results)
+    ]
+
+
+def _parse_value(text: str) -> Any:
+    try:
+        return ast.literal_eval(text)
+    except (ValueError, SyntaxError):
+        return text
+
+
+def main(argv: list[str] | None = None) -> int:
+    from hello_world.generators import GENERATORS
+
+    parser = argparse.ArgumentParser(
+        prog="python -m hello_world.sweep", description="Build every combination of a generator's parameters in parallel."
+    )
+    parser.add_argument("generator", help=f"one of {', '.join(sorted(GENERATORS))}, or module:attribute")
+    parser.add_argument(
+        "-p", "--param", action="append", default=[], metavar="NAME=V1,V2", help="values to sweep for a parameter"
+    )
+    parser.add_argument("-o", "--output-dir", required=True, help="directory to export variants to")
+    parser.add_argument("-f", "--format", action="append", choices=["step", "stl", "3mf", "brep"], help="defaults to step")
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="worker processes, defaults to the CPU count")
+    args = parser.parse_args(argv)
+
+    params = {}
+    for param in args.param:
+        name, _, values = param.partition("=")
+        params[name] = [_parse_value(v) for v in values.split(",")]
+
+    start = time.perf_counter()
+    results = sweep(args.generator, params, args.jobs, args.output_dir, args.format or ())
+    for result in results:
+        status = "ok" if result.ok else "FAILED"
+        print(f"{status:6} {result.seconds:7.2f}s {variant_name(args.generator, result.params)}")
+        if not result.ok:
+            print(result.error)
+    failed = sum(not r.ok for r in results)
+    print(f"{len(results) - failed}/{len(results)} variants built in {time.perf_counter() - start:.2f}s")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
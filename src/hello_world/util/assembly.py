@@ -0,0 +1,141 @@
+# Exporting parts made of repeated instances, such as the hooks on a bin, as assemblies.
+#
+# Hooks are placed with util.instance.located, so every hook on a part shares the
+# prototype's geometry and only its location differs. Written out flat, STEP and 3MF
+# repeat that geometry once per hook. Assembly.from_shape finds the shared solids in
+# a compound again, and the writers here store each of them once: STEP as a product
+# referenced by one instance per copy, 3MF as a mesh object referenced by one
+# component per copy. File size and export time then grow with the number of
+# distinct solids rather than the number of hooks.
+from dataclasses import dataclass, field
+from pathlib import Path
+import build123d as bd
+from OCP.IFSelect import IFSelect_ReturnStatus
+from OCP.Interface import Interface_Static
+from OCP.Message import Message, Message_Gravity
+from OCP.STEPCAFControl import STEPCAFControl_Writer
+from OCP.STEPControl import STEPControl_StepModelType
+from OCP.TCollection import TCollection_ExtendedString
+from OCP.TDataStd import TDataStd_Name
+from OCP.TDocStd import TDocStd_Document
+from OCP.TopAbs import TopAbs_ShapeEnum
+from OCP.TopLoc import TopLoc_Location
+from OCP.TopoDS import TopoDS_Iterator
+from OCP.XCAFApp import XCAFApp_Application
+from OCP.XCAFDoc import XCAFDoc_DocumentTool
+from hello_world.util.tessellate import mesh_shape
+from hello_world.util.threemf import Model3MF, location_matrix
+
+
+@dataclass
+class Assembly:
+    """
+    A shape split into distinct solids and the places each of them is used.
+
+    prototypes (list[bd.Shape]): The distinct solids, each at the origin of its own frame.
+    instances (list[tuple[int, bd.Location]]): The index of a prototype and where it is placed.
+    label (str): The name of the whole.
+    """
+
+    prototypes: list[bd.Shape] = field(default_factory=list)
+    instances: list[tuple[int, bd.Location]] = field(default_factory=list)
+    label: str = ""
+
+    @classmethod
+    def from_shape(cls, shape: bd.Shape) -> "Assembly":
+        """
+        Find the shared solids in a shape.
+
+        Compounds are taken apart down to their solids, or other non compound shapes.
+        Solids are shared when they are located instances of the same geometry, as made
+        by util.instance.located, not when they merely look alike.
+        """
+        assembly = cls(label=shape.label)
+        # Prototypes by their hash, to find the one a solid is an instance of quickly.
+        candidates: dict[int, list[int]] = {}
+        leaves = [shape.wrapped]
+        while leaves:
+            leaf = leaves.pop()
+            if leaf.ShapeType() == TopAbs_ShapeEnum.TopAbs_COMPOUND:
+                # The iterator composes each child's location with the compound's.
+                iterator = TopoDS_Iterator(leaf)
+                children = []
+                while iterator.More():
+                    children.append(iterator.Value())
+                    iterator.Next()
+                leaves.extend(reversed(children))
+                continue
+            unplaced = leaf.Located(TopLoc_Location())
+            key = hash(unplaced)
+            index = next((i for i in candidates.get(key, ()) if assembly.prototypes[i].wrapped.IsEqual(unplaced)), None)
+            if index is None:
+                index = len(assembly.prototypes)
+                assembly.prototypes.append(bd.Shape.cast(unplaced))
+                candidates.setdefault(key, []).append(index)
+            assembly.instances.append((index, bd.Location(leaf.Location())))
+        return assembly
+
+    @property
+    def shared(self) -> bool:
+        """Whether any solid is used more than once."""
+        return len(self.instances) > len(self.prototypes)
+
+    def _name(self, index: int) -> str:
+        prototype = self.prototypes[index]
+        return prototype.label or f"{self.label or 'part'}-{index + 1}"
+
+    def export_step(self, path: str | Path) -> Path:
+        """
+        Write the assembly as STEP, each prototype once as a product with an instance per placement.
+
+        :param path: The file to write.
+        :return: The path written.
+        """
+        path = Path(path)
+        document = TDocStd_Document(TCollection_ExtendedString("XmlOcaf"))
+        application = XCAFApp_Application.GetApplication_s()
+        application.NewDocument(TCollection_ExtendedString("MDTV-XCAF"), document)
+        application.InitDocument(document)
+        XCAFDoc_DocumentTool.SetLengthUnit_s(document, 0.001)
+        shapes = XCAFDoc_DocumentTool.ShapeTool_s(document.Main())
+        root = shapes.NewShape()
+        TDataStd_Name.Set_s(root, TCollection_ExtendedString(self.label or path.stem))
+        labels = []
+        for index, prototype in enumerate(self.prototypes):
+            label = shapes.AddShape(prototype.wrapped, False)
+            TDataStd_Name.Set_s(label, TCollection_ExtendedString(self._name(index)))
+            labels.append(label)
+        for index, location in self.instances:
+            shapes.AddComponent(root, labels[index], location.wrapped)
+        shapes.UpdateAssemblies()
+
+        # Keep the writer's progress report off the console, as build123d does.
+        for printer in Message.DefaultMessenger_s().Printers():
+            printer.SetTraceLevel(Message_Gravity.Message_Fail)
+        writer = STEPCAFControl_Writer()
+        writer.SetNameMode(True)
+        Interface_Static.SetCVal_s("write.step.unit", "MM")
+        writer.Transfer(document, STEPControl_StepModelType.STEPControl_AsIs)
+        if writer.Write(str(path)) != IFSelect_ReturnStatus.IFSelect_RetDone:
+            raise RuntimeError(f"Failed to write {path}")
+        return path
+
+    def export_3mf(self, path: str | Path, linear_deflection: float = 0.001, angular_deflection: float = 0.1) -> Path:
+        """
+        Write the assembly as 3MF, one object made of components which reference each prototype's mesh.
+
+        :param path: The file to write.
+        :param linear_deflection: The maximum distance between the mesh and the surface.
+        :param angular_deflection: The maximum angle between neighbouring mesh facets, in radians.
+        :return: The path written.
+        """
+        model = Model3MF()
+        objects = [
+            model.add_mesh(mesh_shape(prototype, linear_deflection, angular_deflection).welded(), self._name(index))
+            for index, prototype in enumerate(self.prototypes)
+        ]
+        whole = model.add_components(
+            [(objects[index], location_matrix(location)) for index, location in self.instances], self.label
+        )
+        model.add_item(whole)
+        return model.write(path)
@@ -0,0 +1,73 @@
+# Boolean operations tuned for cutting many tools out of a single body.
+import time
+from typing import Iterable, NamedTuple
+import build123d as bd
+from build123d.topology import downcast, unwrap_topods_compound
+from OCP.BRepAlgoAPI import BRepAlgoAPI_Cut
+from OCP.collections import List_TopoDS_Shape
+from OCP.TopoDS import TopoDS_Compound
+from hello_world.util.instance import topology_class
+
+
+class BatchedCut(NamedTuple):
+    """
+    The result of a batched cut.
+
+    shape (bd.Shape): The body with every tool removed.
+    tool_count (int): The number of tools that were cut.
+    seconds (float): Wall time spent in the boolean operation.
+    """
+
+    shape: bd.Shape
+    tool_count: int
+    seconds: float
+
+
+def batched_cut(body: bd.Shape, tools: Iterable[bd.Shape], fuzzy_value: float = 0.0) -> BatchedCut:
+    """
+    Cut every tool out of body with a single boolean operation.
+
+    Subtracting tools one at a time re-intersects the growing result with each new
+    tool, and subtracting a single compound of tools makes OCCT treat them as one
+    argument. Passing each tool as its own argument lets the boolean engine filter
+    interferences per tool (using oriented bounding boxes) and run in parallel.
+
+    :param body: The shape to cut from.
+    :param tools: The shapes to remove. These may share geometry, e.g. located instances.
+    :param fuzzy_value: Optional tolerance for coincident or nearly touching faces. Zero disables it.
+    :return: The cut shape along with the number of tools and time spent.
+    :raises ValueError: If OCCT can't cut the tools from the body.
+    """
+    tools = list(tools)
+    start = time.perf_counter()
+    if not tools:
+        return BatchedCut(body, 0, time.perf_counter() - start)
+    arguments = List_TopoDS_Shape()
+    arguments.Append(body.wrapped)
+    tool_shapes = List_TopoDS_Shape()
+    for tool in tools:
+        tool_shapes.Append(tool.wrapped)
+    operation = BRepAlgoAPI_Cut()
+    operation.SetArguments(arguments)
+    operation.SetTools(tool_shapes)
+    operation.SetRunParallel(True)
+    operation.SetUseOBB(True)
+    # Tools may be instances of a cached prototype, so don't let OCCT modify them in place.
+    operation.SetNonDestructive(True)
+    if fuzzy_value > 0:
+        operation.SetFuzzyValue(fuzzy_value)
+    operation.Build()
+    if not operation.IsDone():
+        raise ValueError(f"Failed to cut {len(tools)} tools from the body")
+    # Wrap the result the way build123d's own cut does: unwrapped from its compound if
+    # it's a single shape, cleaned, and carrying the body's label and color.
+    result = unwrap_topods_compound(downcast(operation.Shape()), True)
+    if isinstance(result, TopoDS_Compound):
+        cls = topology_class(type(body))
+        shape = (cls if issubclass(cls, bd.Compound) else bd.Compound)(result)
+    else:
+        shape = bd.Shape.cast(result)
+    if bd.SkipClean.clean:
+        shape = shape.clean()
+    body.copy_attributes_to(shape, ["wrapped", "_NodeMixin__children"])
+    return BatchedCut(shape, len(tools), time.perf_counter() - start)
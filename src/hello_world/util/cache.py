@@ -0,0 +1,268 @@
+# On-disk cache for part generators.
+#
+# Generators such as parts_bin are pure functions of their parameters, so their
+# results can be stored and reloaded instead of being rebuilt. Results are keyed by a
+# hash of the generator's name, its arguments, the source it depends on and the
+# versions of the CAD libraries. Shapes are stored as binary BREP, pickled along
+# with their type and label. The least recently used results are evicted once the
+# cache grows past its size limit.
+#
+# Environment variables:
+#     HELLO_WORLD_CACHE: set to 0 to disable the cache.
+#     HELLO_WORLD_CACHE_DIR: where to store results. Defaults to ~/.cache/hello_world.
+#     HELLO_WORLD_CACHE_MAX_MB: the size limit in megabytes. Defaults to 1024.
+import contextlib
+import contextvars
+import enum
+import functools
+import hashlib
+import importlib
+import inspect
+import io
+import os
+import pickle
+import sys
+import tempfile
+import types
+from importlib import metadata
+from pathlib import Path
+from typing import Any, Callable, TypeVar
+import build123d as bd
+from build123d.topology import downcast
+from OCP.BinTools import BinTools, BinTools_FormatVersion
+from OCP.TopoDS import TopoDS_Shape
+from hello_world.util.instance import topology_class
+from hello_world.util.quality import quality
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+PACKAGE = "hello_world"
+
+
+# Set by caching_disabled, for code whose results must not be stored or reused.
+_disabled: contextvars.ContextVar[bool] = contextvars.ContextVar("cache_disabled", default=False)
+
+
+def cache_enabled() -> bool:
+    return os.environ.get("HELLO_WORLD_CACHE", "1") != "0" and not _disabled.get()
+
+
+@contextlib.contextmanager
+def caching_disabled():
+    """Bypass the cache for every generator called within the block, on this thread."""
+    token = _disabled.set(True)
+    try:
+        yield
+    finally:
+        _disabled.reset(token)
+
+
+def cache_dir() -> Path:
+    return Path(os.environ.get("HELLO_WORLD_CACHE_DIR", Path.home() / ".cache" / PACKAGE))
+
+
+def cache_max_bytes() -> int:
+    return int(float(os.environ.get("HELLO_WORLD_CACHE_MAX_MB", 1024)) * 1024 * 1024)
+
+
+class Uncacheable(TypeError):
+    """Raised when an argument can't be turned into a stable cache key."""
+
+
+def _canonical(value: Any) -> Any:
+    """Convert a value into something with a stable repr, for hashing."""
+    if value is None or isinstance(value, (bool, int, float, str, bytes)):
+        return value
+    if isinstance(value, enum.Enum):
+        return (type(value).__qualname__, value.name)
+    if isinstance(value, (list, tuple)):
+        return (type(value).__name__, tuple(_canonical(v) for v in value))
+    if isinstance(value, dict):
+        return ("dict", tuple(sorted((repr(_canonical(k)), _canonical(v)) for k, v in value.items())))
+    if isinstance(value, bd.Vector):
+        return ("Vector", tuple(value))
+    if isinstance(value, bd.Location):
+        return ("Location", tuple(value.position), tuple(value.orientation))
+    if isinstance(value, bd.Plane):
+        return ("Plane", tuple(value.origin), tuple(value.x_dir), tuple(value.z_dir))
+    if isinstance(value, bd.Shape):
+        return (type(value).__qualname__, shape_hash(value.wrapped))
+    if hasattr(value, "__dict__") and type(value).__module__.startswith(PACKAGE):
+        # Instances of our own classes, e.g. the self of SkadisShelf.build.
+        return (type(value).__qualname__, _canonical(vars(value)))
+    raise Uncacheable(f"Can't build a cache key from {type(value).__qualname__}")
+
+
+def _dependencies(obj: Any, seen: set[int]) -> list[str]:
+    """Collect the source of obj and everything in this package it refers to by name."""
+    obj = inspect.unwrap(obj)
+    if id(obj) in seen:
+        return []
+    seen.add(id(obj))
+    try:
+        sources = [inspect.getsource(obj)]
+    except (OSError, TypeError):
+        return []
+    if isinstance(obj, types.ModuleType):
+        return sources
+
+    if isinstance(obj, type):
+        functions = [inspect.unwrap(v) for v in vars(obj).values() if isinstance(v, types.FunctionType)]
+        module_globals = vars(sys.modules[obj.__module__])
+    else:
+        functions = [obj]
+        module_globals = obj.__globals__
+
+    names = set()
+    for function in functions:
+        codes = [function.__code__]
+        while codes:
+            code = codes.pop()
+            names.update(code.co_names)
+            codes.extend(c for c in code.co_consts if isinstance(c, types.CodeType))
+
+    for name in sorted(names):
+        dependency = module_globals.get(name)
+        if name.startswith(PACKAGE + "."):
+            # A module imported inside the function, e.g. from hello_world.skadis_shelf import SkadisShelf
+            dependency = importlib.import_module(name)
+        module = getattr(dependency, "__module__", None) or getattr(dependency, "__name__", "")
+        if isinstance(dependency, (types.FunctionType, type, types.ModuleType)) and module.startswith(PACKAGE):
+            sources.extend(_dependencies(dependency, seen))
+    return sources
+
+
+@functools.cache
+def _library_versions() -> tuple[str, ...]:
+    versions = [sys.version]
+    for dist in ("build123d", "cadquery-ocp", "cadquery-ocp-novtk", "bd_warehouse"):
+        try:
+            versions.append(f"{dist}=={metadata.version(dist)}")
+        except metadata.PackageNotFoundError:
+            pass
+    return tuple(versions)
+
+
+def cache_key(func: Callable, args: tuple, kwargs: dict) -> str:
+    """
+    Hash a generator call.
+
+    :param func: The generator. Methods are hashed along with their whole class.
+    :param args: The positional arguments, including self for methods.
+    :param kwargs: The keyword arguments.
+    :return: A hex digest which changes whenever the result could change, including with the build quality.
+    """
+    bound = inspect.signature(func).bind(*args, **kwargs)
+    bound.apply_defaults()
+    owner = sys.modules[func.__module__]
+    for part in func.__qualname__.split(".")[:-1]:
+        owner = getattr(owner, part)
+    source = _dependencies(owner if isinstance(owner, type) else func, set())
+    digest = hashlib.sha256()
+    for item in (f"{func.__module__}.{func.__qualname__}", quality().value, *_library_versions(), *source):
+        digest.update(item.encode())
+    digest.update(repr(_canonical(dict(bound.arguments))).encode())
+    return digest.hexdigest()
+
+
+def serialize_shape(shape: TopoDS_Shape) -> bytes:
+    """Write an OCCT shape as binary BREP."""
+    buffer = io.BytesIO()
+    BinTools.Write_s(shape, buffer)
+    return buffer.getvalue()
+
+
+def shape_hash(shape: TopoDS_Shape) -> str:
+    """Hash an OCCT shape's BREP, leaving out any mesh attached to it by tessellation."""
+    buffer = io.BytesIO()
+    BinTools.Write_s(shape, buffer, False, False, BinTools_FormatVersion.BinTools_FormatVersion_CURRENT)
+    return hashlib.sha256(buffer.getvalue()).hexdigest()
+
+
+def deserialize_shape(data: bytes) -> TopoDS_Shape:
+    """Read an OCCT shape written by serialize_shape."""
+    shape = TopoDS_Shape()
+    BinTools.Read_s(shape, io.BytesIO(data))
+    return downcast(shape)
+
+
+def encode(value: Any) -> Any:
+    """Convert a generator result into plain data, storing shapes as binary BREP."""
+    if isinstance(value, bd.Shape):
+        return ("shape", topology_class(type(value)), value.label, serialize_shape(value.wrapped))
+    if isinstance(value, (list, tuple)):
+        return (type(value).__name__, [encode(v) for v in value])
+    return ("value", value)
+
+
+def decode(data: Any) -> Any:
+    """Rebuild a generator result written by encode."""
+    kind, *rest = data
+    if kind == "shape":
+        cls, label, brep = rest
+        shape = cls(deserialize_shape(brep))
+        shape.label = label
+        return shape
+    if kind in ("list", "tuple"):
+        values = [decode(v) for v in rest[0]]
+        return values if kind == "list" else tuple(values)
+    return rest[0]
+
+
+def _evict(directory: Path, max_bytes: int, pattern: str = "*.pickle"):
+    entries = [(entry.stat(), entry) for entry in directory.glob(pattern)]
+    total = sum(stat.st_size for stat, _ in entries)
+    # Hits touch their entry, so the oldest modification time is the least recently used.
+    for stat, entry in sorted(entries, key=lambda e: e[0].st_mtime):
+        if total <= max_bytes:
+            break
+        entry.unlink(missing_ok=True)
+        total -= stat.st_size
+
+
+def brep_cache(func: F) -> F:
+    """
+    Decorate a part generator so its results are stored on disk and reloaded.
+
+    Calls whose arguments can't be hashed are passed straight through.
+    """
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if not cache_enabled():
+            return func(*args, **kwargs)
+        try:
+            key = cache_key(func, args, kwargs)
+        except Uncacheable:
+            return func(*args, **kwargs)
+        directory = cache_dir()
+        path = directory / f"{key}.pickle"
+        try:
+            with open(path, "rb") as f:
+                result = decode(pickle.load(f))
+            os.utime(path)
+            return result
+        except FileNotFoundError:
+            pass
+        except Exception:
+            # A corrupt entry, or one written by an older version which no longer
+            # unpickles or decodes, e.g. a truncated BREP or a renamed class. Rebuild it.
+            path.unlink(missing_ok=True)
+
+        result = func(*args, **kwargs)
+        directory.mkdir(parents=True, exist_ok=True)
+        # Write to a temporary file first so that readers never see a partial entry.
+        with tempfile.NamedTemporaryFile(dir=directory, suffix=".tmp", delete=False) as f:
+            pickle.dump(encode(result), f)
+        os.replace(f.name, path)
+        _evict(directory, cache_max_bytes())
+        return result
+
+    wrapper.uncached = func
+    return wrapper
+
+
+def clear_cache():
+    """Remove every cached result."""
+    for entry in cache_dir().glob("*.pickle"):
+        entry.unlink(missing_ok=True)
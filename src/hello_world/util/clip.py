@@ -0,0 +1,138 @@
+# Cheap 2D classification of pattern cells against a planar face.
+#
+# Patterns are laid out over a face's bounding box, so on non-rectangular faces many
+# cells fall outside the face or only partially overlap it. Sorting the cells first
+# means only the ones crossing the face boundary need an OCCT intersection.
+from enum import IntEnum
+from math import ceil
+import numpy as np
+import build123d as bd
+from hello_world.util.pattern import LocationArray
+
+
+class Cell(IntEnum):
+    OUTSIDE = 0
+    INSIDE = 1
+    STRADDLING = 2
+
+
+def boundary_segments(face: bd.Face, plane: bd.Plane, step: float) -> tuple[np.ndarray, float]:
+    """
+    Approximate the boundary of a face with line segments in the plane's local coordinates.
+
+    :param face: The face to approximate. Holes in the face are included.
+    :param plane: The plane to project into, usually bd.Plane(face).
+    :param step: The maximum length of a segment.
+    :return: An (N, 2, 2) array of segment end points, and the largest distance between
+             a segment and the edge it approximates.
+    """
+    segments = []
+    deviation = 0.0
+    for edge in face.edges():
+        count = max(1, ceil(edge.length / step))
+        # Sample twice as densely as needed, the odd points measure how far the chords stray from the edge.
+        points = edge.positions([i / (2 * count) for i in range(2 * count + 1)])
+        # Round off floating point noise so edges meeting at a vertex share its exact coordinates.
+        points = np.round(np.array([tuple(plane.to_local_coords(p))[:2] for p in points]), 9)
+        ends = points[0::2]
+        mids = points[1::2]
+        chord_mids = (ends[:-1] + ends[1:]) / 2
+        deviation = max(deviation, float(np.max(np.linalg.norm(mids - chord_mids, axis=1))))
+        segments.append(np.stack([ends[:-1], ends[1:]], axis=1))
+    return np.concatenate(segments), deviation
+
+
+def classify_cells(
+    face: bd.Face, plane: bd.Plane, centers: np.ndarray, cell_min: bd.VectorLike, cell_max: bd.VectorLike
+) -> np.ndarray:
+    """
+    Classify pattern cells as inside, outside or straddling the boundary of a face.
+
+    The test is conservative, a cell near the boundary may be reported as straddling
+    when it is actually inside or outside, but never the other way around.
+
+    :param face: The face the pattern is laid over.
+    :param plane: The plane the cells are laid out in, usually bd.Plane(face).
+    :param centers: An (N, 2) array of cell origins in the plane's local coordinates.
+    :param cell_min: The minimum corner of a cell's bounding box, relative to its origin.
+    :param cell_max: The maximum corner of a cell's bounding box, relative to its origin.
+    :return: An (N,) array of Cell values.
+    """
+    cell_min = np.array(tuple(bd.Vector(cell_min))[:2])
+    cell_max = np.array(tuple(bd.Vector(cell_max))[:2])
+    centers = np.asarray(centers, dtype=float).reshape(-1, 2)
+    segments, deviation = boundary_segments(face, plane, step=float(np.min(cell_max - cell_min)) / 4)
+    seg_min = segments.min(axis=1)
+    seg_max = segments.max(axis=1)
+    x0, y0 = segments[:, 0, 0], segments[:, 0, 1]
+    x1, y1 = segments[:, 1, 0], segments[:, 1, 1]
+
+    result = np.empty(len(centers), dtype=np.int8)
+    # Chunk the cells so the cell x segment comparisons stay a reasonable size.
+    chunk = max(1, 2_000_000 // max(1, len(segments)))
+    for start in range(0, len(centers), chunk):
+        c = centers[start : start + chunk]
+        lo = (c + cell_min - deviation)[:, None, :]
+        hi = (c + cell_max + deviation)[:, None, :]
+        # Any boundary segment whose bounding box touches the cell means the cell may cross the boundary.
+        straddling = np.any(np.all((seg_min <= hi) & (seg_max >= lo), axis=2), axis=1)
+        # Otherwise the whole cell is on one side, cast a ray in +X from its origin and count crossings.
+        px = c[:, 0, None]
+        py = c[:, 1, None]
+        spans = (y0 > py) != (y1 > py)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            x_cross = x0 + (py - y0) * (x1 - x0) / (y1 - y0)
+        inside = np.count_nonzero(spans & (x_cross > px), axis=1) % 2 == 1
+        result[start : start + chunk] = np.where(straddling, Cell.STRADDLING, np.where(inside, Cell.INSIDE, Cell.OUTSIDE))
+    return result
+
+
+def clip_locations(
+    face: bd.Face, plane: bd.Plane, shape: bd.Shape, locations: LocationArray | bd.LocationList | list[bd.Location]
+) -> tuple[LocationArray, LocationArray] | tuple[list[bd.Location], list[bd.Location]]:
+    """
+    Split pattern locations into those whose shape lies inside a face and those crossing its boundary.
+
+    Locations whose shape lies fully outside the face are dropped. A LocationArray is
+    split into two smaller arrays without creating a bd.Location for any of its cells.
+
+    :param face: The face the pattern is laid over.
+    :param plane: The plane the locations are local to, usually bd.Plane(face).
+    :param shape: The pattern shape placed at each location, in its own local coordinates.
+    :param locations: The pattern locations, local to plane. Only their translation is considered.
+    :return: The inside locations and the straddling locations, as arrays when given an array.
+    """
+    shape_bb = shape.bounding_box()
+    if isinstance(locations, LocationArray):
+        if not len(locations):
+            return locations, locations
+        cells = classify_cells(face, plane, locations.positions[:, :2], shape_bb.min, shape_bb.max)
+        return locations[cells == Cell.INSIDE], locations[cells == Cell.STRADDLING]
+    locations = list(locations)
+    if not locations:
+        return [], []
+    centers = np.array([(loc.position.X, loc.position.Y) for loc in locations])
+    cells = classify_cells(face, plane, centers, shape_bb.min, shape_bb.max)
+    inside = [loc for loc, cell in zip(locations, cells) if cell == Cell.INSIDE]
+    straddling = [loc for loc, cell in zip(locations, cells) if cell == Cell.STRADDLING]
+    return inside, straddling
+
+
+def clip_cells(
+    face: bd.Face, face_plane: bd.Plane, shape: bd.Sketch, locations: LocationArray | list[bd.Location]
+) -> list[bd.Face]:
+    """
+    Intersect the shape at each location with a face.
+
+    :param face: The face to clip to.
+    :param face_plane: The plane the locations are local to.
+    :param shape: The shape placed at each location.
+    :param locations: The cell locations, local to face_plane.
+    :return: The clipped cells, in global coordinates.
+    """
+    faces = []
+    for loc in locations:
+        clipped = (face_plane * loc * shape).intersect(face)
+        if clipped is not None:
+            faces.extend(clipped.faces())
+    return faces
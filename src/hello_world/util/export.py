@@ -0,0 +1,60 @@
+# Writing generator results to files.
+from pathlib import Path
+from typing import Any
+import build123d as bd
+from hello_world.util.assembly import Assembly
+
+FILE_TYPES = ("step", "stl", "3mf", "brep")
+
+
+def as_shape(result: Any) -> bd.Shape:
+    """
+    Combine a generator result into a single shape.
+
+    Generators return a shape, or a list of shapes (e.g. a box and its lid), which may
+    themselves contain lists.
+    """
+    if isinstance(result, bd.Shape):
+        return result
+    if isinstance(result, (list, tuple)):
+        return bd.Compound([as_shape(r) for r in result])
+    raise TypeError(f"Can't export {type(result).__qualname__}")
+
+
+def export(
+    result: Any, path: str | Path, linear_deflection: float = 0.001, angular_deflection: float = 0.1
+) -> Path:
+    """
+    Write a generator result to path, in the format given by its suffix.
+
+    :param result: A shape or list of shapes.
+    :param path: The file to write, ending in .step, .stl, .3mf or .brep.
+    :param linear_deflection: The maximum distance between a mesh and the surface, for STL and 3MF.
+    :param angular_deflection: The maximum angle between neighbouring mesh facets in radians, for STL and 3MF.
+    :return: The path written.
+
+    Shapes with repeated instances, such as the hooks of a bin, are written to STEP and
+    3MF as assemblies which store each instanced solid once, see util.assembly.
+    """
+    path = Path(path)
+    file_type = path.suffix.lstrip(".").lower()
+    shape = as_shape(result)
+    assembly = Assembly.from_shape(shape) if file_type in ("step", "3mf") else None
+    if assembly is not None and assembly.shared:
+        if file_type == "step":
+            assembly.export_step(path)
+        else:
+            assembly.export_3mf(path, linear_deflection, angular_deflection)
+    elif file_type == "step":
+        bd.export_step(shape, str(path))
+    elif file_type == "stl":
+        bd.export_stl(shape, str(path), tolerance=linear_deflection, angular_tolerance=angular_deflection)
+    elif file_type == "3mf":
+        mesher = bd.Mesher()
+        mesher.add_shape(shape, linear_deflection=linear_deflection, angular_deflection=angular_deflection)
+        mesher.write(str(path))
+    elif file_type == "brep":
+        bd.export_brep(shape, str(path))
+    else:
+        raise ValueError(f"Unsupported file type {file_type}, expected one of {FILE_TYPES}")
+    return path
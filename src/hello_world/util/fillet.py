@@ -0,0 +1,137 @@
+# Fillets planned during construction and applied once at the end.
+#
+# Filleting in the middle of building a part rebuilds its topology, and every boolean
+# after that has to work through the extra faces, or a later fillet rebuilds it again.
+# A FilletPlan records what should be rounded instead, and fillets every edge of a
+# solid in one operation when the part is otherwise finished. Each radius can differ,
+# OCCT's fillet builder takes one per edge.
+#
+# Edges don't survive booleans as the same objects, so an edge is recorded by its
+# geometry and found again in the finished shape: every edge lying along a recorded
+# edge is filleted, including the pieces of one a boolean has split. Edges that only
+# exist at the end can be chosen by a function of the finished shape instead.
+#
+# In draft quality (see util.quality) no fillets are applied.
+#
+#     plan = FilletPlan()
+#     plan.add(2, body.edges().sort_by(bd.Axis.Z)[0:1])
+#     body += feet
+#     plan.add(1, lambda shape: shape.edges().sort_by(bd.Axis.Z)[0:3])
+#     body = plan.apply(body)
+from dataclasses import dataclass, field
+from typing import Callable, Iterable
+import build123d as bd
+from build123d.topology import downcast
+from OCP.BRepFilletAPI import BRepFilletAPI_MakeFillet
+from OCP.BRepTools import BRepTools_ReShape
+from hello_world.util.instance import topology_class
+from hello_world.util.quality import is_draft
+from hello_world.util.topology import topology
+
+EdgeSelector = Iterable[bd.Edge] | Callable[[bd.Shape], Iterable[bd.Edge]]
+
+
+@dataclass
+class FilletPlan:
+    """
+    Fillets to apply to a shape once it is finished.
+
+    tolerance (float): How close an edge of the finished shape must lie to a recorded edge to be filleted.
+    intents (list[tuple[float, list[bd.Edge] | Callable]]): Each radius and the edges, or edge selector, to fillet with it.
+    """
+
+    tolerance: float = 1e-4
+    intents: list[tuple[float, list[bd.Edge] | Callable[[bd.Shape], Iterable[bd.Edge]]]] = field(default_factory=list)
+
+    def add(self, radius: float, edges: EdgeSelector) -> "FilletPlan":
+        """
+        Plan to fillet edges.
+
+        :param radius: The fillet radius.
+        :param edges: Edges of the shape as it is now, found again by their geometry, or a
+            function returning edges of the finished shape.
+        :return: The plan, so calls can be chained.
+        """
+        if isinstance(edges, bd.Edge):
+            edges = [edges]
+        self.intents.append((radius, edges if callable(edges) else list(edges)))
+        return self
+
+    def _find(self, shape: bd.Shape, edge: bd.Edge) -> list[bd.Edge]:
+        # Candidates have their centers in the recorded edge's box, the rest can't lie along it.
+        box = edge.bounding_box()
+        margin = bd.Vector(self.tolerance, self.tolerance, self.tolerance)
+        candidates = topology(shape).within("edge", box.min - margin, box.max + margin)
+        return [
+            candidate
+            for candidate in candidates
+            if all(edge.distance_to(candidate.position_at(u)) <= self.tolerance for u in (0, 0.5, 1))
+        ]
+
+    def edges(self, shape: bd.Shape) -> list[tuple[float, bd.Edge]]:
+        """
+        Find the planned edges in the finished shape.
+
+        :param shape: The finished shape.
+        :return: Each edge to fillet and its radius. An edge planned twice keeps the last radius.
+        :raises ValueError: If a recorded edge is no longer part of the shape.
+        """
+        radii: dict[bd.Edge, float] = {}
+        for radius, edges in self.intents:
+            if callable(edges):
+                found = list(edges(shape))
+            else:
+                found = []
+                for edge in edges:
+                    matches = self._find(shape, edge)
+                    if not matches:
+                        raise ValueError(f"A planned fillet edge at {edge.center()} is no longer part of the shape")
+                    found += matches
+            for edge in found:
+                radii[edge] = radius
+        return [(radius, edge) for edge, radius in radii.items()]
+
+    def apply(self, shape: bd.Shape, skip: bool | None = None) -> bd.Shape:
+        """
+        Fillet the planned edges, with one fillet operation per solid.
+
+        :param shape: The finished shape, a solid or a compound of them.
+        :param skip: Return the shape unchanged. Defaults to skipping in draft quality.
+        :return: The filleted shape, of shape's topology class, e.g. bd.Part for a bd.Box.
+        :raises ValueError: If an edge is missing or OCCT can't fillet the edges.
+        """
+        if skip is None:
+            skip = is_draft()
+        if skip or not self.intents:
+            return shape
+        planned = self.edges(shape)
+        reshape = BRepTools_ReShape()
+        for solid in shape.solids():
+            solid_edges = set(solid.edges())
+            mine = [(radius, edge) for radius, edge in planned if edge in solid_edges]
+            if not mine:
+                continue
+            fillet = BRepFilletAPI_MakeFillet(solid.wrapped)
+            for radius, edge in mine:
+                fillet.Add(radius, edge.wrapped)
+            fillet.Build()
+            if not fillet.IsDone():
+                raise ValueError(f"Failed to fillet {len(mine)} edges, the radii may be too large for the part")
+            # The builder returns its solid inside a compound.
+            reshape.Replace(solid.wrapped, bd.Shape.cast(fillet.Shape()).solids()[0].wrapped)
+        filleted = reshape.Apply(shape.wrapped)
+        return topology_class(type(shape))(downcast(filleted))
+
+
+def fillet(shape: bd.Shape, radius: float, edges: bd.Edge | Iterable[bd.Edge]) -> bd.Shape:
+    """
+    Fillet edges of a shape now, unless building in draft quality.
+
+    :param shape: The shape.
+    :param radius: The fillet radius.
+    :param edges: The edges of shape to fillet.
+    :return: The filleted shape, or shape itself in draft quality.
+    """
+    if is_draft():
+        return shape
+    return shape.fillet(radius, [edges] if isinstance(edges, bd.Edge) else list(edges))
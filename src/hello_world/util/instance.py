@@ -0,0 +1,49 @@
+# Helpers for placing many copies of the same shape without copying its geometry.
+from typing import Iterable, TypeVar
+import build123d as bd
+from build123d.topology import downcast
+
+ShapeT = TypeVar("ShapeT", bound=bd.Shape)
+
+
+def topology_class(cls: type) -> type:
+    """
+    The class to rebuild a shape of class cls from an OCCT shape.
+
+    Shapes such as bd.Box can't be rebuilt by their own constructor, which takes
+    dimensions, so this is the topology class they derive from, e.g. bd.Part.
+    """
+    for base in cls.__mro__:
+        if base.__module__.startswith("build123d.topology"):
+            return base
+    return bd.Compound
+
+
+def located(shape: ShapeT, loc: bd.Location | bd.Plane) -> ShapeT:
+    """
+    Return an instance of shape placed at loc.
+
+    ``shape.moved(loc)`` and ``loc * shape`` deep copy the BREP before relocating it.
+    The instance returned here references the same underlying TShape as shape, only
+    its location differs, so placing it is cheap and adds no geometry to memory.
+
+    :param shape: The shape to place.
+    :param loc: The location, relative to the shape's current location.
+    :return: The located instance, of shape's topology class, e.g. bd.Part for a bd.Box.
+    """
+    if isinstance(loc, bd.Plane):
+        loc = loc.location
+    instance = topology_class(type(shape))(downcast(shape.wrapped.Moved(loc.wrapped)))
+    instance.label = shape.label
+    return instance
+
+
+def instances(shape: bd.Shape, locations: Iterable[bd.Location | bd.Plane]) -> bd.Compound:
+    """
+    Place shape at each of the given locations.
+
+    :param shape: The shape to place.
+    :param locations: The locations to place the shape at.
+    :return: A compound of located instances which all share the geometry of shape.
+    """
+    return bd.Compound([located(shape, loc) for loc in locations])
@@ -1,11 +1,344 @@
+# Laying out parts for viewing and for printing.
+#
+# pack arranges parts on as few print beds as it can. Each part's footprint, its
+# outline seen from above, is rasterized from a coarse mesh and grown by half the
+# spacing, so parts keep their distance while concave ones can still nest. Parts are
+# placed largest first, each at the lowest and then leftmost free spot in any of the
+# allowed rotations, on the first plate with room for it. Free spots are found for
+# every position at once by correlating the footprint with the plate's occupancy in
+# the frequency domain.
+#
+# Placements are Locations, the parts themselves aren't copied, and export_plates
+# writes each plate as one 3MF in which repeated parts share their mesh.
+#
+#     plates = pack([parts_bin(n, 40) for n in range(1, 7)], bed=(256, 256))
+#     export_plates(plates, "out")
+import math
+from dataclasses import dataclass, field
+from pathlib import Path
+import numpy as np
 import build123d as bd
+from hello_world.util.assembly import Assembly
+from hello_world.util.instance import located
+from hello_world.util.tessellate import LEVELS, Mesh, mesh_shape, tessellate
+from hello_world.util.threemf import Model3MF, location_matrix
+
 
 # Layout shapes side-by-side with a 10mm gap for visual clarity
-def layout_shapes(shapes: bd.List[bd.Shape]) -> bd.List[bd.Shape]:
+def layout_shapes(shapes: list[bd.Shape]) -> list[bd.Shape]:
     layout = []
     x_offset = 0
     for shape in shapes:
-        layout.append(shape.translate((x_offset, 0, 0)))
+        layout.append(located(shape, bd.Location((x_offset, 0, 0))))
         x_offset += shape.bounding_box().size.X + 10
     return layout
 
+
+@dataclass
+class Placement:
+    """
+    Where a part goes on a plate.
+
+    shape (bd.Shape): The part, as passed to pack.
+    index (int): The position of the part in the list passed to pack.
+    location (bd.Location): Moves the part from where it is onto the plate, resting on it.
+    angle (float): The rotation about Z included in location, in degrees.
+    """
+
+    shape: bd.Shape
+    index: int
+    location: bd.Location
+    angle: float
+
+    def placed(self) -> bd.Shape:
+        """The part on the plate, an instance sharing the part's geometry."""
+        return located(self.shape, self.location)
+
+
+@dataclass
+class Plate:
+    """
+    One print bed's worth of parts.
+
+    size (tuple[float, float]): The size of the bed. Its corner is at the origin.
+    placements (list[Placement]): The parts on it.
+    """
+
+    size: tuple[float, float]
+    placements: list[Placement] = field(default_factory=list)
+    _covered: float = field(default=0.0, repr=False)
+
+    def shapes(self) -> list[bd.Shape]:
+        """The parts on the plate."""
+        return [placement.placed() for placement in self.placements]
+
+    @property
+    def density(self) -> float:
+        """The fraction of the bed covered by the parts' footprints."""
+        return self._covered / (self.size[0] * self.size[1])
+
+
+@dataclass
+class _Footprint:
+    # A part's rasterized footprint in one rotation, grown by the clearance. Row i,
+    # column j covers origin + (j, i) * resolution, in the part's rotated frame.
+    angle: float
+    cells: np.ndarray
+    origin: np.ndarray
+    area: float
+    spectrum: np.ndarray | None = None
+
+
+def _rasterize(points: np.ndarray, triangles: np.ndarray, shape: tuple[int, int]) -> np.ndarray:
+    # Mark every cell a triangle touches, with points in cell units, so the outline never
+    # reaches past the marked cells. Triangles are grouped by the size of their bounding
+    # box so each group is tested at once.
+    cells = np.zeros(shape, bool)
+    corners = points[triangles]
+    # Wind every triangle counterclockwise, so a cell is on the inner side of an edge when any of its corners is.
+    a, b, c = corners[:, 0], corners[:, 1], corners[:, 2]
+    clockwise = (b[:, 0] - a[:, 0]) * (c[:, 1] - a[:, 1]) - (b[:, 1] - a[:, 1]) * (c[:, 0] - a[:, 0]) < 0
+    corners[clockwise] = corners[clockwise][:, ::-1]
+    low = np.floor(corners.min(axis=1)).astype(np.int64)
+    high = np.floor(corners.max(axis=1)).astype(np.int64)
+    span = (high - low + 1).max(axis=1)
+    buckets = 2 ** np.ceil(np.log2(span)).astype(np.int64)
+    for size in np.unique(buckets):
+        grid = np.stack(np.meshgrid(np.arange(size), np.arange(size)), axis=-1).reshape(-1, 2)
+        members = np.flatnonzero(buckets == size)
+        # Keep each batch to a few million candidate cells.
+        for chunk in np.array_split(members, max(1, len(members) * size * size // 4_000_000)):
+            candidates = low[chunk, None, :] + grid
+            # Cells beyond the triangle's bounding box are outside it, the remaining cells
+            # overlap it unless all four of their corners are outside one of its edges.
+            touches = np.all(candidates <= high[chunk, None, :], axis=2)
+            for k in range(3):
+                p = corners[chunk, k, None, :]
+                d = corners[chunk, (k + 1) % 3, None, :] - p
+                # The side of the edge the cell's lower left corner is on, plus the most any
+                # other corner of the cell adds to it.
+                side = d[..., 0] * (candidates[..., 1] - p[..., 1]) - d[..., 1] * (candidates[..., 0] - p[..., 0])
+                touches &= side + np.maximum(d[..., 0], 0) + np.maximum(-d[..., 1], 0) >= 0
+            hits = candidates[touches]
+            hits = hits[(hits[:, 0] < shape[1]) & (hits[:, 1] < shape[0]) & (hits >= 0).all(axis=1)]
+            cells[hits[:, 1], hits[:, 0]] = True
+    return cells
+
+
+def _dilate(cells: np.ndarray, radius: float) -> tuple[np.ndarray, int]:
+    # Mark every cell within radius of a marked one, measured between the nearest edges
+    # of the two cells, padding the grid to fit. Returns the grown cells and the padding.
+    pad = math.floor(radius) + 1
+    grown = np.zeros((cells.shape[0] + 2 * pad, cells.shape[1] + 2 * pad), bool)
+    for dy in range(-pad, pad + 1):
+        for dx in range(-pad, pad + 1):
+            if max(abs(dx) - 1, 0) ** 2 + max(abs(dy) - 1, 0) ** 2 <= radius * radius:
+                grown[pad + dy : pad + dy + cells.shape[0], pad + dx : pad + dx + cells.shape[1]] |= cells
+    return grown, pad
+
+
+def _footprints(mesh: Mesh, angles: tuple[float, ...], resolution: float, clearance: float) -> list[_Footprint]:
+    # Every vertical line through a solid leaves it through a face seen from above, so
+    # those faces alone cover the outline. Every cell the outline reaches into is marked
+    # and grown by the clearance, so two footprints only overlap where their parts come
+    # within twice the clearance of each other.
+    corners = mesh.vertices[mesh.triangles].astype(np.float64)
+    a = corners[:, 1, :2] - corners[:, 0, :2]
+    b = corners[:, 2, :2] - corners[:, 0, :2]
+    # The z component of the normal, np.cross of 2D vectors is deprecated.
+    upward = a[:, 0] * b[:, 1] - a[:, 1] * b[:, 0] > 0
+    triangles = mesh.triangles[upward].astype(np.int64)
+    footprints = []
+    seen = []
+    for angle in angles:
+        theta = math.radians(angle)
+        rotation = np.array([[math.cos(theta), -math.sin(theta)], [math.sin(theta), math.cos(theta)]])
+        points = mesh.vertices[:, :2].astype(np.float64) @ rotation.T
+        low = points.min(axis=0)
+        scaled = (points - low) / resolution
+        size = np.floor(scaled.max(axis=0)).astype(np.int64) + 1
+        outline = _rasterize(scaled, triangles, (size[1], size[0]))
+        cells, pad = _dilate(outline, clearance / resolution)
+        # Symmetric parts look the same in several rotations, only try one of them.
+        if any(cells.shape == other.shape and np.array_equal(cells, other) for other in seen):
+            continue
+        seen.append(cells)
+        footprints.append(_Footprint(angle, cells, low - pad * resolution, outline.sum() * resolution**2))
+    return footprints
+
+
+def _fft_size(n: int) -> int:
+    # The smallest size of at least n with no prime factors above 5, which FFTs are fast for.
+    while True:
+        m = n
+        for p in (2, 3, 5):
+            while m % p == 0:
+                m //= p
+        if m == 1:
+            return n
+        n += 1
+
+
+class _Bed:
+    # The occupancy of one plate, in cells.
+    def __init__(self, plate: Plate, cells: tuple[int, int]):
+        self.plate = plate
+        self.cells = np.zeros(cells, bool)
+        self.free = self.cells.size
+        self.fft_shape = (_fft_size(cells[0]), _fft_size(cells[1]))
+        # The footprints that didn't fit. The bed only fills up, so they never will.
+        self.misfits: set[int] = set()
+        self._spectrum = None
+
+    @property
+    def spectrum(self) -> np.ndarray:
+        if self._spectrum is None:
+            self._spectrum = np.fft.rfft2(self.cells, self.fft_shape)
+        return self._spectrum
+
+    def best_fit(self, footprint: _Footprint) -> tuple[int, int, int] | None:
+        # The score, row and column of the lowest, then leftmost, free spot for footprint.
+        rows, columns = self.cells.shape
+        height, width = footprint.cells.shape
+        if height > rows or width > columns or id(footprint) in self.misfits:
+            return None
+        if footprint.spectrum is None:
+            footprint.spectrum = np.conj(np.fft.rfft2(footprint.cells, self.fft_shape))
+        # Correlating the occupancy with the footprint counts the overlapping cells at every
+        # position. Positions where the footprint fits inside the plate don't wrap around.
+        overlap = np.fft.irfft2(self.spectrum * footprint.spectrum, self.fft_shape)
+        free = overlap[: rows - height + 1, : columns - width + 1] < 0.5
+        if not free.any():
+            self.misfits.add(id(footprint))
+            return None
+        row = int(np.argmax(free.any(axis=1)))
+        column = int(np.argmax(free[row]))
+        return (row + height) * (columns + 1) + column + width, row, column
+
+    def place(self, footprint: _Footprint, row: int, column: int):
+        height, width = footprint.cells.shape
+        self.cells[row : row + height, column : column + width] |= footprint.cells
+        self.free -= int(footprint.cells.sum())
+        self._spectrum = None
+
+
+def pack(
+    shapes: list[bd.Shape],
+    bed: tuple[float, float] = (256, 256),
+    spacing: float = 5,
+    margin: float = 5,
+    angles: tuple[float, ...] = (0, 90, 180, 270),
+    resolution: float = 1,
+) -> list[Plate]:
+    """
+    Arrange parts on as few print beds as possible.
+
+    Parts are expected to be oriented for printing already, they are only turned about Z.
+
+    :param shapes: The parts to arrange.
+    :param bed: The width and depth of the print bed.
+    :param spacing: The minimum distance between parts.
+    :param margin: The minimum distance between parts and the edges of the bed.
+    :param angles: The rotations about Z to try, in degrees.
+    :param resolution: The size of the cells footprints are rasterized to. Smaller packs tighter but slower.
+    :return: The plates, with every part placed on one of them.
+    :raises ValueError: If a part doesn't fit on an empty bed in any of the rotations.
+    """
+    # Footprints are grown by half the spacing, so the bed is shrunk by what's left of the margin.
+    inset = max(margin - spacing / 2, 0)
+    cells = (math.floor((bed[1] - 2 * inset) / resolution), math.floor((bed[0] - 2 * inset) / resolution))
+    footprints = []
+    # Identical parts come back from the mesh cache as the same mesh, and share their footprints.
+    by_mesh: dict[int, tuple[Mesh, list[_Footprint]]] = {}
+    for shape in shapes:
+        mesh = tessellate(shape, "coarse")
+        if id(mesh) not in by_mesh:
+            # The coarse mesh can fall short of curved outlines by up to its deflection.
+            clearance = spacing / 2 + LEVELS["coarse"].deflection(shape)
+            by_mesh[id(mesh)] = (mesh, _footprints(mesh, angles, resolution, clearance))
+        footprints.append(by_mesh[id(mesh)][1])
+    order = sorted(range(len(shapes)), key=lambda i: -int(footprints[i][0].cells.sum()))
+    beds: list[_Bed] = []
+    for index in order:
+        area = int(footprints[index][0].cells.sum())
+        for target in [b for b in beds if b.free >= area] + [None]:
+            if target is None:
+                target = _Bed(Plate(bed), cells)
+                fits = [(fit, f) for f in footprints[index] if (fit := target.best_fit(f)) is not None]
+                if not fits:
+                    raise ValueError(f"Part {index} doesn't fit on a {bed[0]} x {bed[1]} bed")
+                beds.append(target)
+            else:
+                fits = [(fit, f) for f in footprints[index] if (fit := target.best_fit(f)) is not None]
+                if not fits:
+                    continue
+            (_, row, column), footprint = min(fits, key=lambda fit: fit[0][0])
+            target.place(footprint, row, column)
+            offset = np.array([inset + column * resolution, inset + row * resolution]) - footprint.origin
+            bottom = shapes[index].bounding_box(optimal=False).min.Z
+            location = bd.Location((offset[0], offset[1], -bottom)) * bd.Location((0, 0, 0), (0, 0, footprint.angle))
+            target.plate.placements.append(Placement(shapes[index], index, location, footprint.angle))
+            target.plate._covered += footprint.area
+            break
+    for target in beds:
+        target.plate.placements.sort(key=lambda placement: placement.index)
+    return [target.plate for target in beds]
+
+
+def export_plates(
+    plates: list[Plate],
+    directory: str | Path,
+    name: str = "plate",
+    linear_deflection: float = 0.001,
+    angular_deflection: float = 0.1,
+) -> list[Path]:
+    """
+    Write each plate as a 3MF file, plate-1.3mf, plate-2.3mf and so on.
+
+    Each solid is meshed once, in its own frame, and placed as an instance, so copies of
+    a part and the hooks on them share one mesh, see util.assembly.
+
+    :param plates: The plates from pack.
+    :param directory: Where to write the files.
+    :param name: The start of the file names.
+    :param linear_deflection: The maximum distance between the mesh and the surface.
+    :param angular_deflection: The maximum angle between neighbouring mesh facets, in radians.
+    :return: The paths written, in the order of the plates.
+    """
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    # The solids meshed so far, by their hash, so that every plate shares their meshes.
+    meshes: dict[int, list[tuple[bd.Shape, Mesh]]] = {}
+
+    def mesh_of(prototype: bd.Shape) -> Mesh:
+        known = meshes.setdefault(hash(prototype.wrapped), [])
+        mesh = next((mesh for other, mesh in known if other.wrapped.IsEqual(prototype.wrapped)), None)
+        if mesh is None:
+            mesh = mesh_shape(prototype, linear_deflection, angular_deflection).welded()
+            known.append((prototype, mesh))
+        return mesh
+
+    paths = []
+    for number, plate in enumerate(plates, 1):
+        model = Model3MF()
+        objects: dict[int, int] = {}
+        wholes: dict[tuple, int] = {}
+        for placement in plate.placements:
+            assembly = Assembly.from_shape(placement.shape)
+            components = []
+            for index, location in assembly.instances:
+                mesh = mesh_of(assembly.prototypes[index])
+                if id(mesh) not in objects:
+                    objects[id(mesh)] = model.add_mesh(mesh, assembly.prototypes[index].label or f"part-{len(objects) + 1}")
+                components.append((objects[id(mesh)], location_matrix(location)))
+            matrix = location_matrix(placement.location)
+            if len(components) == 1:
+                model.add_item(components[0][0], matrix @ components[0][1])
+            else:
+                # Copies of the same part become one object placed several times.
+                key = tuple((component, transform.tobytes()) for component, transform in components)
+                if key not in wholes:
+                    wholes[key] = model.add_components(components, placement.shape.label or f"part-{placement.index}")
+                model.add_item(wholes[key], matrix)
+        paths.append(model.write(directory / f"{name}-{number}.3mf"))
+    return paths
@@ -0,0 +1,440 @@
+# Cutting regular perforations into a triangle mesh instead of the BREP.
+#
+# Perforating a wall with a grid of holes is the slowest step of several generators,
+# the boolean has to intersect every hole with the wall. When a part only ends up as
+# an STL the holes can be cut in its mesh instead. The generator runs with its
+# perforations deferred (see pegboard.perforate) and then, for each perforation:
+#
+#   1. The cells whose hole lies inside the face are merged into one rectangle per run
+#      of neighbouring cells along a row. Those few rectangles are cut through the wall
+#      in the BREP, along with the holes clipped by the edge of the face.
+#   2. A single cell of the wall with its hole, a tile, is triangulated once and
+#      placed in every cell, filling the rectangular openings.
+#   3. The tiles are stitched to the mesh of the opened part, and the result is
+#      checked to be watertight.
+#
+# Anything this can't handle raises MeshPathUnavailable: a hole outline which isn't
+# convex, a wall which isn't a flat slab under the grid or a mesh which doesn't close.
+# export_stl then builds the part again with every hole cut in the BREP.
+import contextlib
+import contextvars
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable
+import numpy as np
+import build123d as bd
+from OCP.BRepAdaptor import BRepAdaptor_Curve
+from OCP.GCPnts import GCPnts_QuasiUniformDeflection
+from hello_world.util.boolean import batched_cut
+from hello_world.util.cache import caching_disabled
+from hello_world.util.export import as_shape, export
+from hello_world.util.instance import located
+from hello_world.util.tessellate import Mesh, triangulate, write_stl
+
+# Vertices closer than this, in millimeters, are merged when stitching the mesh.
+WELD_TOLERANCE = 1e-5
+
+
+class MeshPathUnavailable(Exception):
+    """Raised when perforations can't be cut in the mesh, and the part has to be built in the BREP."""
+
+
+@dataclass
+class Perforation:
+    """
+    A grid of identical holes cut through a wall, as made by pegboard.perforate.
+
+    plane (bd.Plane): The plane of the face the grid is laid out on.
+    shape (bd.Sketch): The outline of one hole, around its cell's center.
+    pitch (tuple[float, float]): The size of a cell along the plane's X and Y directions.
+    centers (np.ndarray): An (N, 2) array of the centers of the cells whose hole lies inside the face, local to plane.
+    hole (bd.Part): The extruded hole of the cell at the plane's origin.
+    clipped (list[bd.Part]): The extruded holes crossing the edge of the face, clipped to it.
+    depth (float): How far the holes are extruded.
+    direction (bd.Vector): The direction the holes are extruded in.
+    """
+
+    plane: bd.Plane
+    shape: bd.Sketch
+    pitch: tuple[float, float]
+    centers: np.ndarray
+    hole: bd.Part
+    clipped: list[bd.Part]
+    depth: float
+    direction: bd.Vector
+
+    def holes(self) -> list[bd.Shape]:
+        """Every hole in global coordinates, for cutting in the BREP."""
+        holes = []
+        for x, y in self.centers:
+            # Every cell is a pure translation of the first, which sits at the plane's origin.
+            holes.append(located(self.hole, bd.Pos(self.plane.x_dir * float(x) + self.plane.y_dir * float(y))))
+        return holes + list(self.clipped)
+
+    def runs(self) -> np.ndarray:
+        """
+        Merge the inside cells into rectangles, one per run of neighbouring cells along a row.
+
+        :return: An (R, 4) array of x_min, x_max, y_min, y_max, local to plane.
+        """
+        width, height = self.pitch
+        rows: dict[float, list[float]] = {}
+        for x, y in self.centers:
+            rows.setdefault(round(float(y), 6), []).append(float(x))
+        runs = []
+        for y, xs in rows.items():
+            xs = np.sort(xs)
+            for run in np.split(xs, np.flatnonzero(np.diff(xs) > 1.5 * width) + 1):
+                runs.append((run[0] - width / 2, run[-1] + width / 2, y - height / 2, y + height / 2))
+        return np.array(runs, dtype=float).reshape(-1, 4)
+
+
+_deferred: contextvars.ContextVar[list[Perforation] | None] = contextvars.ContextVar(
+    "deferred_perforations", default=None
+)
+
+
+def defer(perforation: Perforation) -> bool:
+    """
+    Record a perforation instead of cutting it, when called within deferred_perforations.
+
+    :return: Whether the perforation was deferred. If not, the caller cuts it.
+    """
+    deferred = _deferred.get()
+    if deferred is None:
+        return False
+    deferred.append(perforation)
+    return True
+
+
+@contextlib.contextmanager
+def deferred_perforations():
+    """
+    Collect the perforations of the generators called within the block, leaving their parts solid.
+
+    The generators must not move a part after perforating it. Cached results are
+    bypassed, they would be perforated already, and nothing is stored in the cache.
+
+    Yields:
+        list[Perforation]: The perforations, filled in as the generators run.
+    """
+    deferred: list[Perforation] = []
+    token = _deferred.set(deferred)
+    try:
+        with caching_disabled():
+            yield deferred
+    finally:
+        _deferred.reset(token)
+
+
+def _outline(sketch: bd.Sketch, deflection: float) -> np.ndarray:
+    """The outline of a convex hole as an (N, 2) counter-clockwise polygon, in the sketch's coordinates."""
+    faces = sketch.faces()
+    if len(faces) != 1 or faces[0].inner_wires():
+        raise MeshPathUnavailable("the hole isn't a single face without holes of its own")
+    points = []
+    for edge in faces[0].outer_wire().edges():
+        if edge.geom_type == bd.GeomType.LINE:
+            points += [tuple(edge.start_point()), tuple(edge.end_point())]
+            continue
+        sampler = GCPnts_QuasiUniformDeflection(BRepAdaptor_Curve(edge.wrapped), deflection)
+        if not sampler.IsDone():
+            raise MeshPathUnavailable("couldn't discretize the hole's outline")
+        points += [sampler.Value(i).Coord() for i in range(1, sampler.NbPoints() + 1)]
+    points = np.unique(np.round(np.array(points)[:, :2], 9), axis=0)
+    # The outline of a convex hole is its points in order of angle around any point inside it.
+    center = points.mean(axis=0)
+    polygon = points[np.argsort(np.arctan2(points[:, 1] - center[1], points[:, 0] - center[0]))]
+    edges = np.roll(polygon, -1, axis=0) - polygon
+    turns = edges[:, 0] * np.roll(edges, -1, axis=0)[:, 1] - edges[:, 1] * np.roll(edges, -1, axis=0)[:, 0]
+    if np.any(turns <= 0):
+        raise MeshPathUnavailable("the hole isn't convex")
+    return polygon
+
+
+def _cross(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    # The z component of the cross product of 2D vectors, np.cross no longer takes them.
+    return a[..., 0] * b[..., 1] - a[..., 1] * b[..., 0]
+
+
+def _cell_triangles(outer: np.ndarray, hole: np.ndarray) -> np.ndarray:
+    """
+    Triangulate a cell around its hole by ear clipping, adding no vertices.
+
+    :param outer: The cell's corners, counter-clockwise, starting at the +X+Y corner.
+    :param hole: The hole's outline, counter-clockwise and inside the cell.
+    :return: An (N, 3) array of counter-clockwise triangles, indexing outer followed by hole.
+    """
+    points = np.concatenate([outer, hole])
+    n = len(outer)
+    # Join the hole to the cell with an edge from its rightmost, then topmost, vertex to
+    # the +X+Y corner, which nothing can block. Walking the hole clockwise from there
+    # turns the cell and its hole into a single polygon.
+    right = int(np.lexsort((hole[:, 1], hole[:, 0]))[-1])
+    around_hole = [n + (right - i) % len(hole) for i in range(len(hole) + 1)]
+    remaining = [0, *around_hole, 0, *range(1, n)]
+    triangles = []
+    while len(remaining) > 3:
+        count = len(remaining)
+        for k in range(count):
+            a, b, c = remaining[k - 1], remaining[k], remaining[(k + 1) % count]
+            pa, pb, pc = points[a], points[b], points[c]
+            if _cross(pb - pa, pc - pb) <= 1e-12:
+                continue
+            # An ear can't have any other vertex inside it or on its edges.
+            others = points[[i for i in remaining if i not in (a, b, c)]]
+            others = others[~np.any(np.all(np.isclose(others[:, None], np.array([pa, pb, pc])), axis=2), axis=1)]
+            d1 = _cross(pb - pa, others - pa)
+            d2 = _cross(pc - pb, others - pb)
+            d3 = _cross(pa - pc, others - pc)
+            if np.any((d1 >= 0) & (d2 >= 0) & (d3 >= 0)):
+                continue
+            triangles.append((a, b, c))
+            del remaining[k]
+            break
+        else:
+            raise MeshPathUnavailable("couldn't triangulate the cell around the hole")
+    triangles.append(tuple(remaining))
+    return np.array(triangles)
+
+
+def _tile(perforation: Perforation, start: float, end: float, deflection: float) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Mesh the cell at the plane's origin: the wall between start and end with its hole, but no outer sides.
+
+    :return: An (N, 3) array of vertices in global coordinates and an (M, 3) array of triangles facing outwards.
+    """
+    width, height = perforation.pitch
+    hole = _outline(perforation.shape, deflection)
+    if np.any(np.abs(hole) >= (width / 2, height / 2)):
+        raise MeshPathUnavailable("the hole is larger than its cell")
+    outer = np.array([(width / 2, height / 2), (-width / 2, height / 2), (-width / 2, -height / 2), (width / 2, -height / 2)])
+    ring = _cell_triangles(outer, hole)
+    points = np.concatenate([outer, hole])
+    corners = points[ring]
+    areas = _cross(corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0]) / 2
+    hole_area = np.sum(hole[:, 0] * np.roll(hole[:, 1], -1) - np.roll(hole[:, 0], -1) * hole[:, 1]) / 2
+    if np.any(areas <= 0) or not np.isclose(areas.sum(), width * height - hole_area, rtol=1e-9):
+        raise MeshPathUnavailable("couldn't triangulate the cell around the hole")
+
+    k = len(points)
+    sides = []
+    for a in range(len(outer), k):
+        b = len(outer) + (a - len(outer) + 1) % len(hole)
+        sides += [(a, b, k + b), (a, k + b, k + a)]
+    triangles = np.concatenate([ring, ring + k, np.array(sides)])
+
+    plane = perforation.plane
+    direction = np.array(tuple(perforation.direction.normalized()))
+    x_dir, y_dir = np.array(tuple(plane.x_dir)), np.array(tuple(plane.y_dir))
+    origin = np.array(tuple(plane.origin))
+    flat = origin + points[:, :1] * x_dir + points[:, 1:] * y_dir
+    level = origin @ direction
+    vertices = np.concatenate([flat + (start - level) * direction, flat + (end - level) * direction])
+
+    # Face the top against the direction, the bottom along it and the sides into the hole.
+    corners = vertices[triangles]
+    normals = np.cross(corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0])
+    centroids = corners.mean(axis=1) - origin
+    radial = centroids - np.outer(centroids @ direction, direction)
+    outward = np.concatenate([
+        np.tile(-direction, (len(ring), 1)),
+        np.tile(direction, (len(ring), 1)),
+        -radial[2 * len(ring) :],
+    ])  # fmt: skip
+    flip = np.einsum("ij,ij->i", normals, outward) < 0
+    triangles[flip] = triangles[flip][:, ::-1]
+    return vertices, triangles
+
+
+def _on_run_sides(
+    vertices: np.ndarray, triangles: np.ndarray, perforation: Perforation, runs: np.ndarray, start: float, end: float
+) -> np.ndarray:
+    """Which triangles lie on the sides of the rectangular openings, where the tiles will go."""
+    plane = perforation.plane
+    direction = np.array(tuple(perforation.direction.normalized()))
+    corners = vertices[triangles]
+    normals = np.cross(corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0])
+    lengths = np.linalg.norm(normals, axis=1)
+    along = np.abs(normals @ direction) / np.where(lengths > 0, lengths, 1)
+    levels = corners @ direction
+    candidates = np.flatnonzero(
+        (along < 1e-6) & np.all(levels >= start - WELD_TOLERANCE, axis=1) & np.all(levels <= end + WELD_TOLERANCE, axis=1)
+    )
+    centroids = corners[candidates].mean(axis=1) - np.array(tuple(plane.origin))
+    u = (centroids @ np.array(tuple(plane.x_dir)))[:, None]
+    v = (centroids @ np.array(tuple(plane.y_dir)))[:, None]
+    x0, x1, y0, y1 = (runs[:, i] for i in range(4))
+    tolerance = WELD_TOLERANCE
+    within = (u >= x0 - tolerance) & (u <= x1 + tolerance) & (v >= y0 - tolerance) & (v <= y1 + tolerance)
+    on_edge = (np.abs(u - x0) < tolerance) | (np.abs(u - x1) < tolerance) | (np.abs(v - y0) < tolerance) | (np.abs(v - y1) < tolerance)
+    sides = np.zeros(len(triangles), dtype=bool)
+    sides[candidates] = np.any(within & on_edge, axis=1)
+    return sides
+
+
+def _weld(vertices: np.ndarray, triangles: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Merge coincident vertices and drop the triangles which collapse."""
+    keys = np.round(vertices / WELD_TOLERANCE).astype(np.int64)
+    _, first, inverse = np.unique(keys, axis=0, return_index=True, return_inverse=True)
+    triangles = inverse.reshape(-1)[triangles]
+    collapsed = (triangles[:, 0] == triangles[:, 1]) | (triangles[:, 1] == triangles[:, 2]) | (triangles[:, 2] == triangles[:, 0])
+    return vertices[first], triangles[~collapsed]
+
+
+def _edges(triangles: np.ndarray) -> np.ndarray:
+    # The directed edges of each triangle, edge k runs from corner k to corner k + 1.
+    return np.stack([triangles[:, [0, 1]], triangles[:, [1, 2]], triangles[:, [2, 0]]], axis=1).reshape(-1, 2)
+
+
+def _edge_keys(edges: np.ndarray, directed: bool = False) -> np.ndarray:
+    # One integer per edge, much faster to sort than rows of vertex indices.
+    if not directed:
+        edges = np.sort(edges, axis=1)
+    return edges[:, 0].astype(np.int64) * (int(edges.max(initial=0)) + 1) + edges[:, 1]
+
+
+def _boundary(triangles: np.ndarray) -> np.ndarray:
+    """The indices into _edges(triangles) of the edges used by a single triangle."""
+    _, inverse, counts = np.unique(_edge_keys(_edges(triangles)), return_inverse=True, return_counts=True)
+    return np.flatnonzero(counts[inverse] == 1)
+
+
+def _close_t_junctions(vertices: np.ndarray, triangles: np.ndarray, rounds: int = 8) -> np.ndarray:
+    """
+    Split triangles along open edges which other vertices lie on.
+
+    Where a tile meets the opened part, one side's edge can run past a vertex of the
+    other side. Splitting the triangle at that vertex makes the edges match up.
+    """
+    for _ in range(rounds):
+        edges = _edges(triangles)
+        boundary = _boundary(triangles)
+        if not len(boundary):
+            break
+        candidates = np.unique(edges[boundary])
+        points = vertices[candidates]
+        splits: dict[int, tuple[int, np.ndarray]] = {}
+        for index in boundary:
+            triangle = index // 3
+            if triangle in splits:
+                continue
+            a, b = vertices[edges[index]]
+            span = b - a
+            t = (points - a) @ span / (span @ span)
+            distance = np.linalg.norm(points - (a + t[:, None] * span), axis=1)
+            on_edge = (t > 1e-9) & (t < 1 - 1e-9) & (distance < WELD_TOLERANCE)
+            if on_edge.any():
+                splits[triangle] = (index % 3, candidates[on_edge][np.argsort(t[on_edge])])
+        if not splits:
+            break
+        fans = []
+        for triangle, (k, inserted) in splits.items():
+            corners = triangles[triangle]
+            chain = [corners[k], *inserted, corners[(k + 1) % 3]]
+            fans += [(chain[i], chain[i + 1], corners[(k + 2) % 3]) for i in range(len(chain) - 1)]
+        triangles = np.concatenate([np.delete(triangles, list(splits), axis=0), np.array(fans)])
+    return triangles
+
+
+def is_watertight(triangles: np.ndarray) -> bool:
+    """Whether every edge is shared by exactly two triangles, running opposite ways."""
+    edges = _edges(triangles)
+    undirected = np.unique(_edge_keys(edges), return_counts=True)[1]
+    return bool(np.all(undirected == 2)) and len(np.unique(_edge_keys(edges, directed=True))) == len(edges)
+
+
+def perforated_mesh(
+    shape: bd.Shape, perforations: list[Perforation], deflection: float, angular_tolerance: float
+) -> Mesh:
+    """
+    Mesh a part and cut deferred perforations into the mesh.
+
+    :param shape: The part, built within deferred_perforations.
+    :param perforations: The perforations collected while building it.
+    :param deflection: The maximum distance between the mesh and the surface.
+    :param angular_tolerance: The maximum angle between neighbouring facets, in radians.
+    :return: A watertight mesh.
+    :raises MeshPathUnavailable: When a perforation has to be cut in the BREP.
+    """
+    tools = []
+    walls = []
+    for perforation in perforations:
+        direction = perforation.direction.normalized()
+        if abs(abs(direction.dot(perforation.plane.z_dir)) - 1) > 1e-9:
+            raise MeshPathUnavailable("the holes aren't square to the face")
+        runs = perforation.runs()
+        tools += perforation.clipped
+        if not len(runs):
+            continue
+        openings = [
+            bd.extrude(
+                perforation.plane * bd.Pos((x0 + x1) / 2, (y0 + y1) / 2) * bd.Rectangle(x1 - x0, y1 - y0),
+                perforation.depth,
+                dir=direction,
+            )
+            for x0, x1, y0, y1 in runs
+        ]
+        # The material the openings remove has to be a flat slab for the tiles to replace it.
+        wall = shape & bd.Compound(openings)
+        levels = np.array([tuple(v) for v in wall.vertices()]) @ np.array(tuple(direction))
+        start, end = float(levels.min()), float(levels.max())
+        area = float(np.sum((runs[:, 1] - runs[:, 0]) * (runs[:, 3] - runs[:, 2])))
+        if not np.isclose(wall.volume, area * (end - start), rtol=1e-6):
+            raise MeshPathUnavailable("the wall under the holes isn't a flat slab")
+        tools += openings
+        walls.append((perforation, runs, start, end))
+
+    opened = batched_cut(shape, tools).shape if tools else shape
+    vertices, triangles = triangulate(opened, deflection, angular_tolerance)
+    keep = np.ones(len(triangles), dtype=bool)
+    for perforation, runs, start, end in walls:
+        keep &= ~_on_run_sides(vertices, triangles, perforation, runs, start, end)
+    all_vertices = [vertices]
+    all_triangles = [triangles[keep]]
+    count = len(vertices)
+    for perforation, runs, start, end in walls:
+        tile_vertices, tile_triangles = _tile(perforation, start, end, deflection)
+        plane = perforation.plane
+        offsets = perforation.centers @ np.array([tuple(plane.x_dir), tuple(plane.y_dir)])
+        all_vertices.append((tile_vertices[None, :, :] + offsets[:, None, :]).reshape(-1, 3))
+        instances = np.arange(len(offsets))[:, None, None] * len(tile_vertices)
+        all_triangles.append((tile_triangles[None, :, :] + instances + count).reshape(-1, 3))
+        count += len(offsets) * len(tile_vertices)
+
+    vertices, triangles = _weld(np.concatenate(all_vertices), np.concatenate(all_triangles))
+    triangles = _close_t_junctions(vertices, triangles)
+    if not is_watertight(triangles):
+        raise MeshPathUnavailable("the perforated mesh isn't watertight")
+    return Mesh(vertices.astype(np.float32), triangles.astype(np.uint32))
+
+
+def export_stl(
+    generator: Callable[..., Any],
+    params: dict[str, Any],
+    path: str | Path,
+    linear_deflection: float = 0.001,
+    angular_deflection: float = 0.1,
+) -> Path:
+    """
+    Build a part and write it as STL, cutting its perforations in the mesh where possible.
+
+    Falls back to building the part normally, with every hole cut in the BREP, when the
+    mesh path can't handle one of its perforations.
+
+    :param generator: The part generator, see generators.GENERATORS.
+    :param params: The keyword arguments for the generator.
+    :param path: The .stl file to write.
+    :param linear_deflection: The maximum distance between the mesh and the surface.
+    :param angular_deflection: The maximum angle between neighbouring facets in radians.
+    :return: The path written.
+    """
+    with deferred_perforations() as perforations:
+        result = generator(**params)
+    if perforations:
+        try:
+            mesh = perforated_mesh(as_shape(result), perforations, linear_deflection, angular_deflection)
+            return write_stl(mesh, path)
+        except MeshPathUnavailable:
+            result = generator(**params)
+    return export(result, path, linear_deflection, angular_deflection)
@@ -1,4 +1,57 @@
+from typing import Iterator, overload
+import numpy as np
 import build123d as bd
+from hello_world.util.surface import edge_frames, frame_locations
+
+
+class LocationArray:
+    """
+    A compact list of locations which share an orientation.
+
+    The positions are stored as an (N, 3) NumPy array so that large patterns can be
+    generated and transformed in a single pass. Each position is only converted into a
+    bd.Location when the array is iterated or indexed.
+
+    :param positions: An (N, 3) array of positions.
+    :param orientation: The orientation shared by every location. Defaults to no rotation.
+    """
+
+    def __init__(self, positions: np.ndarray, orientation: bd.Location | None = None):
+        self.positions = np.asarray(positions, dtype=float).reshape(-1, 3)
+        self.orientation = orientation if orientation is not None else bd.Location()
+
+    def __len__(self) -> int:
+        return len(self.positions)
+
+    @overload
+    def __getitem__(self, index: int) -> bd.Location: ...
+
+    @overload
+    def __getitem__(self, index: slice | np.ndarray) -> "LocationArray": ...
+
+    def __getitem__(self, index):
+        # A slice or mask selects a smaller array, still without creating any locations.
+        if isinstance(index, (int, np.integer)):
+            return bd.Location(tuple(self.positions[index])) * self.orientation
+        return LocationArray(self.positions[index], self.orientation)
+
+    def __iter__(self) -> Iterator[bd.Location]:
+        for position in self.positions:
+            yield bd.Location(tuple(position)) * self.orientation
+
+    def moved(self, loc: bd.Location | bd.Plane) -> "LocationArray":
+        """
+        Transform every location by loc, as ``loc * location`` would.
+
+        :param loc: The location or plane to transform by.
+        :return: A new LocationArray.
+        """
+        plane = loc if isinstance(loc, bd.Plane) else bd.Plane(loc)
+        rotation = np.array([tuple(plane.x_dir), tuple(plane.y_dir), tuple(plane.z_dir)]).T
+        positions = self.positions @ rotation.T + np.array(tuple(plane.origin))
+        orientation = bd.Location(bd.Plane((0, 0, 0), x_dir=plane.x_dir, z_dir=plane.z_dir)) * self.orientation
+        return LocationArray(positions, orientation)
+
 
 def locations_on_face_edge(face: bd.Face, edge: bd.Wire, spacing: float) -> bd.LocationList:
     """
@@ -10,14 +63,11 @@ def locations_on_face_edge(face: bd.Face, edge: bd.Wire, spacing: float) -> bd.L
     :return: A list of locations along the edge of the face.
     """
     len = edge.length
-    # Generate some points along the edges
-    points = edge.positions(distances=[i for i in range(0, int(len), int(spacing))], position_mode=bd.PositionMode.LENGTH)
+    # Generate some points along the edges, along with the face's normal at each
+    distances = [i for i in range(0, int(len), int(spacing))]
+    points, normals = edge_frames(face, edge, distances, position_mode=bd.PositionMode.LENGTH)
     # Generate planes at each point normal to the face.
-    ret = []
-    for point in points:
-        plane = bd.Plane(origin=point, z_dir=face.normal_at(point))
-        ret.append(plane.location)
-    return bd.LocationList(ret)
+    return bd.LocationList(frame_locations(points, normals))
 
 #cylinder = bd.Cylinder(radius=30, height=50)
 #face = cylinder.faces().sort_by(bd.Axis.Z)[1]
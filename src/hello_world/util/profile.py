@@ -0,0 +1,462 @@
+# Opt-in profiling of the expensive build123d operations our generators call.
+#
+# While a profile is active, fillet, hollow, offset, sweep, loft and the boolean
+# operations behind -, + and & are wrapped so that every call records where it was
+# called from, how long it took and the size of the topology going in and coming out.
+# Calls are nested under the functions in this package they were made from, e.g.
+# rounded_bin > perforate > cut. A function's span runs from the first to the last
+# operation it made, so time spent outside of the wrapped operations isn't counted.
+#
+#     with profiling() as profile:
+#         rounded_bin(300, 100, 40)
+#     print(profile.report())
+#     profile.write_speedscope("rounded_bin.speedscope.json")
+#
+# Setting HELLO_WORLD_PROFILE to a directory profiles the whole process instead. At
+# exit a call tree is printed to stderr, and profile-<pid>.trace.json (for
+# chrome://tracing or Perfetto) and profile-<pid>.speedscope.json are written there.
+import atexit
+import contextlib
+import functools
+import json
+import os
+import sys
+import threading
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from types import FrameType
+from typing import Any, Callable, Iterator
+import build123d as bd
+from OCP.TopAbs import TopAbs_EDGE, TopAbs_FACE, TopAbs_SOLID
+from OCP.TopExp import TopExp
+
+try:
+    from OCP.TopTools import TopTools_IndexedMapOfShape
+except ImportError:
+    # OCP 7.8 and later only expose the NCollection template instance.
+    from OCP.collections import IndexedMap_TopoDS_Shape_TopTools_ShapeMapHasher as TopTools_IndexedMapOfShape
+
+PACKAGE = "hello_world"
+
+# Modules of ours whose frames are left out of the call tree, they only wrap generators.
+HIDDEN = {__name__, PACKAGE + ".util.cache"}
+
+# Methods to wrap, found on the first class in each type's MRO which defines them.
+METHODS: dict[str, tuple[type, ...]] = {
+    "fillet": (bd.Solid,),
+    "fillet_2d": (bd.Face, bd.Wire),
+    "hollow": (bd.Solid,),
+    "offset_3d": (bd.Solid,),
+    "offset_2d": (bd.Wire,),
+    "sweep": (bd.Solid, bd.Face),
+    "make_loft": (bd.Solid,),
+    "_bool_op": (bd.Shape,),
+}
+
+# Algebra and builder functions to wrap, on the build123d namespace and their own module.
+FUNCTIONS = ("fillet", "offset", "sweep", "loft")
+
+_lock = threading.Lock()
+_active: list["Profile"] = []
+_originals: list[tuple[Any, str, Any]] = []
+
+
+@dataclass
+class Span:
+    """
+    One call to a wrapped operation, or a function in this package that made such calls.
+
+    name (str): The operation, e.g. "fillet" or "cut", or the function's qualified name.
+    kind (str): "operation" or "function".
+    location (str): file:line of the call site, or of the function's definition.
+    start (float): Seconds since the profile started.
+    end (float): Seconds since the profile started.
+    inputs (tuple[int, int, int] | None): Solids, faces and edges of the shapes passed in.
+    outputs (tuple[int, int, int] | None): Solids, faces and edges of the result.
+    failed (bool): Whether the operation raised.
+    children (list[Span]): Calls made within this one.
+    """
+
+    name: str
+    kind: str
+    location: str
+    start: float
+    end: float = 0.0
+    inputs: tuple[int, int, int] | None = None
+    outputs: tuple[int, int, int] | None = None
+    failed: bool = False
+    children: list["Span"] = field(default_factory=list)
+    frame: FrameType | None = field(default=None, repr=False)
+
+    @property
+    def seconds(self) -> float:
+        return self.end - self.start
+
+
+def topology_size(value: Any) -> tuple[int, int, int] | None:
+    """Count the distinct solids, faces and edges of the shapes in value."""
+    shapes = []
+    stack = [value]
+    while stack:
+        item = stack.pop()
+        if isinstance(item, bd.Shape):
+            if item.wrapped is not None:
+                shapes.append(item.wrapped)
+        elif isinstance(item, (list, tuple)):
+            stack.extend(item)
+    if not shapes:
+        return None
+    counts = []
+    for kind in (TopAbs_SOLID, TopAbs_FACE, TopAbs_EDGE):
+        found = TopTools_IndexedMapOfShape()
+        for shape in shapes:
+            TopExp.MapShapes_s(shape, kind, found)
+        counts.append(found.Size())
+    return tuple(counts)
+
+
+def _location(frame: FrameType) -> str:
+    return f"{frame.f_code.co_filename}:{frame.f_lineno}"
+
+
+def _is_library(frame: FrameType) -> bool:
+    module = frame.f_globals.get("__name__", "")
+    return module == __name__ or module == "build123d" or module.startswith("build123d.")
+
+
+def _is_ours(frame: FrameType) -> bool:
+    module = frame.f_globals.get("__name__", "")
+    return (module == PACKAGE or module.startswith(PACKAGE + ".")) and module not in HIDDEN
+
+
+class Profile:
+    """The spans recorded while a profile was active, one tree per thread."""
+
+    def __init__(self):
+        self.origin = time.perf_counter()
+        self.roots: dict[int, list[Span]] = {}
+        self._open: dict[int, list[Span]] = {}
+
+    def _now(self) -> float:
+        return time.perf_counter() - self.origin
+
+    def _enter(self, name: str, caller: FrameType, inputs) -> Span:
+        thread = threading.get_ident()
+        stack = self._open.setdefault(thread, [])
+        now = self._now()
+        if not stack or stack[-1].kind == "function":
+            # Line the open function spans up with the functions of ours on the call stack.
+            frames = []
+            frame = caller
+            while frame is not None:
+                if _is_ours(frame):
+                    frames.append(frame)
+                frame = frame.f_back
+            frames.reverse()
+            depth = 0
+            while depth < len(stack) and depth < len(frames) and stack[depth].frame is frames[depth]:
+                depth += 1
+            for span in stack[depth:]:
+                span.frame = None
+            del stack[depth:]
+            for frame in frames[depth:]:
+                definition = f"{frame.f_code.co_filename}:{frame.f_code.co_firstlineno}"
+                span = Span(frame.f_code.co_qualname, "function", definition, now, now, frame=frame)
+                self._push(thread, stack, span)
+        span = Span(name, "operation", _location(caller), now, inputs=inputs)
+        self._push(thread, stack, span)
+        return span
+
+    def _push(self, thread: int, stack: list[Span], span: Span):
+        (stack[-1].children if stack else self.roots.setdefault(thread, [])).append(span)
+        stack.append(span)
+
+    def _exit(self, span: Span, outputs, failed: bool, clock: float):
+        stack = self._open[threading.get_ident()]
+        now = clock - self.origin
+        span.end = now
+        span.outputs = outputs
+        span.failed = failed
+        stack.remove(span)
+        for parent in stack:
+            if parent.kind == "function":
+                parent.end = now
+
+    def _close(self):
+        for stack in self._open.values():
+            for span in stack:
+                span.frame = None
+        self._open.clear()
+
+    def spans(self) -> Iterator[tuple[int, Span, int]]:
+        """Every span as (thread, span, depth), depth first."""
+        for thread, roots in self.roots.items():
+            stack = [(span, 0) for span in reversed(roots)]
+            while stack:
+                span, depth = stack.pop()
+                yield thread, span, depth
+                stack.extend((child, depth + 1) for child in reversed(span.children))
+
+    def report(self, min_seconds: float = 0.0) -> str:
+        """
+        Format the spans as a call tree. Repeated calls from the same place are merged.
+
+        :param min_seconds: Leave out calls which took less than this in total.
+        :return: The call tree, one call per line, indented by depth.
+        """
+        lines = [f"{'total':>9} {'self':>9} {'calls':>6}  {'solids/faces/edges in -> out':<30}  call"]
+        for thread, roots in self.roots.items():
+            if len(self.roots) > 1:
+                lines.append(f"thread {thread}")
+            self._report(_merge(roots), 0, min_seconds, lines)
+        return "\n".join(lines)
+
+    def _report(self, nodes: list["_Node"], depth: int, min_seconds: float, lines: list[str]):
+        for node in sorted(nodes, key=lambda n: -n.seconds):
+            if node.seconds < min_seconds:
+                continue
+            sizes = ""
+            if node.inputs or node.outputs:
+                sizes = f"{_format_size(node.inputs)} -> {_format_size(node.outputs)}"
+            failed = f" ({node.failed} failed)" if node.failed else ""
+            lines.append(
+                f"{node.seconds:8.3f}s {node.self_seconds:8.3f}s {node.calls:6}  {sizes:<30}  "
+                f"{'  ' * depth}{node.name}{failed}  {node.location}"
+            )
+            self._report(node.children, depth + 1, min_seconds, lines)
+
+    def chrome_trace(self) -> dict:
+        """The spans in the Chrome trace event format, for chrome://tracing, Perfetto or speedscope."""
+        events = []
+        for thread, span, _ in self.spans():
+            args = {"location": span.location}
+            if span.inputs:
+                args["in"] = _format_size(span.inputs)
+            if span.outputs:
+                args["out"] = _format_size(span.outputs)
+            if span.failed:
+                args["failed"] = True
+            events.append(
+                {
+                    "name": span.name,
+                    "cat": span.kind,
+                    "ph": "X",
+                    "ts": span.start * 1e6,
+                    "dur": span.seconds * 1e6,
+                    "pid": os.getpid(),
+                    "tid": thread,
+                    "args": args,
+                }
+            )
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def speedscope(self, name: str = PACKAGE) -> dict:
+        """The spans as an evented speedscope profile, one profile per thread."""
+        frames: list[dict] = []
+        indices: dict[tuple[str, str], int] = {}
+        profiles = []
+        for thread, roots in self.roots.items():
+            events = []
+
+            def visit(span: Span):
+                key = (span.name, span.location)
+                if key not in indices:
+                    indices[key] = len(frames)
+                    file, _, line = span.location.rpartition(":")
+                    frames.append({"name": span.name, "file": file, "line": int(line)})
+                events.append({"type": "O", "frame": indices[key], "at": span.start})
+                for child in span.children:
+                    visit(child)
+                events.append({"type": "C", "frame": indices[key], "at": span.end})
+
+            for root in roots:
+                visit(root)
+            profiles.append(
+                {
+                    "type": "evented",
+                    "name": f"{name} thread {thread}",
+                    "unit": "seconds",
+                    "startValue": roots[0].start if roots else 0.0,
+                    "endValue": max((r.end for r in roots), default=0.0),
+                    "events": events,
+                }
+            )
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "shared": {"frames": frames},
+            "profiles": profiles,
+            "name": name,
+            "exporter": PACKAGE,
+        }
+
+    def write_chrome_trace(self, path: str | Path) -> Path:
+        path = Path(path)
+        path.write_text(json.dumps(self.chrome_trace()))
+        return path
+
+    def write_speedscope(self, path: str | Path) -> Path:
+        path = Path(path)
+        path.write_text(json.dumps(self.speedscope(path.name)))
+        return path
+
+
+@dataclass
+class _Node:
+    name: str
+    location: str
+    calls: int = 0
+    failed: int = 0
+    seconds: float = 0.0
+    child_seconds: float = 0.0
+    inputs: tuple[int, int, int] | None = None
+    outputs: tuple[int, int, int] | None = None
+    children: list["_Node"] = field(default_factory=list)
+
+    @property
+    def self_seconds(self) -> float:
+        return max(0.0, self.seconds - self.child_seconds)
+
+
+def _merge(spans: list[Span]) -> list[_Node]:
+    nodes: dict[tuple[str, str], _Node] = {}
+    children: dict[tuple[str, str], list[Span]] = {}
+    for span in spans:
+        key = (span.name, span.location)
+        node = nodes.setdefault(key, _Node(span.name, span.location))
+        node.calls += 1
+        node.failed += span.failed
+        node.seconds += span.seconds
+        node.child_seconds += sum(c.seconds for c in span.children)
+        # Keep the largest call's sizes, that is usually the one worth looking at.
+        if span.inputs and (node.inputs is None or span.inputs[1] > node.inputs[1]):
+            node.inputs = span.inputs
+            node.outputs = span.outputs
+        elif node.inputs is None and span.outputs:
+            node.outputs = span.outputs
+        children.setdefault(key, []).extend(span.children)
+    for key, node in nodes.items():
+        node.children = _merge(children[key])
+    return list(nodes.values())
+
+
+def _format_size(size: tuple[int, int, int] | None) -> str:
+    return "-" if size is None else "/".join(str(n) for n in size)
+
+
+def _operation_name(name: str, args: tuple) -> str:
+    if name == "_bool_op" and len(args) >= 4:
+        # Shape._bool_op(self, args, tools, operation), name it after the operation, e.g. BRepAlgoAPI_Cut -> cut.
+        return type(args[3]).__name__.removeprefix("BRepAlgoAPI_").lower()
+    return name
+
+
+def _wrap(function: Callable, name: str, skip_first: bool = False) -> Callable:
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        profiles = list(_active)
+        if not profiles:
+            return function(*args, **kwargs)
+        caller = sys._getframe(1)
+        # Skip over build123d and other wrappers, e.g. bd.fillet calling Solid.fillet, to find the real call site.
+        while caller.f_back is not None and _is_library(caller):
+            caller = caller.f_back
+        shapes = args[1:] if skip_first else args
+        if name == "_bool_op":
+            shapes = args[1:3]
+        inputs = topology_size(list(shapes) + list(kwargs.values()))
+        label = _operation_name(name, args)
+        spans = [p._enter(label, caller, inputs) for p in profiles]
+        try:
+            result = function(*args, **kwargs)
+        except BaseException:
+            now = time.perf_counter()
+            for profile, span in zip(profiles, spans):
+                profile._exit(span, None, True, now)
+            raise
+        # Stop the clock before counting the result.
+        now = time.perf_counter()
+        outputs = topology_size(result)
+        for profile, span in zip(profiles, spans):
+            profile._exit(span, outputs, False, now)
+        return result
+
+    return wrapper
+
+
+def _install():
+    import build123d
+
+    for method, types in METHODS.items():
+        owners = {next(k for k in cls.__mro__ if method in k.__dict__) for cls in types}
+        for owner in owners:
+            original = owner.__dict__[method]
+            if isinstance(original, classmethod):
+                replacement = classmethod(_wrap(original.__func__, method, skip_first=True))
+            else:
+                replacement = _wrap(original, method)
+            _originals.append((owner, method, original))
+            setattr(owner, method, replacement)
+    for name in FUNCTIONS:
+        original = getattr(build123d, name)
+        replacement = _wrap(original, name)
+        for module in {build123d, sys.modules[original.__module__]}:
+            _originals.append((module, name, getattr(module, name)))
+            setattr(module, name, replacement)
+
+
+def _uninstall():
+    while _originals:
+        owner, name, original = _originals.pop()
+        setattr(owner, name, original)
+
+
+def start() -> Profile:
+    """Start a profile, wrapping the operations if no other profile is active."""
+    profile = Profile()
+    with _lock:
+        if not _active:
+            _install()
+        _active.append(profile)
+    return profile
+
+
+def stop(profile: Profile) -> Profile:
+    """Stop a profile started with start, unwrapping the operations if it was the last one."""
+    with _lock:
+        _active.remove(profile)
+        if not _active:
+            _uninstall()
+    profile._close()
+    return profile
+
+
+@contextlib.contextmanager
+def profiling() -> Iterator[Profile]:
+    """Profile the operations called within the block."""
+    profile = start()
+    try:
+        yield profile
+    finally:
+        stop(profile)
+
+
+def profile_from_env():
+    """Profile the whole process when HELLO_WORLD_PROFILE is set to a directory."""
+    directory = os.environ.get("HELLO_WORLD_PROFILE")
+    if not directory or directory == "0":
+        return
+    profile = start()
+
+    def write():
+        stop(profile)
+        if not profile.roots:
+            return
+        out = Path(directory)
+        out.mkdir(parents=True, exist_ok=True)
+        trace = profile.write_chrome_trace(out / f"profile-{os.getpid()}.trace.json")
+        speedscope = profile.write_speedscope(out / f"profile-{os.getpid()}.speedscope.json")
+        print(profile.report(), file=sys.stderr)
+        print(f"Wrote {trace} and {speedscope}", file=sys.stderr)
+
+    atexit.register(write)
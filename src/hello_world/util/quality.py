@@ -0,0 +1,63 @@
+# Draft and full quality builds.
+#
+# Working out a layout, such as the width of a shelf or the depth of a bin, doesn't
+# need the features that take most of a build: hook sweeps and lofts, perforations,
+# fillets and threads. In draft quality the generators replace these with simple
+# proxies that fill the same space, or leave them out:
+#
+#   hooks         an L shaped block around the hook, see skadis_hook.hook_prototype
+#   perforations  not cut, see pegboard.perforate, SkadisShelf's slots and snippets.hexify
+#   fillets       skipped, see util.fillet
+#   threads       a tube between the root and crest radii, see util.thread.iso_thread
+#   hex grids     the outline of the grid, without the holes, see desk_cable.hex_lattice_face
+#
+# Full quality is the default and what exports should use. The quality is part of
+# every generator's cache key, so draft and full results are stored side by side.
+# Work sent to other processes with sweep.run_in_pool, such as sweep, catalog and
+# benchmark builds, runs at the quality of the block it was started from.
+#
+#     with draft():
+#         shelf = make_shelf(4, 100)
+#
+# Environment variables:
+#     HELLO_WORLD_QUALITY: set to "draft" to build in draft quality, unless a block overrides it.
+import contextlib
+import contextvars
+import enum
+import os
+
+
+class Quality(enum.Enum):
+    FULL = "full"
+    DRAFT = "draft"
+
+
+# Set by build_quality, overriding the environment on this thread.
+_quality: contextvars.ContextVar[Quality | None] = contextvars.ContextVar("quality", default=None)
+
+
+def quality() -> Quality:
+    """The quality generators should build at."""
+    override = _quality.get()
+    if override is not None:
+        return override
+    return Quality(os.environ.get("HELLO_WORLD_QUALITY", Quality.FULL.value).lower())
+
+
+def is_draft() -> bool:
+    return quality() == Quality.DRAFT
+
+
+@contextlib.contextmanager
+def build_quality(level: Quality | str):
+    """Build every generator called within the block at the given quality, on this thread."""
+    token = _quality.set(Quality(level))
+    try:
+        yield
+    finally:
+        _quality.reset(token)
+
+
+def draft():
+    """Build every generator called within the block in draft quality, on this thread."""
+    return build_quality(Quality.DRAFT)
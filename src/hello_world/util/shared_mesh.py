@@ -0,0 +1,126 @@
+# Meshes passed from worker processes to the parent through shared memory.
+#
+# Sending a built part back from a worker pickles its BREP, and the parent then reads
+# it and meshes it all over again before it can write an STL. Instead the worker
+# meshes the part and copies the vertex, normal and triangle arrays into one
+# multiprocessing.shared_memory segment, and only a small MeshHandle naming the
+# segment is pickled. The parent maps the segment and uses the arrays in place, as
+# NumPy views, so receiving a mesh costs no more than the memory it occupies.
+#
+# The segment is unlinked as soon as the parent maps it, its memory is released once
+# the parent closes it, or at the latest when the parent exits.
+#
+#     handle = share(tessellate(part))           # in the worker
+#     with SharedMesh(handle) as shared:         # in the parent
+#         write_stl(shared.mesh, "part.stl")
+from dataclasses import dataclass
+from multiprocessing import shared_memory
+import numpy as np
+from hello_world.util.tessellate import Mesh
+
+# Each array starts on a multiple of this many bytes.
+_ALIGNMENT = 64
+
+
+@dataclass(frozen=True)
+class MeshHandle:
+    """
+    A mesh left in shared memory by share, small enough to send between processes.
+
+    segment (str): The name of the shared memory segment.
+    vertex_count (int): The number of vertices.
+    triangle_count (int): The number of triangles.
+    label (str): The label of the shape the mesh was made from.
+    """
+
+    segment: str
+    vertex_count: int
+    triangle_count: int
+    label: str = ""
+
+    def _layout(self) -> list[tuple[str, tuple[int, int], type, int]]:
+        # The name, shape, dtype and byte offset of each array in the segment.
+        layout = []
+        offset = 0
+        for name, count, dtype in (
+            ("vertices", self.vertex_count, np.float32),
+            ("normals", self.vertex_count, np.float32),
+            ("triangles", self.triangle_count, np.uint32),
+        ):
+            layout.append((name, (count, 3), dtype, offset))
+            offset += -(-count * 3 * np.dtype(dtype).itemsize // _ALIGNMENT) * _ALIGNMENT
+        return layout
+
+    @property
+    def nbytes(self) -> int:
+        """The size of the segment."""
+        name, shape, dtype, offset = self._layout()[-1]
+        return max(offset + shape[0] * 3 * np.dtype(dtype).itemsize, 1)
+
+
+def share(mesh: Mesh, label: str = "") -> MeshHandle:
+    """
+    Copy a mesh and its vertex normals into a new shared memory segment.
+
+    The segment outlives this process, it belongs to whichever process opens the
+    handle with SharedMesh.
+
+    :param mesh: The mesh to share.
+    :param label: A label to send along with the mesh.
+    :return: The handle to send to the parent.
+    """
+    arrays = {"vertices": mesh.vertices, "normals": mesh.normals(), "triangles": mesh.triangles}
+    size = MeshHandle("", len(mesh.vertices), len(mesh.triangles)).nbytes
+    segment = shared_memory.SharedMemory(create=True, size=size)
+    handle = MeshHandle(segment.name, len(mesh.vertices), len(mesh.triangles), label)
+    try:
+        for name, shape, dtype, offset in handle._layout():
+            np.ndarray(shape, dtype, segment.buf, offset)[:] = arrays[name]
+    except BaseException:
+        segment.close()
+        segment.unlink()
+        raise
+    segment.close()
+    return handle
+
+
+class SharedMesh:
+    """
+    A mesh mapped from shared memory, its arrays are views of the segment and aren't copied.
+
+    Close it, or use it as a context manager, once done with the arrays. Arrays taken
+    from it must not be used after it is closed.
+
+    :param handle: The handle returned by share in another process.
+    """
+
+    def __init__(self, handle: MeshHandle):
+        self.handle = handle
+        self._segment = shared_memory.SharedMemory(handle.segment)
+        # The mapping keeps the memory alive, so the name is no longer needed.
+        self._segment.unlink()
+        arrays = {
+            name: np.ndarray(shape, dtype, self._segment.buf, offset) for name, shape, dtype, offset in handle._layout()
+        }
+        self.vertices: np.ndarray = arrays["vertices"]
+        self.normals: np.ndarray = arrays["normals"]
+        self.triangles: np.ndarray = arrays["triangles"]
+
+    @property
+    def mesh(self) -> Mesh:
+        """The mesh, without its normals."""
+        return Mesh(self.vertices, self.triangles)
+
+    def close(self):
+        """Unmap the segment, releasing its memory."""
+        if self._segment is None:
+            return
+        del self.vertices, self.normals, self.triangles
+        self._segment.close()
+        self._segment = None
+
+    def __enter__(self) -> "SharedMesh":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
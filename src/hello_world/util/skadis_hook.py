@@ -1,6 +1,10 @@
 # Module for adding skadis mounting hooks to any face
-from typing import Union, cast
+from typing import Iterable, Union, cast
+import numpy as np
 import build123d as bd
+from hello_world.util.instance import instances, located
+from hello_world.util.pattern import LocationArray
+from hello_world.util.quality import is_draft
 
 
 class Hook(bd.BasePartObject):
@@ -18,49 +22,130 @@ class Hook(bd.BasePartObject):
     def __init__(
         self, board_thickness: float = 4.6, tolerance: float = 0.2, end_cap_len: float = 2.0, fillet_radius: float = 0.0
     ):
-        hook_sq_len = Hook.width()
         # Ensure we're in a valid build context.
         context: bd.BuildPart | None = bd.BuildPart._get_context(self)
         bd.validate_inputs(context, self)
 
-        # Calculate key dimensions.
-        protrusion = board_thickness + tolerance + hook_sq_len / 2
-        drop = 9 - end_cap_len
+        # The solid itself is shared between every hook with the same dimensions,
+        # this object only wraps it in a new location.
+        hook_part = located(hook_prototype(board_thickness, tolerance, end_cap_len, fillet_radius), bd.Location())
+        super().__init__(hook_part)
 
-        # Create the sweep path.
-        path = bd.Curve([bd.Line((0, 0), (0, protrusion)), bd.Line((0, protrusion), (drop, protrusion))])
-        # Create the hook profile. (Assumes bd.Rectangle creates a rectangle centered at the origin.)
-        profile = cast(bd.Sketch, bd.Plane.XZ * bd.Rectangle(hook_sq_len, hook_sq_len))
+    @classmethod
+    def width(cls) -> float:
+        return 4.8
 
-        # Sweep the profile along the path to form the main hook body.
-        hook_profile = bd.sweep(profile, path=path, transition=bd.Transition.ROUND)
 
-        # Create an end cap via a loft operation.
-        end_face = hook_profile.faces().sort_by(bd.Axis.X).last
-        end_plane = bd.Plane(end_face).offset(end_cap_len)
-        end_cap_sk = end_plane * bd.Pos(0, -hook_sq_len / 4, 0) * bd.Rectangle(hook_sq_len / 4, hook_sq_len / 4)
-        hook_part = hook_profile + bd.loft([bd.Sketch(end_cap_sk), end_face])
+# Hook solids keyed by (board_thickness, tolerance, end_cap_len, fillet_radius), and
+# their draft quality proxies by the same keys.
+_hook_prototypes: dict[tuple[float, float, float, float], bd.Part] = {}
+_hook_proxies: dict[tuple[float, float, float, float], bd.Part] = {}
 
-        # Rotate the hook into its final orientation.
-        # These rotations align the hook with the intended Skadis pegboard layout.
-        hook_part = hook_part.rotate(bd.Axis.X, 90).rotate(bd.Axis.Z, 180)
 
-        # Optionally apply a fillet if a positive radius is specified.
-        if fillet_radius > 0:
-            # This default edge selection is based on sorting edges by the Z axis and filtering by X-position.
-            selected_edges = hook_part.edges().sort_by(bd.Axis.Z)[1:].filter_by_position(bd.Axis.X, -100, -1)
-            hook_part = bd.fillet(selected_edges, fillet_radius)
+def hook_prototype(
+    board_thickness: float = 4.6, tolerance: float = 0.2, end_cap_len: float = 2.0, fillet_radius: float = 0.0
+) -> bd.Part:
+    """
+    Return the hook solid for the given dimensions, building it on first use.
 
-        # Re-center the hook so that the attachment point is at the origin.
-        attachment_offset = bd.Vector(0, 0, 0)
-        hook_part = hook_part.move(bd.Location(-attachment_offset))
+    The returned part is shared by every caller, so it must not be mutated. Place it
+    with ``hook_instances`` or ``instance.located``, which reference the same solid
+    instead of copying its geometry.
 
-        hook_part.label = "SkadisHook"
-        super().__init__(hook_part)
+    In draft quality (see util.quality) this is a block filling the space of the hook.
+    """
+    key = (float(board_thickness), float(tolerance), float(end_cap_len), float(fillet_radius))
+    prototypes, make = (_hook_proxies, _make_hook_proxy) if is_draft() else (_hook_prototypes, _make_hook)
+    hook_part = prototypes.get(key)
+    if hook_part is None:
+        hook_part = make(*key)
+        prototypes[key] = hook_part
+    return hook_part
 
-    @classmethod
-    def width(cls) -> float:
-        return 4.8
+
+def hook_instances(locations: Iterable[bd.Location] | LocationArray, hook: bd.Shape | None = None) -> bd.Compound:
+    """
+    Place a hook at each of the given locations.
+
+    Every hook in the returned compound references the same solid, so a plate with
+    many hooks costs a single hook build.
+
+    :param locations: The locations to place hooks at, such as a HookLocations.array.
+    :param hook: The hook to place. Defaults to the default sized hook prototype.
+    :return: A compound of located hook instances.
+    """
+    if hook is None:
+        hook = hook_prototype()
+    # The prototype is a part wrapping the hook solid, place the solid itself so the
+    # hooks are direct children of the compound, as they were when hooks were fused.
+    solids = hook.solids()
+    if len(solids) == 1:
+        hook = solids[0]
+    return instances(hook, locations)
+
+
+def _make_hook(board_thickness: float, tolerance: float, end_cap_len: float, fillet_radius: float) -> bd.Part:
+    hook_sq_len = Hook.width()
+
+    # Calculate key dimensions.
+    protrusion = board_thickness + tolerance + hook_sq_len / 2
+    drop = 9 - end_cap_len
+
+    # Create the sweep path.
+    path = bd.Curve([bd.Line((0, 0), (0, protrusion)), bd.Line((0, protrusion), (drop, protrusion))])
+    # Create the hook profile. (Assumes bd.Rectangle creates a rectangle centered at the origin.)
+    profile = cast(bd.Sketch, bd.Plane.XZ * bd.Rectangle(hook_sq_len, hook_sq_len))
+
+    # Sweep the profile along the path to form the main hook body.
+    hook_profile = bd.sweep(profile, path=path, transition=bd.Transition.ROUND)
+
+    # Create an end cap via a loft operation.
+    end_face = hook_profile.faces().sort_by(bd.Axis.X).last
+    end_plane = bd.Plane(end_face).offset(end_cap_len)
+    end_cap_sk = end_plane * bd.Pos(0, -hook_sq_len / 4, 0) * bd.Rectangle(hook_sq_len / 4, hook_sq_len / 4)
+    hook_part = hook_profile + bd.loft([bd.Sketch(end_cap_sk), end_face])
+
+    # Rotate the hook into its final orientation.
+    # These rotations align the hook with the intended Skadis pegboard layout.
+    hook_part = hook_part.rotate(bd.Axis.X, 90).rotate(bd.Axis.Z, 180)
+
+    # Optionally apply a fillet if a positive radius is specified.
+    if fillet_radius > 0:
+        # This default edge selection is based on sorting edges by the Z axis and filtering by X-position.
+        selected_edges = hook_part.edges().sort_by(bd.Axis.Z)[1:].filter_by_position(bd.Axis.X, -100, -1)
+        hook_part = bd.fillet(selected_edges, fillet_radius)
+
+    # Re-center the hook so that the attachment point is at the origin.
+    attachment_offset = bd.Vector(0, 0, 0)
+    hook_part = hook_part.move(bd.Location(-attachment_offset))
+
+    hook_part.label = "SkadisHook"
+    return hook_part
+
+
+def _make_hook_proxy(board_thickness: float, tolerance: float, end_cap_len: float, fillet_radius: float) -> bd.Part:
+    # The hook's path thickened by half the hook on each side, with the end cap's length
+    # added to the end, extruded to the hook's width and turned the same way as the hook.
+    hook_sq_len = Hook.width()
+    half = hook_sq_len / 2
+    protrusion = board_thickness + tolerance + half
+    # The drop of the hook plus its end cap.
+    reach = 9
+    outline = bd.Wire.make_polygon(
+        [
+            (-half, 0, 0),
+            (half, 0, 0),
+            (half, protrusion - half, 0),
+            (reach, protrusion - half, 0),
+            (reach, protrusion + half, 0),
+            (-half, protrusion + half, 0),
+        ],
+        close=True,
+    )
+    hook_part = bd.extrude(bd.Face(outline), amount=half, both=True)
+    hook_part = hook_part.rotate(bd.Axis.X, 90).rotate(bd.Axis.Z, 180)
+    hook_part.label = "SkadisHook"
+    return hook_part
 
 
 class HookLocations(bd.LocationList):
@@ -93,34 +178,74 @@ class HookLocations(bd.LocationList):
         self.align = bd.tuplify(align, 2)
         self.spacing = spacing
         self.offset = offset
+        self.positions = hook_positions(x_count, y_count, self.align, spacing, offset)
         # Determine the grid size. If there is more than one row, then we add
         # an offset to the X axis of _offset_.
         size = [self.spacing * (self.x_count - 1), self.spacing * (self.y_count - 1)]
         if self.y_count > 1:
             size[0] += self.offset
         self.size = bd.Vector(*size)
-        align_offset = []
-        for i in range(2):
-            if self.align[i] == bd.Align.MIN:
-                align_offset.append(0.0)
-            elif self.align[i] == bd.Align.CENTER:
-                align_offset.append(-size[i] / 2)
-            elif self.align[i] == bd.Align.MAX:
-                align_offset.append(-size[i])
-        self.min = bd.Vector(*align_offset)  # bottom left corner
+        self.min = bd.Vector(*_align_offset(size, self.align))  # bottom left corner
         self.max = self.min + self.size  # top right corner
 
         # Create local locations.
-        # We need to consider the align offset
-        local_locations = []
-        for i, j in bd.product(range(x_count), range(y_count)):
-            shift = 0
-            if j % 2 == 1:
-                shift = self.offset
-            local_locations.append(
-                bd.Location(bd.Vector(i * self.spacing + shift + align_offset[0], j * self.spacing + align_offset[1]))
-            )
+        local_locations = [bd.Location(tuple(position)) for position in self.positions]
 
         self.local_locations = bd.Locations._move_to_existing(local_locations)
         self.planes: list[bd.Plane] = []
         super().__init__(self.local_locations)
+
+    @classmethod
+    def array(
+        cls,
+        x_count: int,
+        y_count: int,
+        align: Union[bd.Align, tuple[bd.Align, bd.Align]] = (bd.Align.CENTER, bd.Align.CENTER),
+        spacing: int = 40,
+        offset: int = 20,
+    ) -> LocationArray:
+        """
+        The same hook placements as HookLocations, as a LocationArray.
+
+        Unlike HookLocations this doesn't create a bd.Location per hook up front, which
+        keeps large pegboard layouts with thousands of hooks cheap to generate.
+        """
+        return LocationArray(hook_positions(x_count, y_count, bd.tuplify(align, 2), spacing, offset))
+
+
+def _align_offset(size: list[float], align: tuple[bd.Align, bd.Align]) -> list[float]:
+    align_offset = []
+    for i in range(2):
+        if align[i] == bd.Align.MIN:
+            align_offset.append(0.0)
+        elif align[i] == bd.Align.CENTER:
+            align_offset.append(-size[i] / 2)
+        elif align[i] == bd.Align.MAX:
+            align_offset.append(-size[i])
+    return align_offset
+
+
+def hook_positions(
+    x_count: int, y_count: int, align: tuple[bd.Align, bd.Align], spacing: float = 40, offset: float = 20
+) -> np.ndarray:
+    """
+    Compute the hook positions of the Ikea Skadis pattern.
+
+    Odd rows are shifted along the X axis by offset.
+
+    :param x_count: The number of horizontal points.
+    :param y_count: The number of vertical points.
+    :param align: Align the min, center or max of the pattern with the origin.
+    :param spacing: The distance between points in a row, and between rows.
+    :param offset: The X shift applied to odd rows.
+    :return: An (x_count * y_count, 3) array of positions, ordered column by column.
+    """
+    size = [spacing * (x_count - 1), spacing * (y_count - 1)]
+    if y_count > 1:
+        size[0] += offset
+    align_offset = _align_offset(size, align)
+    i, j = np.meshgrid(np.arange(x_count), np.arange(y_count), indexing="ij")
+    positions = np.zeros((x_count * y_count, 3))
+    positions[:, 0] = i.ravel() * spacing + (j.ravel() % 2) * offset + align_offset[0]
+    positions[:, 1] = j.ravel() * spacing + align_offset[1]
+    return positions
@@ -0,0 +1,147 @@
+# Batched evaluation of positions and normals on faces.
+#
+# Face.position_at and Face.normal_at set up the surface evaluator, look up the
+# face's UV bounds and wrap the result in a Vector on every call, and placing a
+# feature at each point then builds a Plane and a Location. Evaluating a whole array
+# of parameters at once does that setup once and keeps the results in NumPy arrays,
+# so patterns of thousands of surface features stay cheap.
+import numpy as np
+import build123d as bd
+from OCP.BRep import BRep_Tool
+from OCP.BRepGProp import BRepGProp_Face
+from OCP.BRepTools import BRepTools
+from OCP.GeomAPI import GeomAPI_ProjectPointOnSurf
+from OCP.gp import gp_Pnt, gp_Trsf, gp_Vec
+from OCP.TopLoc import TopLoc_Location
+
+
+def face_frames(face: bd.Face, u: np.ndarray, v: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Evaluate positions and normals on a face, as Face.position_at and Face.normal_at would.
+
+    :param face: The face to evaluate.
+    :param u: The horizontal coordinates in the face's parameter space, between 0.0 and 1.0.
+    :param v: The vertical coordinates in the face's parameter space, between 0.0 and 1.0.
+    :return: (N, 3) arrays of positions and unit normals.
+    """
+    u_min, u_max, v_min, v_max = BRepTools.UVBounds_s(face.wrapped)
+    u = u_min + np.ravel(u) * (u_max - u_min)
+    v = v_min + np.ravel(v) * (v_max - v_min)
+    return _evaluate(face, u, v)
+
+
+def face_parameters(face: bd.Face, points: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Find the parameters of the points on a face closest to each of points.
+
+    :param face: The face to project onto.
+    :param points: An (N, 3) array of points.
+    :return: The u and v coordinates, between 0.0 and 1.0, as accepted by face_frames.
+    """
+    points = np.asarray(points, dtype=float).reshape(-1, 3)
+    u_min, u_max, v_min, v_max = BRepTools.UVBounds_s(face.wrapped)
+    surface = BRep_Tool.Surface_s(face.wrapped)
+    # Project onto the whole surface, not just the face's trimmed part, like Face.normal_at(point).
+    projector = GeomAPI_ProjectPointOnSurf()
+    projector.Init(surface, *surface.Bounds(), 1e-7)
+    uv = np.empty((len(points), 2))
+    for i, (x, y, z) in enumerate(points):
+        projector.Perform(gp_Pnt(x, y, z))
+        uv[i] = projector.LowerDistanceParameters()
+    return (uv[:, 0] - u_min) / (u_max - u_min), (uv[:, 1] - v_min) / (v_max - v_min)
+
+
+def face_normals_at(face: bd.Face, points: np.ndarray) -> np.ndarray:
+    """
+    Evaluate the normals of a face at points on or near it, as Face.normal_at(point) would.
+
+    :param face: The face to evaluate.
+    :param points: An (N, 3) array of points.
+    :return: An (N, 3) array of unit normals.
+    """
+    u, v = face_parameters(face, points)
+    return face_frames(face, u, v)[1]
+
+
+def edge_frames(
+    face: bd.Face,
+    edge: bd.Edge | bd.Wire,
+    distances: np.ndarray,
+    position_mode: bd.PositionMode = bd.PositionMode.PARAMETER,
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Evaluate positions along an edge lying on a face, along with the face's normals there.
+
+    :param face: The face the edge lies on.
+    :param edge: The edge or wire to evaluate.
+    :param distances: Positions along the edge, see Edge.positions.
+    :param position_mode: Whether distances are parameters or lengths along the edge.
+    :return: (N, 3) arrays of positions and unit normals.
+    """
+    positions = np.array([tuple(p) for p in edge.positions(list(np.ravel(distances)), position_mode)]).reshape(-1, 3)
+    return positions, face_normals_at(face, positions)
+
+
+def _evaluate(face: bd.Face, u: np.ndarray, v: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    # BRepGProp_Face accounts for the face's orientation, so the normals point out of the solid.
+    evaluator = BRepGProp_Face(face.wrapped)
+    point = gp_Pnt()
+    normal = gp_Vec()
+    positions = np.empty((len(u), 3))
+    normals = np.empty((len(u), 3))
+    for i in range(len(u)):
+        evaluator.Normal(float(u[i]), float(v[i]), point, normal)
+        positions[i] = point.X(), point.Y(), point.Z()
+        normals[i] = normal.X(), normal.Y(), normal.Z()
+    lengths = np.linalg.norm(normals, axis=1, keepdims=True)
+    return positions, np.divide(normals, lengths, out=np.zeros_like(normals), where=lengths > 0)
+
+
+def frame_x_dirs(normals: np.ndarray) -> np.ndarray:
+    """
+    Pick an X direction perpendicular to each normal, the same one bd.Plane(origin, z_dir=normal) does.
+
+    :param normals: An (N, 3) array of unit normals.
+    :return: An (N, 3) array of unit X directions.
+    """
+    a, b, c = np.asarray(normals, dtype=float).reshape(-1, 3).T
+    a_abs, b_abs, c_abs = np.abs(a), np.abs(b), np.abs(c)
+    zero = np.zeros_like(a)
+    # OCCT's gp_Ax2 zeroes the smallest coordinate of the normal and swaps the other two.
+    x_dirs = np.where(
+        ((b_abs <= a_abs) & (b_abs <= c_abs))[:, None],
+        np.where((a_abs > c_abs)[:, None], np.stack([-c, zero, a], 1), np.stack([c, zero, -a], 1)),
+        np.where(
+            ((a_abs <= b_abs) & (a_abs <= c_abs))[:, None],
+            np.where((b_abs > c_abs)[:, None], np.stack([zero, -c, b], 1), np.stack([zero, c, -b], 1)),
+            np.where((a_abs > b_abs)[:, None], np.stack([-b, a, zero], 1), np.stack([b, -a, zero], 1)),
+        ),
+    )
+    return x_dirs / np.linalg.norm(x_dirs, axis=1, keepdims=True)
+
+
+def frame_locations(positions: np.ndarray, normals: np.ndarray) -> list[bd.Location]:
+    """
+    Build a location at each position with its Z axis along the normal.
+
+    Equivalent to ``bd.Plane(position, z_dir=normal).location`` for each pair, without
+    building the planes.
+
+    :param positions: An (N, 3) array of origins.
+    :param normals: An (N, 3) array of unit Z directions.
+    :return: One location per position.
+    """
+    positions = np.asarray(positions, dtype=float).reshape(-1, 3)
+    z_dirs = np.asarray(normals, dtype=float).reshape(-1, 3)
+    x_dirs = frame_x_dirs(z_dirs)
+    y_dirs = np.cross(z_dirs, x_dirs)
+    locations = []
+    for origin, x, y, z in zip(positions.tolist(), x_dirs.tolist(), y_dirs.tolist(), z_dirs.tolist()):
+        trsf = gp_Trsf()
+        trsf.SetValues(
+            x[0], y[0], z[0], origin[0],
+            x[1], y[1], z[1], origin[1],
+            x[2], y[2], z[2], origin[2],
+        )  # fmt: skip
+        locations.append(bd.Location(TopLoc_Location(trsf)))
+    return locations
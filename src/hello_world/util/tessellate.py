@@ -0,0 +1,299 @@
+# Meshes of shapes at several levels of detail, cached in memory and on disk.
+#
+# Perforated parts such as rounded_bin or the cable grid have thousands of faces, and
+# meshing them at full quality every time they are shown or exported is slow. A mesh
+# is kept per shape and per level of detail, keyed by a hash of the shape's BREP and
+# the deflection it was meshed with. The most recently used meshes stay in memory and
+# every mesh is also written to disk, next to the BREP cache, so a later run or
+# another worker process reuses it.
+#
+# The levels use the deviation and angular tolerance of ocp_vscode's show, so a part
+# shown at a level has the same mesh density as the level's mesh here. The viewer
+# meshes parts itself, with ocp_tessellate and its own cache, so these meshes are used
+# by exports, layouts and sweeps rather than by watch mode.
+#
+# Environment variables:
+#     HELLO_WORLD_CACHE: set to 0 to keep meshes in memory only.
+#     HELLO_WORLD_MESH_CACHE_MB: the size limit of the in-memory meshes. Defaults to 256.
+import functools
+import hashlib
+import math
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+import numpy as np
+import build123d as bd
+from OCP.BRep import BRep_Tool
+from OCP.BRepMesh import BRepMesh_IncrementalMesh
+from OCP.IMeshTools import IMeshTools_Parameters
+from OCP.TopAbs import TopAbs_Orientation
+from OCP.TopLoc import TopLoc_Location
+from hello_world.util.cache import _evict, cache_dir, cache_max_bytes, shape_hash
+
+
+@dataclass(frozen=True)
+class Level:
+    """
+    A level of detail.
+
+    deviation (float): The mesh tolerance relative to the size of the shape, as ocp_vscode's deviation.
+    angular_tolerance (float): The maximum angle between neighbouring facets, in radians.
+    """
+
+    deviation: float
+    angular_tolerance: float
+
+    def deflection(self, shape: bd.Shape) -> float:
+        """The absolute mesh tolerance for shape, computed from its size the way ocp_vscode does."""
+        return _round_significant(_fingerprint(shape)[1] / 300 * self.deviation)
+
+
+# Fine is ocp_vscode's default quality.
+LEVELS = {
+    "coarse": Level(deviation=1.0, angular_tolerance=0.6),
+    "fine": Level(deviation=0.1, angular_tolerance=0.2),
+}
+
+
+def _round_significant(value: float, digits: int = 3) -> float:
+    # Keeps the deflection, and so the cache key, stable against tiny changes in the bounding box.
+    if value <= 0:
+        return value
+    return round(value, digits - 1 - math.floor(math.log10(value)))
+
+
+@dataclass
+class Mesh:
+    """
+    A triangle mesh.
+
+    vertices (np.ndarray): An (N, 3) float32 array of vertex positions.
+    triangles (np.ndarray): An (M, 3) uint32 array of vertex indices, counter-clockwise seen from outside.
+    """
+
+    vertices: np.ndarray
+    triangles: np.ndarray
+
+    @property
+    def nbytes(self) -> int:
+        return self.vertices.nbytes + self.triangles.nbytes
+
+    def normals(self) -> np.ndarray:
+        """An (N, 3) float32 array of unit vertex normals, the area weighted average of the adjoining triangles."""
+        corners = self.vertices[self.triangles].astype(np.float64)
+        # Not normalized, so each triangle counts in proportion to its area.
+        weighted = np.cross(corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0])
+        indices = self.triangles.ravel()
+        normals = np.stack(
+            [np.bincount(indices, np.repeat(weighted[:, axis], 3), len(self.vertices)) for axis in range(3)], axis=1
+        )
+        lengths = np.linalg.norm(normals, axis=1, keepdims=True)
+        return np.divide(normals, lengths, out=np.zeros_like(normals), where=lengths > 0).astype(np.float32)
+
+    def welded(self, tolerance: float = 1e-4) -> "Mesh":
+        """A copy with the vertices repeated along face edges merged, as 3MF and slicers expect."""
+        keys = np.round(self.vertices / tolerance).astype(np.int64)
+        _, first, inverse = np.unique(keys, axis=0, return_index=True, return_inverse=True)
+        triangles = inverse.reshape(-1)[self.triangles]
+        collapsed = (triangles[:, 0] == triangles[:, 1]) | (triangles[:, 1] == triangles[:, 2]) | (triangles[:, 2] == triangles[:, 0])
+        return Mesh(self.vertices[first], triangles[~collapsed].astype(np.uint32))
+
+    def save(self, path: str | Path):
+        """Write the mesh as an uncompressed .npz file."""
+        with open(path, "wb") as f:
+            np.savez(f, vertices=self.vertices, triangles=self.triangles)
+
+    @classmethod
+    def load(cls, path: str | Path) -> "Mesh":
+        """Read a mesh written by save."""
+        with np.load(path) as data:
+            return cls(data["vertices"], data["triangles"])
+
+
+def triangulate(shape: bd.Shape, deflection: float, angular_tolerance: float) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Mesh a shape in full precision, without any caching.
+
+    :param shape: The shape to mesh.
+    :param deflection: The maximum distance between the mesh and the surface.
+    :param angular_tolerance: The maximum angle between neighbouring facets, in radians.
+    :return: An (N, 3) float64 array of vertices and an (M, 3) int64 array of triangles.
+             Vertices on edges are repeated for each face they bound.
+    """
+    parameters = IMeshTools_Parameters()
+    parameters.Deflection = deflection
+    parameters.Angle = angular_tolerance
+    parameters.InParallel = True
+    # A finer mesh left on the shape by an earlier call would otherwise be kept for a coarse level.
+    parameters.AllowQualityDecrease = True
+    BRepMesh_IncrementalMesh(shape.wrapped, parameters)
+    vertices = []
+    triangles = []
+    offset = 0
+    for face in shape.faces():
+        location = TopLoc_Location()
+        poly = BRep_Tool.Triangulation_s(face.wrapped, location)
+        if poly is None:
+            continue
+        nodes = np.array([poly.Node(i).Coord() for i in range(1, poly.NbNodes() + 1)])
+        if not location.IsIdentity():
+            trsf = location.Transformation()
+            matrix = np.array([[trsf.Value(r, c) for c in range(1, 5)] for r in range(1, 4)])
+            nodes = nodes @ matrix[:, :3].T + matrix[:, 3]
+        faces = np.array([poly.Triangle(i).Get() for i in range(1, poly.NbTriangles() + 1)]) - 1 + offset
+        if face.wrapped.Orientation() == TopAbs_Orientation.TopAbs_REVERSED:
+            faces = faces[:, ::-1]
+        vertices.append(nodes)
+        triangles.append(faces)
+        offset += len(nodes)
+    if not vertices:
+        return np.empty((0, 3)), np.empty((0, 3), np.int64)
+    return np.concatenate(vertices), np.concatenate(triangles).astype(np.int64)
+
+
+def mesh_shape(shape: bd.Shape, deflection: float, angular_tolerance: float) -> Mesh:
+    """
+    Mesh a shape, without any caching.
+
+    :param shape: The shape to mesh.
+    :param deflection: The maximum distance between the mesh and the surface.
+    :param angular_tolerance: The maximum angle between neighbouring facets, in radians.
+    :return: The mesh of every face of the shape. Vertices on edges are repeated for each face.
+    """
+    vertices, triangles = triangulate(shape, deflection, angular_tolerance)
+    return Mesh(vertices.astype(np.float32), triangles.astype(np.uint32))
+
+
+def write_stl(mesh: Mesh, path: str | Path) -> Path:
+    """
+    Write a mesh as binary STL.
+
+    :param mesh: The mesh to write.
+    :param path: The file to write.
+    :return: The path written.
+    """
+    corners = mesh.vertices[mesh.triangles].astype(np.float32)
+    normals = np.cross(corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0])
+    lengths = np.linalg.norm(normals, axis=1, keepdims=True)
+    normals = np.divide(normals, lengths, out=np.zeros_like(normals), where=lengths > 0)
+    records = np.zeros(len(corners), dtype=[("normal", "<f4", 3), ("corners", "<f4", (3, 3)), ("attributes", "<u2")])
+    records["normal"] = normals
+    records["corners"] = corners
+    path = Path(path)
+    with open(path, "wb") as f:
+        f.write(b"hello_world".ljust(80, b"\0"))
+        f.write(np.uint32(len(records)).tobytes())
+        f.write(records.tobytes())
+    return path
+
+
+class MeshCache:
+    """
+    Meshes kept in memory, least recently used first out, and optionally on disk.
+
+    Safe to share between threads.
+
+    :param max_bytes: The size limit of the meshes kept in memory.
+    :param directory: Where to store meshes on disk, or None to keep them in memory only.
+    """
+
+    def __init__(self, max_bytes: int = 256 * 1024 * 1024, directory: str | Path | None = None):
+        self.max_bytes = max_bytes
+        self.directory = Path(directory) if directory is not None else None
+        self._meshes: OrderedDict[str, Mesh] = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Mesh | None:
+        with self._lock:
+            if key in self._meshes:
+                self._meshes.move_to_end(key)
+                return self._meshes[key]
+        if self.directory is None:
+            return None
+        path = self.directory / f"{key}.npz"
+        try:
+            mesh = Mesh.load(path)
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError):
+            # A corrupt entry, mesh it again.
+            path.unlink(missing_ok=True)
+            return None
+        self._remember(key, mesh)
+        return mesh
+
+    def put(self, key: str, mesh: Mesh):
+        self._remember(key, mesh)
+        if self.directory is None:
+            return
+        self.directory.mkdir(parents=True, exist_ok=True)
+        # Write to a temporary file first so that readers never see a partial entry.
+        with tempfile.NamedTemporaryFile(dir=self.directory, suffix=".tmp", delete=False) as f:
+            np.savez(f, vertices=mesh.vertices, triangles=mesh.triangles)
+        os.replace(f.name, self.directory / f"{key}.npz")
+        _evict(self.directory, cache_max_bytes(), "*.npz")
+
+    def _remember(self, key: str, mesh: Mesh):
+        with self._lock:
+            if key in self._meshes:
+                self._bytes -= self._meshes.pop(key).nbytes
+            self._meshes[key] = mesh
+            self._bytes += mesh.nbytes
+            while self._bytes > self.max_bytes and len(self._meshes) > 1:
+                self._bytes -= self._meshes.popitem(last=False)[1].nbytes
+
+    def clear(self):
+        """Forget the meshes in memory, the ones on disk are kept."""
+        with self._lock:
+            self._meshes.clear()
+            self._bytes = 0
+
+
+@functools.cache
+def default_cache() -> MeshCache:
+    """The mesh cache shared by the whole process."""
+    max_bytes = int(float(os.environ.get("HELLO_WORLD_MESH_CACHE_MB", 256)) * 1024 * 1024)
+    # Not cache_enabled(), which can be turned off just for the call that happens to come first.
+    use_disk = os.environ.get("HELLO_WORLD_CACHE", "1") != "0"
+    return MeshCache(max_bytes, cache_dir() / "meshes" if use_disk else None)
+
+
+def _fingerprint(shape: bd.Shape) -> tuple[str, float]:
+    # The hash of the shape's BREP and the sum of its bounding box sides. Meshing sets
+    # flags on the shape which are written to its BREP, and the quick bounding box
+    # follows the mesh, so both are taken once, before the shape is meshed, and kept on
+    # the shape for as long as it isn't moved.
+    remembered = getattr(shape, "_mesh_fingerprint", None)
+    if remembered is not None and remembered[0].IsEqual(shape.wrapped):
+        return remembered[1]
+    size = shape.bounding_box(optimal=False).size
+    fingerprint = (shape_hash(shape.wrapped), size.X + size.Y + size.Z)
+    shape._mesh_fingerprint = (shape.wrapped.Located(shape.wrapped.Location()), fingerprint)
+    return fingerprint
+
+
+def tessellate(shape: bd.Shape, level: str | Level = "fine", cache: MeshCache | None = None) -> Mesh:
+    """
+    Mesh a shape at a level of detail, reusing an earlier mesh of the same shape if there is one.
+
+    :param shape: The shape to mesh.
+    :param level: "coarse", "fine" or a Level.
+    :param cache: Where to look for and store the mesh. Defaults to default_cache().
+    :return: The mesh.
+    """
+    if isinstance(level, str):
+        level = LEVELS[level]
+    cache = cache if cache is not None else default_cache()
+    deflection = level.deflection(shape)
+    digest = hashlib.sha256(f"{_fingerprint(shape)[0]}/{deflection!r}/{level.angular_tolerance!r}".encode())
+    key = digest.hexdigest()
+    mesh = cache.get(key)
+    if mesh is None:
+        mesh = mesh_shape(shape, deflection, level.angular_tolerance)
+        cache.put(key, mesh)
+    return mesh
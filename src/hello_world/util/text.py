@@ -0,0 +1,173 @@
+# Text built from cached glyphs.
+#
+# bd.Text loads the font, outlines every character of the string and then moves each
+# glyph onto its path, every time it is called. Here each font is loaded once per
+# size and style, each character is outlined once, and extruded once per height, and
+# a string is laid out from the font's advances and placed as located instances of
+# those glyphs. Embossing a name on a batch of bowls then costs one placement per
+# letter rather than a font render per bowl.
+#
+# Glyphs follow a path the same way bd.Text places them: each glyph's center is put
+# on the path at the distance it has along the line of text, turned to the path.
+#
+#     letters = emboss("Ham", 40, bd.Circle(60).wire(), 10)
+import functools
+from dataclasses import dataclass, field
+import build123d as bd
+from OCP.Font import Font_FontAspect, Font_StrictLevel
+from OCP.NCollection import NCollection_String
+from OCP.StdPrs import StdPrs_BRepFont
+from OCP.TopAbs import TopAbs_ShapeEnum
+from hello_world.util.instance import located
+
+_ASPECTS = {
+    "REGULAR": Font_FontAspect.Font_FA_Regular,
+    "BOLD": Font_FontAspect.Font_FA_Bold,
+    "ITALIC": Font_FontAspect.Font_FA_Italic,
+    "BOLDITALIC": Font_FontAspect.Font_FA_BoldItalic,
+}
+
+
+@dataclass
+class GlyphFont:
+    """
+    A font at one size, with the outline and extrusions of every character used so far.
+
+    Use glyph_font rather than creating these, so each font is loaded once.
+
+    font (str): The font name, a close match is used if it isn't installed, as bd.Text does.
+    font_size (float): The size of the font in model units.
+    font_style (bd.FontStyle): Regular, bold or italic.
+    """
+
+    font: str
+    font_size: float
+    font_style: bd.FontStyle = bd.FontStyle.REGULAR
+    _glyphs: dict[str, bd.Face | bd.Sketch | None] = field(default_factory=dict, repr=False)
+    _solids: dict[tuple[str, float], bd.Solid | None] = field(default_factory=dict, repr=False)
+
+    def __post_init__(self):
+        self._font = StdPrs_BRepFont(
+            NCollection_String(self.font),
+            _ASPECTS[self.font_style.name],
+            float(self.font_size),
+            Font_StrictLevel.Font_StrictLevel_Any,
+        )
+
+    def glyph(self, char: str) -> bd.Face | bd.Sketch | None:
+        """The outline of char on the baseline at the origin, or None for blanks. Shared, don't mutate it."""
+        if char not in self._glyphs:
+            shape = self._font.RenderGlyph(char)
+            if shape.IsNull():
+                self._glyphs[char] = None
+            elif shape.ShapeType() == TopAbs_ShapeEnum.TopAbs_FACE:
+                self._glyphs[char] = bd.Face(shape)
+            else:
+                # Letters such as i are several faces.
+                self._glyphs[char] = bd.Sketch(shape)
+        return self._glyphs[char]
+
+    def solid(self, char: str, amount: float) -> bd.Part | None:
+        """The outline of char extruded up by amount, or None for blanks. Shared, don't mutate it."""
+        key = (char, float(amount))
+        if key not in self._solids:
+            glyph = self.glyph(char)
+            self._solids[key] = None if glyph is None else bd.extrude(glyph, amount)
+        return self._solids[key]
+
+    @property
+    def middle(self) -> float:
+        """The height above the baseline of the middle of a line, halfway from the descender to the ascender."""
+        return (self._font.Ascender() + self._font.Descender()) / 2
+
+    def layout(self, text: str) -> tuple[list[float], float]:
+        """
+        Lay text out on one line, with kerning.
+
+        :return: The x position of each character's origin, and the width of the line.
+        """
+        positions = []
+        x = 0.0
+        for char, following in zip(text, text[1:] + " "):
+            positions.append(x)
+            x += self._font.AdvanceX(char, following)
+        return positions, x
+
+
+@functools.cache
+def glyph_font(font: str, font_size: float, font_style: bd.FontStyle = bd.FontStyle.REGULAR) -> GlyphFont:
+    """The GlyphFont for a font, size and style, shared by the whole process."""
+    return GlyphFont(font, float(font_size), font_style)
+
+
+def _placements(
+    text: str, font: GlyphFont, path: bd.Wire | bd.Edge, position: float, glyphs: list[bd.Shape | None]
+) -> list[bd.Shape]:
+    # Center the line on the origin, across its advance and between the font's ascender
+    # and descender as OCCT's text builder does, then put each glyph's center on the
+    # path, turned to follow it.
+    positions, width = font.layout(text)
+    middle = font.middle
+    placed = []
+    for glyph, x in zip(glyphs, positions):
+        if glyph is None:
+            continue
+        box = glyph.bounding_box()
+        x -= width / 2
+        center = x + (box.min.X + box.max.X) / 2
+        u = position + center / path.length
+        angle = bd.Vector(1, 0, 0).get_signed_angle(path.tangent_at(u))
+        location = bd.Pos(*path.position_at(u)) * bd.Rot(Z=-angle) * bd.Pos(x - center, -middle, 0)
+        placed.append(located(glyph, location))
+    return placed
+
+
+def text_on_path(
+    text: str,
+    font_size: float,
+    path: bd.Wire | bd.Edge,
+    font: str = "Arial",
+    font_style: bd.FontStyle = bd.FontStyle.REGULAR,
+    position: float = 0.0,
+) -> bd.Sketch:
+    """
+    Text following a path in the XY plane, from cached glyph outlines.
+
+    :param text: The text.
+    :param font_size: The size of the font in model units.
+    :param path: The path for the middle of the line of text to follow.
+    :param font: The font name.
+    :param font_style: Regular, bold or italic.
+    :param position: Where on the path, as a fraction of its length, the middle of the text goes.
+    :return: The located glyph outlines.
+    """
+    glyphs = glyph_font(font, font_size, font_style)
+    return bd.Sketch(_placements(text, glyphs, path, position, [glyphs.glyph(char) for char in text]))
+
+
+def emboss(
+    text: str,
+    font_size: float,
+    path: bd.Wire | bd.Edge,
+    amount: float,
+    font: str = "Arial",
+    font_style: bd.FontStyle = bd.FontStyle.REGULAR,
+    position: float = 0.0,
+) -> bd.Part:
+    """
+    Raised letters following a path in the XY plane, from cached glyph extrusions.
+
+    The same as extruding text_on_path, but each letter is extruded only once per font
+    and height, and repeated letters share their solid.
+
+    :param text: The text.
+    :param font_size: The size of the font in model units.
+    :param path: The path for the middle of the line of text to follow.
+    :param amount: How far the letters stand up from the path.
+    :param font: The font name.
+    :param font_style: Regular, bold or italic.
+    :param position: Where on the path, as a fraction of its length, the middle of the text goes.
+    :return: The located letter solids, ready to fuse in one operation.
+    """
+    glyphs = glyph_font(font, font_size, font_style)
+    return bd.Part(_placements(text, glyphs, path, position, [glyphs.solid(char, amount) for char in text]))
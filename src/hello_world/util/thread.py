@@ -0,0 +1,175 @@
+# ISO threads built from cached pieces.
+#
+# bd_warehouse sweeps and lofts the thread profile along a helix for every IsoThread,
+# which makes threads the slowest feature we generate. A thread is the same after any
+# whole number of turns though, so a long one is assembled here from three pieces:
+#
+#   bottom  the first two pitches, with the bottom end finish and cut square on top
+#   middle  one pitch cut square on both ends, placed once per remaining whole pitch
+#   top     the last two pitches plus the remainder of the length, cut square below
+#           and with the top end finish
+#
+# Every piece is an IsoThread itself, cached in memory and on disk (see util.cache),
+# and the middle pitches are located instances of the same solid. Threads of any
+# length with the same diameter and pitch then share their pieces, and only the top
+# piece depends on the length, through the remainder of length / pitch.
+#
+# A faded bottom end starts IsoThread's turns a pitch higher and changes how its top
+# end is finished: a square top is left uncut, a chamfered one also trims the fade.
+# Pieces cut square can't reproduce that, so threads with a faded bottom are built in
+# one piece, still cached. check_stacking compares the two ways of building a thread.
+#
+# In draft quality (see util.quality) a thread is a plain tube between its root and
+# crest radii instead.
+#
+#     bolt = iso_thread(24, 2, 30)
+#     nut = iso_thread(24 * 1.05, 2, 6, external=False, end_finishes=("square", "square"))
+import itertools
+from math import radians, tan
+from typing import Literal, get_args
+import build123d as bd
+from hello_world.util.boolean import batched_cut
+from hello_world.util.cache import brep_cache
+from hello_world.util.instance import located
+from hello_world.util.quality import Quality, build_quality, is_draft
+
+Finish = Literal["raw", "square", "fade", "chamfer"]
+
+# Thread pieces keyed by (major_diameter, pitch, length, external, end_finishes, hand).
+_pieces: dict[tuple, bd.Part] = {}
+
+# Threads shorter than this many pitches are built in one piece.
+_MIN_STACKED_PITCHES = 5
+
+
+def iso_minor_radius(major_diameter: float, pitch: float) -> float:
+    """The root radius of an external ISO thread, IsoThread.min_radius, without building the thread."""
+    h_parameter = (pitch / 2) / tan(radians(30))
+    return (major_diameter - 2 * (5 / 8) * h_parameter) / 2
+
+
+@brep_cache
+def _build_piece(
+    major_diameter: float, pitch: float, length: float, external: bool, end_finishes: tuple[str, str], hand: str
+) -> bd.Part:
+    from bd_warehouse.thread import IsoThread
+
+    thread = IsoThread(
+        major_diameter=major_diameter,
+        pitch=pitch,
+        length=length,
+        external=external,
+        hand=hand,
+        end_finishes=end_finishes,
+    )
+    return bd.Part(thread.wrapped)
+
+
+def thread_piece(
+    major_diameter: float,
+    pitch: float,
+    length: float,
+    external: bool = True,
+    end_finishes: tuple[Finish, Finish] = ("fade", "square"),
+    hand: Literal["right", "left"] = "right",
+) -> bd.Part:
+    """
+    Return the IsoThread for the given dimensions, building it on first use.
+
+    The returned part is shared by every caller, so it must not be mutated. Place it
+    with ``instance.located``.
+    """
+    key = (float(major_diameter), float(pitch), round(float(length), 9), bool(external), tuple(end_finishes), hand)
+    piece = _pieces.get(key)
+    if piece is None:
+        piece = _build_piece(*key)
+        _pieces[key] = piece
+    return piece
+
+
+def iso_thread(
+    major_diameter: float,
+    pitch: float,
+    length: float,
+    external: bool = True,
+    end_finishes: tuple[Finish, Finish] = ("fade", "square"),
+    hand: Literal["right", "left"] = "right",
+) -> bd.Compound:
+    """
+    An ISO thread, the same as bd_warehouse's IsoThread but assembled from cached pieces.
+
+    :param major_diameter: The major diameter of the thread.
+    :param pitch: The distance between turns.
+    :param length: The length of the thread, along Z from the origin.
+    :param external: An external thread as on a bolt, or an internal one as in a nut.
+    :param end_finishes: The finish of the bottom and top ends, one of "raw", "square", "fade" or "chamfer".
+        A faded bottom is built in one piece, see the note at the top of this module.
+    :param hand: The direction the thread turns.
+    :return: The thread pieces, as touching solids.
+    """
+    if is_draft():
+        tube = bd.Circle(major_diameter / 2) - bd.Circle(iso_minor_radius(major_diameter, pitch))
+        return bd.Compound([bd.extrude(tube, amount=length)])
+    whole_pitches = int(length // pitch)
+    if whole_pitches < _MIN_STACKED_PITCHES or end_finishes[0] == "fade":
+        return located(thread_piece(major_diameter, pitch, length, external, end_finishes, hand), bd.Location())
+    remainder = length - whole_pitches * pitch
+    bottom = thread_piece(major_diameter, pitch, 2 * pitch, external, (end_finishes[0], "square"), hand)
+    middle = thread_piece(major_diameter, pitch, pitch, external, ("square", "square"), hand)
+    top = thread_piece(major_diameter, pitch, 2 * pitch + remainder, external, ("square", end_finishes[1]), hand)
+    # Every piece starts its helix at the same angle, and the pieces are placed whole
+    # pitches apart, so the turns run on from one piece into the next.
+    pieces = [located(bottom, bd.Location())]
+    pieces += [located(middle, bd.Pos(Z=i * pitch)) for i in range(2, whole_pitches - 2)]
+    pieces.append(located(top, bd.Pos(Z=(whole_pitches - 2) * pitch)))
+    return bd.Compound(pieces)
+
+
+def check_stacking(
+    major_diameter: float,
+    pitch: float,
+    length: float,
+    external: bool = True,
+    end_finishes: tuple[Finish, Finish] = ("fade", "square"),
+    hand: Literal["right", "left"] = "right",
+    fuzzy_value: float = 1e-4,
+) -> tuple[float, float]:
+    """
+    Compare iso_thread with the same IsoThread built whole.
+
+    The booleans are slow, a minute or so for a 15mm M5 thread, so this is meant for
+    checking changes to the stacking rather than for use while building.
+
+    :param fuzzy_value: The tolerance of the booleans. Without one OCCT leaves most of
+        the coincident thread surfaces behind.
+    :return: The largest distance between the corners of their bounding boxes, and
+        the volume of their symmetric difference.
+    """
+    from bd_warehouse.thread import IsoThread
+
+    whole = bd.Part(
+        IsoThread(
+            major_diameter=major_diameter,
+            pitch=pitch,
+            length=length,
+            external=external,
+            hand=hand,
+            end_finishes=end_finishes,
+        ).wrapped
+    )
+    with build_quality(Quality.FULL):
+        stacked = iso_thread(major_diameter, pitch, length, external, end_finishes, hand)
+    whole_box, stacked_box = whole.bounding_box(), stacked.bounding_box()
+    bounds = max((whole_box.min - stacked_box.min).length, (whole_box.max - stacked_box.max).length)
+    difference = sum(
+        batched_cut(a, b.solids(), fuzzy_value).shape.volume for a, b in ((whole, stacked), (stacked, whole))
+    )
+    return bounds, difference
+
+
+if __name__ == "__main__":
+    # Check every combination of end finishes, e.g. python -m hello_world.util.thread
+    for finishes in itertools.product(get_args(Finish), repeat=2):
+        bounds, difference = check_stacking(5, 2, 15, end_finishes=finishes)
+        status = "ok" if bounds < 1e-3 and difference < 1e-3 else "DIFFERS"
+        print(f"{status:7} {finishes}: bounds differ by {bounds:.4f}, volumes by {difference:.4f}", flush=True)
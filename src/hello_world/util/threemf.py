@@ -0,0 +1,117 @@
+# A minimal 3MF writer that keeps repeated objects as instances.
+#
+# build123d's Mesher writes every shape as its own mesh, so a plate of ten identical
+# bins stores the bin ten times. Here each mesh is written once as an object, and
+# the build lists one item per copy, each referencing the object with a transform.
+# Slicers read the items as separate parts.
+import io
+import zipfile
+from pathlib import Path
+from xml.sax.saxutils import quoteattr
+import numpy as np
+import build123d as bd
+from hello_world.util.tessellate import Mesh
+
+_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8"?>\n'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="model" ContentType="application/vnd.ms-package.3dmanufacturing-3dmodel+xml"/>'
+    "</Types>"
+)
+_RELATIONSHIPS = (
+    '<?xml version="1.0" encoding="UTF-8"?>\n'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Target="/3D/3dmodel.model" Id="rel0" '
+    'Type="http://schemas.microsoft.com/3dmanufacturing/2013/01/3dmodel"/>'
+    "</Relationships>"
+)
+
+
+def location_matrix(location: bd.Location) -> np.ndarray:
+    """The 4x4 matrix of a location."""
+    trsf = location.wrapped.Transformation()
+    matrix = np.eye(4)
+    matrix[:3] = [[trsf.Value(r, c) for c in range(1, 5)] for r in range(1, 4)]
+    return matrix
+
+
+def _transform(matrix: np.ndarray) -> str:
+    # 3MF multiplies row vectors, so its matrix is the transpose of ours, without the last column.
+    return " ".join(f"{v:.9g}" for v in matrix[:3].T.ravel())
+
+
+class Model3MF:
+    """
+    A 3MF model being assembled from meshes and placements of them.
+
+    Object ids are assigned in the order objects are added.
+    """
+
+    def __init__(self):
+        self._objects: list[str] = []
+        self._items: list[str] = []
+
+    def add_mesh(self, mesh: Mesh, name: str = "") -> int:
+        """
+        Add a mesh as an object, without placing it.
+
+        Objects must be added before the objects made of them.
+
+        :param mesh: The mesh. Vertices repeated along face edges should be merged, see Mesh.welded.
+        :param name: The name slicers show for the object.
+        :return: The object id.
+        """
+        object_id = len(self._objects) + 1
+        vertices = io.StringIO()
+        np.savetxt(vertices, mesh.vertices, fmt='<vertex x="%.6g" y="%.6g" z="%.6g"/>', newline="")
+        triangles = io.StringIO()
+        np.savetxt(triangles, mesh.triangles, fmt='<triangle v1="%d" v2="%d" v3="%d"/>', newline="")
+        self._objects.append(
+            f'<object id="{object_id}" type="model" name={quoteattr(name)}><mesh>'
+            f"<vertices>{vertices.getvalue()}</vertices><triangles>{triangles.getvalue()}</triangles>"
+            "</mesh></object>"
+        )
+        return object_id
+
+    def add_components(self, components: list[tuple[int, np.ndarray | None]], name: str = "") -> int:
+        """
+        Add an object made of other objects, which slicers treat as the parts of one object.
+
+        :param components: The id of each object used, from add_mesh, and its 4x4 transform or None.
+        :param name: The name slicers show for the object.
+        :return: The object id.
+        """
+        object_id = len(self._objects) + 1
+        parts = "".join(
+            f'<component objectid="{component}"'
+            + (f' transform="{_transform(matrix)}"' if matrix is not None else "")
+            + "/>"
+            for component, matrix in components
+        )
+        self._objects.append(f'<object id="{object_id}" type="model" name={quoteattr(name)}><components>{parts}</components></object>')
+        return object_id
+
+    def add_item(self, object_id: int, matrix: np.ndarray | None = None):
+        """
+        Place an object on the build plate.
+
+        :param object_id: An id returned by add_mesh.
+        :param matrix: The 4x4 transform of this copy, see location_matrix. Defaults to the identity.
+        """
+        transform = f' transform="{_transform(matrix)}"' if matrix is not None else ""
+        self._items.append(f'<item objectid="{object_id}"{transform}/>')
+
+    def write(self, path: str | Path) -> Path:
+        """Write the model to path."""
+        path = Path(path)
+        model = (
+            '<?xml version="1.0" encoding="UTF-8"?>\n'
+            '<model unit="millimeter" xml:lang="en-US" xmlns="http://schemas.microsoft.com/3dmanufacturing/core/2015/02">'
+            f"<resources>{''.join(self._objects)}</resources><build>{''.join(self._items)}</build></model>"
+        )
+        with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as archive:
+            archive.writestr("[Content_Types].xml", _CONTENT_TYPES)
+            archive.writestr("_rels/.rels", _RELATIONSHIPS)
+            archive.writestr("3D/3dmodel.model", model)
+        return path
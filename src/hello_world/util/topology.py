@@ -0,0 +1,201 @@
+# Cached, array backed selectors for the faces, edges and vertices of a shape.
+#
+# ShapeList.sort_by recomputes the center of every face or edge and sorts the whole
+# list on every call, and generators often ask the same shape for several sorted
+# views. TopologyIndex measures each sub-shape once, keeps the measurements in NumPy
+# arrays and caches every ordering it is asked for. The index for a shape is kept on
+# the shape and rebuilt when the shape is moved or replaced, so it only pays off when
+# the same shape is queried more than once, e.g. selected from and then filleted with
+# a FilletPlan. A shape sorted once should use ShapeList.sort_by. within and nearest
+# search a k-d tree of the centers, built on first use.
+from typing import Callable, Literal
+import numpy as np
+import build123d as bd
+from scipy.spatial import cKDTree
+from hello_world.util.surface import face_frames
+
+Kind = Literal["face", "edge", "vertex"]
+SortKey = bd.Axis | bd.SortBy | Callable[[bd.Shape], float]
+
+
+class TopologyIndex:
+    """
+    Measurements of the faces, edges and vertices of a shape, computed on first use.
+
+    Orderings follow ShapeList.sort_by exactly, ties keep their original order.
+
+    :param shape: The shape to index.
+    """
+
+    def __init__(self, shape: bd.Shape):
+        self.shape = shape
+        # Shape.move relocates the OCCT shape in place, so keep our own reference to compare against.
+        self.wrapped = shape.wrapped.Located(shape.wrapped.Location()) if shape.wrapped is not None else None
+        self._shapes: dict[Kind, bd.ShapeList] = {}
+        self._arrays: dict[tuple, np.ndarray] = {}
+        self._orders: dict[tuple, np.ndarray] = {}
+        self._trees: dict[Kind, cKDTree] = {}
+
+    def is_current(self, shape: bd.Shape) -> bool:
+        """Whether the index still describes shape, the same geometry at the same location."""
+        return shape.wrapped is not None and self.wrapped is not None and self.wrapped.IsEqual(shape.wrapped)
+
+    def shapes(self, kind: Kind) -> bd.ShapeList:
+        """The faces, edges or vertices of the shape, in the order the shape lists them."""
+        if kind not in self._shapes:
+            explore = {"face": self.shape.faces, "edge": self.shape.edges, "vertex": self.shape.vertices}[kind]
+            self._shapes[kind] = explore()
+        return self._shapes[kind]
+
+    def _array(self, name: str, kind: Kind, compute: Callable[[], np.ndarray]) -> np.ndarray:
+        if (name, kind) not in self._arrays:
+            self._arrays[(name, kind)] = compute()
+        return self._arrays[(name, kind)]
+
+    def centers(self, kind: Kind) -> np.ndarray:
+        """An (N, 3) array of the centers of the faces or edges, or the vertex positions."""
+        return self._array(
+            "center", kind, lambda: np.array([tuple(s.center()) for s in self.shapes(kind)]).reshape(-1, 3)
+        )
+
+    def tree(self, kind: Kind) -> cKDTree:
+        """A k-d tree of centers(kind), its indices are indices into shapes(kind)."""
+        if kind not in self._trees:
+            self._trees[kind] = cKDTree(self.centers(kind))
+        return self._trees[kind]
+
+    def normals(self) -> np.ndarray:
+        """An (N, 3) array of face normals, taken at the center of each face's parameter space like Face.normal_at()."""
+        faces = self.shapes("face")
+        return self._array("normal", "face", lambda: np.array([face_frames(f, [0.5], [0.5])[1][0] for f in faces]).reshape(-1, 3))
+
+    def areas(self) -> np.ndarray:
+        """The area of each face."""
+        return self._array("area", "face", lambda: np.array([f.area for f in self.shapes("face")], dtype=float))
+
+    def lengths(self) -> np.ndarray:
+        """The length of each edge."""
+        return self._array("length", "edge", lambda: np.array([e.length for e in self.shapes("edge")], dtype=float))
+
+    def keys(self, kind: Kind, key: SortKey) -> np.ndarray:
+        """
+        The value ShapeList.sort_by(key) would sort each sub-shape by.
+
+        :param kind: "face", "edge" or "vertex".
+        :param key: An axis, SortBy.LENGTH or SortBy.AREA, or a function of the sub-shape.
+        """
+        if isinstance(key, bd.Axis):
+            cache_key = ("axis", kind, tuple(key.position), tuple(key.direction))
+            if cache_key not in self._arrays:
+                self._arrays[cache_key] = self._axis_keys(kind, key)
+            return self._arrays[cache_key]
+        if key == bd.SortBy.LENGTH:
+            return self.lengths()
+        if key == bd.SortBy.AREA:
+            return self.areas()
+        if callable(key):
+            return np.array([key(s) for s in self.shapes(kind)], dtype=float)
+        raise ValueError(f"Can't sort by {key}")
+
+    def _axis_keys(self, kind: Kind, axis: bd.Axis) -> np.ndarray:
+        direction = np.array(tuple(axis.direction))
+        if not any(axis.position) and np.count_nonzero(direction) == 1:
+            # Along X, Y or Z through the origin the key is just a coordinate, exactly as sort_by computes it.
+            return self.centers(kind) @ direction
+        # Otherwise compute it the way sort_by does, a dot product can round near ties the other way.
+        inverse = axis.location.inverse()
+        return np.array([(inverse * bd.Location(tuple(c))).position.Z for c in self.centers(kind)])
+
+    def order(self, kind: Kind, *keys: SortKey, reverse: bool = False) -> np.ndarray:
+        """
+        The indices of the sub-shapes, sorted by the first key, then the second, and so on.
+
+        :param kind: "face", "edge" or "vertex".
+        :param keys: What to sort by, see keys.
+        :param reverse: Sort in descending order.
+        :return: An array of indices into shapes(kind).
+        """
+        # Functions may not be pure, so their orderings aren't cached.
+        cacheable = not any(callable(k) for k in keys)
+        cache_key = (kind, tuple(repr(k) for k in keys), reverse)
+        if cacheable and cache_key in self._orders:
+            return self._orders[cache_key]
+        values = [self.keys(kind, k) for k in keys]
+        if reverse:
+            values = [-v for v in values]
+        # lexsort is stable and sorts by its last key first.
+        order = np.lexsort(values[::-1]) if values else np.arange(len(self.shapes(kind)))
+        if cacheable:
+            self._orders[cache_key] = order
+        return order
+
+    def sort_by(self, kind: Kind, *keys: SortKey, reverse: bool = False) -> bd.ShapeList:
+        """
+        Sort the sub-shapes, like shape.faces().sort_by(key) but cached.
+
+        Several keys sort by the first key, breaking ties with the next, the same as
+        sorting by the last key first and then each earlier key in turn.
+
+        :param kind: "face", "edge" or "vertex".
+        :param keys: What to sort by, see keys.
+        :param reverse: Sort in descending order.
+        :return: The sorted sub-shapes.
+        """
+        shapes = self.shapes(kind)
+        return bd.ShapeList(shapes[i] for i in self.order(kind, *keys, reverse=reverse))
+
+    def within(self, kind: Kind, minimum: bd.VectorLike, maximum: bd.VectorLike) -> bd.ShapeList:
+        """
+        Find the sub-shapes whose centers lie within a box.
+
+        :param kind: "face", "edge" or "vertex".
+        :param minimum: The minimum corner of the box.
+        :param maximum: The maximum corner of the box.
+        :return: The sub-shapes inside the box, in their original order.
+        """
+        lo = np.array(tuple(bd.Vector(minimum)))
+        hi = np.array(tuple(bd.Vector(maximum)))
+        if np.any(lo > hi):
+            return bd.ShapeList()
+        # The tree finds the centers within the cube around the box, then the box itself is tested.
+        middle = (lo + hi) / 2
+        radius = np.max(hi - lo) / 2
+        candidates = np.array(self.tree(kind).query_ball_point(middle, radius * (1 + 1e-9) + 1e-12, p=np.inf), dtype=int)
+        centers = self.centers(kind)[candidates]
+        inside = np.sort(candidates[np.all((centers >= lo) & (centers <= hi), axis=1)])
+        shapes = self.shapes(kind)
+        return bd.ShapeList(shapes[i] for i in inside)
+
+    def nearest(self, kind: Kind, point: bd.VectorLike, count: int = 1) -> bd.ShapeList:
+        """
+        Find the sub-shapes whose centers are closest to a point.
+
+        :param kind: "face", "edge" or "vertex".
+        :param point: The point to search from.
+        :param count: The number of sub-shapes to return.
+        :return: The closest sub-shapes, nearest first.
+        """
+        count = min(count, len(self.centers(kind)))
+        if count < 1:
+            return bd.ShapeList()
+        distances, closest = self.tree(kind).query(np.array(tuple(bd.Vector(point))), k=list(range(1, count + 1)))
+        # Equally close sub-shapes come in their original order.
+        shapes = self.shapes(kind)
+        return bd.ShapeList(shapes[i] for i in closest[np.lexsort((closest, distances))])
+
+
+def topology(shape: bd.Shape) -> TopologyIndex:
+    """
+    Get the topology index of a shape, building it on first use.
+
+    The index is stored on the shape, and rebuilt if the shape has been moved or
+    otherwise given a different underlying OCCT shape since.
+
+    :param shape: The shape to index.
+    :return: The index.
+    """
+    index = getattr(shape, "_topology_index", None)
+    if index is None or not index.is_current(shape):
+        index = TopologyIndex(shape)
+        shape._topology_index = index
+    return index
@@ -0,0 +1,313 @@
+# Watch mode: rebuild parts as their source changes and push them to the viewer.
+#
+# The modules of this package are polled for changes. A changed module is reloaded
+# along with every module depending on it, and only the parts whose generator hash
+# (see util.cache.cache_key) changed are rebuilt; generators using brep_cache load
+# any result built before from disk. Of the rebuilt parts, only the objects whose
+# geometry actually changed are pushed to the ocp_vscode viewer, from a background
+# thread so that tessellating them doesn't hold up the watcher. ocp_vscode can only
+# redraw every object it has been given, so the unchanged ones are sent again too,
+# but its tessellation cache means only the changed ones are meshed again. Changes
+# made while the viewer is busy are queued and sent together once it is free.
+#
+# Large parts are shown coarse first, and shown again at ocp_vscode's default quality
+# once nothing newer is waiting to be shown. ocp_vscode tessellates the objects itself
+# with its own cache, so watch mode only sets its deviation and angular tolerance and
+# doesn't use the meshes of util.tessellate.
+#
+# Example:
+#     hello-world-watch mosquito_coil_holder
+#     hello-world-watch --manifest catalog.toml --port 3939
+#     hello-world-watch --draft skadis_shelf
+import argparse
+import graphlib
+import hashlib
+import importlib
+import os
+import sys
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from types import ModuleType
+from typing import Any
+
+PACKAGE = "hello_world"
+
+# Updates with more faces than this are shown coarse first and refined once the viewer is idle.
+REFINE_FACES = 1000
+# The deviation and angular tolerance of the coarse show, ten times ocp_vscode's default deviation.
+COARSE_DEVIATION = 1.0
+COARSE_ANGULAR_TOLERANCE = 0.6
+
+
+def package_modules() -> dict[str, ModuleType]:
+    """The loaded modules of this package which can be reloaded."""
+    return {
+        name: module
+        for name, module in list(sys.modules.items())
+        if name.startswith(PACKAGE + ".") and name != __name__ and getattr(module, "__file__", None)
+    }
+
+
+def module_dependencies(module: ModuleType) -> set[str]:
+    """The modules of this package that module refers to at its top level."""
+    dependencies = set()
+    for value in vars(module).values():
+        name = value.__name__ if isinstance(value, ModuleType) else getattr(value, "__module__", None)
+        if isinstance(name, str) and name.startswith(PACKAGE + ".") and name != module.__name__:
+            dependencies.add(name)
+    return dependencies
+
+
+def reload_modules(changed: set[str]) -> list[str]:
+    """
+    Reload the changed modules and every module depending on them, dependencies first.
+
+    :param changed: The names of the modules whose source changed.
+    :return: The names of the reloaded modules, in the order they were reloaded.
+    """
+    modules = package_modules()
+    graph = {name: module_dependencies(module) & modules.keys() for name, module in modules.items()}
+    stale = set(changed) & modules.keys()
+    # Anything importing a stale module holds on to its old functions, so it is stale too.
+    grew = True
+    while grew:
+        dependents = {name for name, deps in graph.items() if deps & stale} - stale
+        stale |= dependents
+        grew = bool(dependents)
+    order = [name for name in graphlib.TopologicalSorter(graph).static_order() if name in stale]
+    for name in order:
+        importlib.reload(modules[name])
+    return order
+
+
+def named_objects(name: str, result: Any) -> dict[str, Any]:
+    """
+    Split a generator result into the objects to show, e.g. mosquito_coil_holder/lid.
+
+    Shapes in a top level list are shown separately, named by their label or position.
+    Nested lists are shown as one compound.
+    """
+    import build123d as bd
+    from hello_world.util.export import as_shape
+
+    if not isinstance(result, (list, tuple)):
+        return {name: as_shape(result)}
+    objects = {}
+    for i, item in enumerate(result):
+        label = item.label if isinstance(item, bd.Shape) and item.label else str(i)
+        objects[f"{name}/{label}"] = as_shape(item)
+    return objects
+
+
+def geometry_hash(shape) -> str:
+    """
+    Fingerprint a shape's geometry, so that rebuilt but identical objects aren't sent again.
+
+    The BREP of a rebuilt shape can list its sub-shapes in a different order, so the
+    fingerprint is made of its sorted vertices, counts, area and volume, rounded.
+    """
+    import numpy as np
+
+    vertices = np.round(np.array([tuple(v) for v in shape.vertices()]).reshape(-1, 3), 6) + 0.0
+    vertices = vertices[np.lexsort(vertices.T[::-1])]
+    counts = (len(shape.solids()), len(shape.faces()), len(shape.edges()))
+    digest = hashlib.sha256(vertices.tobytes())
+    digest.update(repr((counts, round(shape.area, 6), round(shape.volume, 6))).encode())
+    return digest.hexdigest()
+
+
+class Watcher:
+    """
+    Keeps a set of parts built and shown in the viewer as the package source changes.
+
+    :param entries: The parts to build, see catalog.CatalogEntry.
+    :param port: The port of the ocp_vscode viewer, or None to only build.
+    """
+
+    def __init__(self, entries: list, port: int | None = 3939):
+        self.entries = entries
+        self.port = port
+        self.keys: dict[str, str] = {}
+        self.hashes: dict[str, str] = {}
+        self.mtimes: dict[str, float] = {}
+        self.started = time.time()
+        self._viewer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="viewer")
+        # Objects waiting to be sent to the viewer, guarded by _lock.
+        self._lock = threading.Lock()
+        self._changed: dict[str, Any] = {}
+        self._removed: set[str] = set()
+        self._pushing = False
+        self._cleared = False
+
+    def changed_modules(self) -> set[str]:
+        """The modules whose source file changed since the last call."""
+        changed = set()
+        for name, module in package_modules().items():
+            try:
+                mtime = Path(module.__file__).stat().st_mtime
+            except OSError:
+                continue
+            # Modules first imported by a build are compared with when watching started.
+            if self.mtimes.get(name, self.started) < mtime:
+                changed.add(name)
+            self.mtimes[name] = mtime
+        return changed
+
+    def update(self) -> list[str]:
+        """
+        Rebuild the parts whose generators changed and send the objects which differ to the viewer.
+
+        :return: The names of the objects sent to the viewer.
+        """
+        from hello_world.generators import get_generator
+        from hello_world.util.cache import cache_key
+
+        changed = {}
+        removed = []
+        for entry in self.entries:
+            generator = get_generator(entry.generator)
+            try:
+                key = cache_key(generator, (), entry.params)
+            except TypeError:
+                # Uncacheable parameters, or ones the generator doesn't take and the build reports.
+                key = None
+            if key is not None and self.keys.get(entry.name) == key:
+                continue
+            start = time.perf_counter()
+            try:
+                result = generator(**entry.params)
+            except Exception:
+                print(f"FAILED  {entry.name}\n{traceback.format_exc()}")
+                continue
+            print(f"built   {entry.name} in {time.perf_counter() - start:.2f}s")
+            self.keys[entry.name] = key
+            objects = named_objects(entry.name, result)
+            prefix = entry.name + "/"
+            for name in [n for n in self.hashes if (n == entry.name or n.startswith(prefix)) and n not in objects]:
+                del self.hashes[name]
+                removed.append(name)
+            for name, shape in objects.items():
+                digest = geometry_hash(shape)
+                if self.hashes.get(name) != digest:
+                    self.hashes[name] = digest
+                    changed[name] = shape
+        if (changed or removed) and self.port is not None:
+            self._send(changed, removed)
+        return list(changed)
+
+    def _send(self, changed: dict[str, Any], removed: list[str]):
+        """Queue objects for the viewer, without waiting for it to show earlier ones."""
+        with self._lock:
+            for name in removed:
+                self._changed.pop(name, None)
+                self._removed.add(name)
+            for name, shape in changed.items():
+                self._removed.discard(name)
+                self._changed[name] = shape
+            if not self._pushing:
+                self._pushing = True
+                self._viewer.submit(self._push)
+
+    def _take(self) -> tuple[dict[str, Any], set[str]]:
+        """The queued objects, emptying the queue. Once it is empty the next _send starts a new push."""
+        with self._lock:
+            changed, removed = self._changed, self._removed
+            self._changed, self._removed = {}, set()
+            self._pushing = bool(changed or removed)
+            return changed, removed
+
+    def _push(self):
+        # Runs on the viewer thread until nothing is queued. Shapes are only read here,
+        # the builds on the watcher thread always make new ones.
+        from ocp_vscode import push_object, remove_object, reset_show, set_port, show_objects
+
+        # Objects only shown at the coarse level so far.
+        unrefined: set[str] = set()
+        changed, removed = self._take()
+        while changed or removed:
+            try:
+                if not self._cleared:
+                    set_port(self.port)
+                    reset_show()
+                    self._cleared = True
+                for name in removed:
+                    remove_object(name)
+                for name, shape in changed.items():
+                    push_object(shape, name=name, update=True)
+                unrefined -= removed
+                coarse = sum(len(shape.faces()) for shape in changed.values()) > REFINE_FACES
+                # Every pushed object is sent, see the note at the top of this module.
+                if coarse:
+                    show_objects(deviation=COARSE_DEVIATION, angular_tolerance=COARSE_ANGULAR_TOLERANCE)
+                else:
+                    show_objects()
+                print(f"shown   {', '.join(changed) or 'removals'}")
+                # A fine show refines everything shown coarse before it too.
+                unrefined = unrefined | changed.keys() if coarse else set()
+            except Exception:
+                print(f"Couldn't update the viewer on port {self.port}\n{traceback.format_exc()}")
+            changed, removed = self._take()
+            if not (changed or removed) and unrefined:
+                # Nothing newer is waiting. A change sent while refining starts a new push,
+                # which runs after this one.
+                try:
+                    show_objects()
+                    print(f"refined {', '.join(sorted(unrefined))}")
+                except Exception:
+                    print(f"Couldn't update the viewer on port {self.port}\n{traceback.format_exc()}")
+
+    def run(self, interval: float = 0.5):
+        """Build everything, then rebuild on every source change until interrupted."""
+        self.changed_modules()
+        self.update()
+        try:
+            while True:
+                time.sleep(interval)
+                changed = self.changed_modules()
+                if not changed:
+                    continue
+                try:
+                    reloaded = reload_modules(changed)
+                except Exception:
+                    print(f"Couldn't reload {', '.join(sorted(changed))}\n{traceback.format_exc()}")
+                    continue
+                print(f"reloaded {', '.join(reloaded)}")
+                self.update()
+        finally:
+            self._viewer.shutdown(wait=True)
+
+
+def main(argv: list[str] | None = None) -> int:
+    from hello_world.catalog import CatalogEntry, load_manifest
+
+    parser = argparse.ArgumentParser(
+        prog="hello-world-watch", description="Rebuild parts as their source changes and show them in the viewer."
+    )
+    parser.add_argument("generators", nargs="*", help="generators to build with their default parameters")
+    parser.add_argument("-m", "--manifest", help="a catalog manifest of the parts to build, see catalog.py")
+    parser.add_argument("--port", type=int, default=3939, help="the ocp_vscode viewer port")
+    parser.add_argument("--no-viewer", action="store_true", help="only rebuild, don't send anything to the viewer")
+    parser.add_argument("--interval", type=float, default=0.5, help="seconds between checks for changes")
+    parser.add_argument("--draft", action="store_true", help="build in draft quality, see util/quality.py")
+    args = parser.parse_args(argv)
+    if args.draft:
+        # The environment, unlike util.quality.draft, outlives reloads of util.quality.
+        os.environ["HELLO_WORLD_QUALITY"] = "draft"
+
+    entries = [CatalogEntry(name, name) for name in args.generators]
+    if args.manifest:
+        entries += load_manifest(args.manifest)[1]
+    if not entries:
+        parser.error("give at least one generator or a manifest")
+    Watcher(entries, None if args.no_viewer else args.port).run(args.interval)
+    return 0
+
+
+if __name__ == "__main__":
+    try:
+        raise SystemExit(main())
+    except KeyboardInterrupt:
+        pass